@@ -1,17 +1,161 @@
+from pathlib import Path
+from typing import List, Optional, Tuple
+
 from absl import app, flags
 
 import palipedia.transform.sutta as sutta
+from palipedia.transform.database import SqliteExporter
+from palipedia.transform.duplicates import PassageDetector
+from palipedia.transform.flat import FlatExporter
+from palipedia.transform.normalize import PROFILES
+from palipedia.transform.search import build_index
+from palipedia.transform.stats import RunStats
 
 FLAGS = flags.FLAGS
 flags.DEFINE_string(
     "src", "pali/data/tipitaka/romn/tipitaka_toc.xml", "Path to source data xml."
 )
 flags.DEFINE_string("out", "tipitika", "Path to output directory.")
+flags.DEFINE_integer(
+    "workers", 1, "Number of workers used to transform chapters."
+)
+flags.DEFINE_enum(
+    "pool", "process", ["process", "thread"], "Kind of pool used by multiple workers."
+)
+flags.DEFINE_bool(
+    "incremental",
+    True,
+    "Only transform chapters that changed since the last run into the output "
+    "directory.",
+)
+flags.DEFINE_integer(
+    "cache_size", 64, "Number of parsed and transformed source trees kept in memory."
+)
+flags.DEFINE_bool(
+    "streaming",
+    False,
+    "Stream chapters through the transformation, keeping one section in memory.",
+)
+flags.DEFINE_integer(
+    "writers",
+    0,
+    "Number of background threads writing chapter files, 0 writes them directly.",
+)
+flags.DEFINE_string(
+    "archive",
+    None,
+    "Write all chapters into this archive file in the output directory.",
+)
+flags.DEFINE_bool(
+    "references",
+    False,
+    "Write an index of the numbered chapters, paragraphs and sections next to the toc.",
+)
+flags.DEFINE_list(
+    "scripts",
+    [],
+    "Other scripts to transform along with the one of --src, like deva,thai. Every "
+    "script is written to a subdirectory of --out, and exported to a subdirectory of "
+    "--export_text and --index and to a --sqlite database named after it.",
+)
+flags.DEFINE_bool(
+    "merkle",
+    False,
+    "Write a Merkle tree of the output and a feed of what changed since the last run.",
+)
+flags.DEFINE_enum(
+    "normalize",
+    None,
+    list(PROFILES),
+    "Normalize the text of every chapter with this profile, like canonical, which "
+    "composes diacritics, writes every niggahita as ṃ and collapses whitespace.",
+)
+flags.DEFINE_string(
+    "export_text",
+    None,
+    "Export the text of the output into this directory, as a flat training corpus.",
+)
+flags.DEFINE_bool(
+    "dedup",
+    False,
+    "Write exact repeats into the flat corpus of --export_text as references to "
+    "their first occurrence, along with a table of the clusters of near duplicates.",
+)
+flags.DEFINE_float(
+    "dedup_threshold",
+    0.8,
+    "Estimated Jaccard similarity of the word shingles of a repeated passage.",
+)
+flags.DEFINE_string(
+    "index",
+    None,
+    "Build a full-text search index of the output into this directory.",
+)
+flags.DEFINE_string(
+    "sqlite",
+    None,
+    "Export the hierarchy and the text of the output into this SQLite database.",
+)
+flags.DEFINE_string(
+    "report",
+    None,
+    "Write a JSON report with timings and counters of the run to this file.",
+)
+flags.DEFINE_integer(
+    "report_slowest", 10, "Number of slowest chapters listed in the report."
+)
+
+
+def _outputs() -> List[Tuple[Optional[str], Path]]:
+    """Returns the output directory of every script, with the name of the script, or
+    the output directory itself with None when there is a single script."""
+    if not FLAGS.scripts:
+        return [(None, Path(FLAGS.out))]
+    primary = Path(FLAGS.src).resolve().parent.name
+    return [(script, Path(FLAGS.out) / script) for script in [primary] + FLAGS.scripts]
+
+
+def _target(path: str, script: Optional[str], suffix: bool = False) -> Path:
+    """Returns the export target of a script, a subdirectory of path, or the name of
+    a file with the script before its suffix, like tipitika.deva.db."""
+    path = Path(path)
+    if script is None:
+        return path
+    if suffix:
+        return path.with_name(f"{path.stem}.{script}{path.suffix}")
+    return path / script
 
 
 def main(argv):
     del argv  # Unused.
-    sutta.TipitikaTransformer(FLAGS.src, FLAGS.out).transform()
+    stats = RunStats(FLAGS.report_slowest) if FLAGS.report else None
+    sutta.TipitikaTransformer(
+        FLAGS.src,
+        FLAGS.out,
+        FLAGS.workers,
+        FLAGS.incremental,
+        FLAGS.cache_size,
+        FLAGS.streaming,
+        FLAGS.pool,
+        stats,
+        FLAGS.writers,
+        FLAGS.archive,
+        FLAGS.references,
+        FLAGS.scripts,
+        FLAGS.merkle,
+        FLAGS.normalize,
+    ).transform()
+    # Every script is exported on its own, into targets named after the script.
+    for script, out in _outputs():
+        if FLAGS.export_text:
+            detector = PassageDetector(FLAGS.dedup_threshold) if FLAGS.dedup else None
+            FlatExporter(out).export(_target(FLAGS.export_text, script), detector)
+        if FLAGS.index:
+            build_index(out, _target(FLAGS.index, script))
+        if FLAGS.sqlite:
+            SqliteExporter(out).export(_target(FLAGS.sqlite, script, suffix=True))
+    if stats is not None:
+        stats.write(FLAGS.report)
 
 
 if __name__ == "__main__":
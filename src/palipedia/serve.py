@@ -0,0 +1,29 @@
+"""Serves the toc, chapters and numbered elements of a transformation over HTTP."""
+from absl import app, flags, logging
+
+from palipedia.transform.server import make_server
+
+FLAGS = flags.FLAGS
+flags.DEFINE_string(
+    "tipitika", "tipitika", "Path to the output directory of clean.py."
+)
+flags.DEFINE_string("host", "127.0.0.1", "Address to listen on.")
+flags.DEFINE_integer("port", 8000, "Port to listen on.")
+flags.DEFINE_integer("responses", 256, "Number of responses kept in memory.")
+
+
+def main(argv):
+    del argv  # Unused.
+    server = make_server(FLAGS.tipitika, FLAGS.host, FLAGS.port, FLAGS.responses)
+    logging.info("Serving %s on http://%s:%d/", FLAGS.tipitika, *server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.close()
+
+
+if __name__ == "__main__":
+    app.run(main)
@@ -0,0 +1,23 @@
+"""Splits the paragraphs and verses of a transformation into training shards."""
+from absl import app, flags
+
+from palipedia.transform.shards import FORMATS, export_shards
+
+FLAGS = flags.FLAGS
+flags.DEFINE_string(
+    "tipitika", "tipitika", "Path to the output directory of clean.py."
+)
+flags.DEFINE_string("shards", "shards", "Path to the directory receiving the shards.")
+flags.DEFINE_integer("num_shards", 16, "Number of shards.")
+flags.DEFINE_enum(
+    "format", "binary", list(FORMATS), "Format of the shards, JSON lines or binary."
+)
+
+
+def main(argv):
+    del argv  # Unused.
+    export_shards(FLAGS.tipitika, FLAGS.shards, FLAGS.num_shards, FLAGS.format)
+
+
+if __name__ == "__main__":
+    app.run(main)
@@ -0,0 +1,187 @@
+"""Generates a synthetic corpus that is shaped like the siongui Tipitaka data.
+
+The real corpus is a git submodule that is not always available, this corpus can be
+used for tests and benchmarks instead. The output is deterministic for a given seed and
+scale.
+"""
+import random
+from pathlib import Path
+from typing import List
+
+# Words with the diacritics that show up in the canon.
+WORDS = [
+    "evaṃ",
+    "me",
+    "sutaṃ",
+    "ekaṃ",
+    "samayaṃ",
+    "bhagavā",
+    "sāvatthiyaṃ",
+    "viharati",
+    "jetavane",
+    "anāthapiṇḍikassa",
+    "ārāme",
+    "tatra",
+    "kho",
+    "bhikkhū",
+    "āmantesi",
+    "ñāṇadassanaṃ",
+    "saṅgho",
+    "paṭipadā",
+    "ḍaṃsa",
+    "kusalaṃ",
+    "dhammaṃ",
+    "paññā",
+    "vedanā",
+    "rūpaṃ",
+    "nibbānaṃ",
+    "kāḷaṃ",
+]
+
+
+class CorpusGenerator:
+    """
+    Writes a table of contents with nested toc files and chapter files.
+
+    The layout mirrors the siongui data: tipitaka_toc.xml refers to toc files through
+    src attributes, and the toc files refer to chapter files through action attributes.
+    All paths are relative to the directory of tipitaka_toc.xml.
+
+    Attributes:
+        dest (Path): The directory the corpus is written to.
+        pitakas (int): The number of collections in the main toc.
+        nikayas (int): The number of toc files per collection.
+        books (int): The number of books per toc file.
+        chapters (int): The number of chapter files per book.
+        sections (int): The number of sections per chapter.
+        paragraphs (int): The number of paragraphs per subsection.
+    """
+
+    def __init__(
+        self,
+        dest: str,
+        pitakas: int = 3,
+        nikayas: int = 2,
+        books: int = 2,
+        chapters: int = 3,
+        sections: int = 3,
+        paragraphs: int = 4,
+        seed: int = 0,
+    ) -> None:
+        """
+        Initializes the generator.
+
+        Args:
+            dest (str): The directory the corpus is written to.
+            pitakas (int, optional): The number of collections in the main toc.
+                Defaults to 3.
+            nikayas (int, optional): The number of toc files per collection. Defaults
+                to 2.
+            books (int, optional): The number of books per toc file. Defaults to 2.
+            chapters (int, optional): The number of chapter files per book. Defaults to
+                3.
+            sections (int, optional): The number of sections per chapter. Defaults to 3.
+            paragraphs (int, optional): The number of paragraphs per subsection.
+                Defaults to 4.
+            seed (int, optional): Seeds the random text. Defaults to 0.
+        """
+        self.dest = Path(dest)
+        self.pitakas = pitakas
+        self.nikayas = nikayas
+        self.books = books
+        self.chapters = chapters
+        self.sections = sections
+        self.paragraphs = paragraphs
+        self._random = random.Random(seed)
+
+    def generate(self) -> Path:
+        """
+        Writes the corpus.
+
+        Returns:
+            Path: The main table of contents, tipitaka_toc.xml.
+        """
+        (self.dest / "toc").mkdir(parents=True, exist_ok=True)
+        (self.dest / "cscd").mkdir(parents=True, exist_ok=True)
+        toc = ["<tree>"]
+        for p in range(self.pitakas):
+            toc.append(f'<tree text="{self._title(p)}piṭaka">')
+            for n in range(self.nikayas):
+                src = f"toc/toc{p}_{n}.xml"
+                toc.append(f'<tree text="{self._title(n)}nikāya" src="{src}"/>')
+                self._write(src, self._nikaya(p, n))
+            toc.append("</tree>")
+        toc.append("</tree>")
+        return self._write("tipitaka_toc.xml", toc)
+
+    def _nikaya(self, p: int, n: int) -> List[str]:
+        lines = ["<tree>"]
+        for b in range(self.books):
+            lines.append(f'<tree text="{self._title(b)}pāḷi">')
+            for c in range(self.chapters):
+                action = f"cscd/s{p:02}{n:02}{b:02}{c:02}.mul.xml"
+                lines.append(
+                    f'<tree text="{c + 1}. {self._title(c)}suttaṃ" action="{action}"/>'
+                )
+                self._write(action, self._chapter(c))
+            lines.append("</tree>")
+        lines.append("</tree>")
+        return lines
+
+    def _chapter(self, c: int) -> List[str]:
+        lines = [
+            "<TEI.2>",
+            "<teiHeader></teiHeader>",
+            "<text><body>",
+            '<p rend="centre">Namo tassa bhagavato arahato sammāsambuddhassa</p>',
+            f'<p rend="nikaya">{self._title(c)}nikāyo</p>',
+            f'<p rend="book">{self._title(c)}pāḷi</p>',
+            f'<p rend="chapter">{c + 1}. {self._title(c)}suttaṃ</p>',
+        ]
+        nr = 0
+        for s in range(self.sections):
+            lines.append(f'<p rend="subhead">{s + 1}. {self._sentence(2)}</p>')
+            for u in range(2):
+                lines.append(f'<p rend="subsubhead">{self._sentence(2)}</p>')
+                for _ in range(self.paragraphs):
+                    nr += 1
+                    lines.append(self._paragraph(nr))
+                nr += 1
+                lines.append(f'<p rend="hangnum" n="{nr}">{nr}</p>')
+                lines.extend(self._verses())
+                lines.append(
+                    f'<p rend="indent">{self._sentence(6)}'
+                    f" <note>{self._sentence(2)}</note></p>"
+                )
+        lines.append("</body></text></TEI.2>")
+        return lines
+
+    def _paragraph(self, nr: int) -> str:
+        rend = self._random.choice(["bodytext", "bodytext", "bodytext", "unindented"])
+        return (
+            f'<p rend="{rend}" n="{nr}"><hi rend="paranum">{nr}</hi>'
+            f'<hi rend="dot">.</hi> {self._sentence(12)} '
+            f'<pb ed="M" n="{nr // 4}.{nr}"/> <hi rend="bold">{self._sentence(2)}</hi>'
+            f" {self._sentence(12)} </p>"
+        )
+
+    def _verses(self) -> List[str]:
+        count = self._random.randint(1, 4)
+        lines = [f'<p rend="gatha1">{self._sentence(4)},</p>']
+        for _ in range(count - 1):
+            lines.append(f'<p rend="gatha2">{self._sentence(4)};</p>')
+        lines.append(f'<p rend="gathalast">{self._sentence(4)}.</p>')
+        return lines
+
+    def _sentence(self, words: int) -> str:
+        return " ".join(self._random.choice(WORDS) for _ in range(words))
+
+    def _title(self, i: int) -> str:
+        return WORDS[(i * 7) % len(WORDS)].capitalize()
+
+    def _write(self, name: str, lines: List[str]) -> Path:
+        fname = self.dest / name
+        with open(fname, "w", encoding="utf-8") as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            f.write("\n".join(lines))
+        return fname
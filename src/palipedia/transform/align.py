@@ -0,0 +1,300 @@
+"""Aligns the paragraphs and verses of two transformations of the canon.
+
+The transformations can be different scripts or editions, whose chapters have the same
+names, as written by a TipitikaTransformer with several scripts. Every corpus is read in
+a single pass over its chapters, after which the units, the paragraphs and verses, of
+chapters with the same name are aligned:
+
+- Every unit with an nr starts a group that holds it and the units without an nr that
+  follow it. Groups with the same nr are aligned, the second group with an nr to the
+  second group with that nr, and so are the units before the first nr of a chapter.
+- Groups of the same size are aligned unit by unit.
+- Otherwise the units are aligned by their share of the words of the group, which
+  handles verses that were merged by _merge_verses in one version but not in the other:
+  a unit is aligned to the units of the other version whose middle lies within it, or
+  to the unit that holds its own middle.
+
+The alignment table is a set of NumPy arrays, memory mapped when it is opened. Mapping
+a unit, or a chapter and nr, to the other corpus is a few array lookups.
+"""
+import json
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from palipedia.transform.flat import ChapterSource, parse_nr, unit_text, units
+
+META = "alignment.json"
+SIDES = ("source", "target")
+
+
+class _Scan:
+    """The units of a corpus, read in a single pass."""
+
+    def __init__(self, dest_dir: str) -> None:
+        info = array("i")
+        words = array("i")
+        bounds = array("i", [0])
+        with ChapterSource(dest_dir) as source:
+            self.chapters = source.names()
+            for name in self.chapters:
+                for node in units(source.parse(name)):
+                    info.append(len(bounds) - 1)
+                    info.extend(parse_nr(node.get("nr")))
+                    words.append(max(1, len(unit_text(node).split())))
+                bounds.append(len(words))
+        self.units = np.frombuffer(info, dtype=np.int32).reshape(-1, 3)
+        self.words = np.frombuffer(words, dtype=np.int32)
+        self.bounds = np.frombuffer(bounds, dtype=np.int32)
+
+    def groups(self, chapter: int) -> Dict[Tuple[int, int], Tuple[int, int]]:
+        """
+        Returns the first and the end unit of the groups of a chapter, by their nr and
+        the number of earlier groups with the same nr. The units before the first nr are
+        the group -1.
+        """
+        start, end = int(self.bounds[chapter]), int(self.bounds[chapter + 1])
+        groups = {}
+        seen = Counter()
+        key, first = (-1, 0), start
+        for u in range(start, end):
+            nr = int(self.units[u, 1])
+            if nr >= 0:
+                if u > first:
+                    groups[key] = (first, u)
+                key, first = (nr, seen[nr]), u
+                seen[nr] += 1
+        if end > first:
+            groups[key] = (first, end)
+        return groups
+
+    def save(self, out: Path, side: str) -> None:
+        """Writes the units and a dense table from chapter and nr to unit."""
+        firsts = np.zeros(len(self.chapters), dtype=np.int32)
+        offsets = np.zeros(len(self.chapters) + 1, dtype=np.int64)
+        tables = []
+        for c in range(len(self.chapters)):
+            rows = self.units[self.bounds[c] : self.bounds[c + 1]]
+            numbered = np.flatnonzero(rows[:, 1] >= 0)
+            table = np.empty(0, dtype=np.int32)
+            if len(numbered):
+                first = int(rows[numbered, 1].min())
+                table = np.full(int(rows[numbered, 2].max()) - first + 1, -1, np.int32)
+                # Walk backwards, so the first unit with a number wins.
+                for i in numbered[::-1]:
+                    table[rows[i, 1] - first : rows[i, 2] - first + 1] = (
+                        self.bounds[c] + i
+                    )
+                firsts[c] = first
+            tables.append(table)
+            offsets[c + 1] = offsets[c] + len(table)
+        np.save(out / f"{side}.units.npy", self.units)
+        np.save(out / f"{side}.bounds.npy", self.bounds)
+        np.save(out / f"{side}.nr_first.npy", firsts)
+        np.save(out / f"{side}.nr_offsets.npy", offsets)
+        np.save(
+            out / f"{side}.nr_units.npy",
+            np.concatenate(tables) if tables else np.empty(0, dtype=np.int32),
+        )
+
+
+def _align_group(
+    words: np.ndarray, other_words: np.ndarray, start: int, other_start: int
+) -> np.ndarray:
+    """Returns the first and last unit of the other group aligned to every unit."""
+    n, m = len(words), len(other_words)
+    if n == m:
+        aligned = np.arange(other_start, other_start + m, dtype=np.int32)
+        return np.stack([aligned, aligned], axis=1)
+    edges = np.concatenate([[0.0], np.cumsum(words) / words.sum()])
+    other_edges = np.concatenate([[0.0], np.cumsum(other_words) / other_words.sum()])
+    other_middles = (other_edges[:-1] + other_edges[1:]) / 2
+    owners = np.searchsorted(edges, other_middles, side="right") - 1
+    middles = (edges[:-1] + edges[1:]) / 2
+    holders = np.searchsorted(other_edges, middles, side="right") - 1
+    result = np.empty((n, 2), dtype=np.int32)
+    for i in range(n):
+        found = np.flatnonzero(owners == i)
+        if len(found):
+            result[i] = found[0], found[-1]
+        else:
+            result[i] = holders[i], holders[i]
+    return result + other_start
+
+
+def _align(scan: _Scan, other: _Scan) -> np.ndarray:
+    """Returns the first and last unit of other aligned to every unit of scan."""
+    result = np.full((len(scan.units), 2), -1, dtype=np.int32)
+    chapters = {name: c for c, name in enumerate(other.chapters)}
+    for c, name in enumerate(scan.chapters):
+        if name not in chapters:
+            continue
+        other_groups = other.groups(chapters[name])
+        for key, (start, end) in scan.groups(c).items():
+            if key not in other_groups:
+                continue
+            other_start, other_end = other_groups[key]
+            result[start:end] = _align_group(
+                scan.words[start:end],
+                other.words[other_start:other_end],
+                start,
+                other_start,
+            )
+    return result
+
+
+def build_alignment(source_dir: str, target_dir: str, out_dir: str) -> int:
+    """
+    Aligns two transformations and writes the alignment table.
+
+    Args:
+        source_dir (str): The output directory of a TipitikaTransformer.
+        target_dir (str): The output directory of another TipitikaTransformer.
+        out_dir (str): The directory that receives the table.
+
+    Returns:
+        int: The number of units of the source that are aligned.
+    """
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    source, target = _Scan(source_dir), _Scan(target_dir)
+    forward = _align(source, target)
+    np.save(out / "source.align.npy", forward)
+    np.save(out / "target.align.npy", _align(target, source))
+    for scan, side in zip((source, target), SIDES):
+        scan.save(out, side)
+    with open(out / META, "w", encoding="utf-8") as f:
+        json.dump(
+            {"source": source.chapters, "target": target.chapters},
+            f,
+            ensure_ascii=False,
+        )
+    return int((forward[:, 0] >= 0).sum())
+
+
+class AlignedCorpus:
+    """
+    The units of one side of an alignment table.
+
+    Attributes:
+        chapters (List[str]): The chapters, as referenced by the toc.
+        units (np.ndarray): The chapter and the first and last number of the nr of every
+            unit, -1, -1 for units without a number.
+        align (np.ndarray): The first and last unit of the other side aligned to every
+            unit, -1, -1 for units that are not aligned.
+    """
+
+    def __init__(self, path: Path, side: str, chapters: List[str]) -> None:
+        self.chapters = chapters
+        self._ids = {name: c for c, name in enumerate(chapters)}
+        self.units = np.load(path / f"{side}.units.npy", mmap_mode="r")
+        self.align = np.load(path / f"{side}.align.npy", mmap_mode="r")
+        self._bounds = np.load(path / f"{side}.bounds.npy", mmap_mode="r")
+        self._first = np.load(path / f"{side}.nr_first.npy", mmap_mode="r")
+        self._offsets = np.load(path / f"{side}.nr_offsets.npy", mmap_mode="r")
+        self._table = np.load(path / f"{side}.nr_units.npy", mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self.units)
+
+    def unit(self, chapter: str, nr: int, offset: int = 0) -> int:
+        """
+        Returns the first unit of a chapter with a number, or a unit that follows it.
+
+        Args:
+            chapter (str): The chapter, as referenced by the toc.
+            nr (int): The number of a paragraph or verse.
+            offset (int, optional): The position of the unit after the numbered one,
+                for the verses that follow a numbered paragraph. Defaults to 0.
+
+        Returns:
+            int: The unit.
+
+        Raises:
+            KeyError: If the chapter has no such unit.
+        """
+        c = self._ids[chapter]
+        i = nr - int(self._first[c])
+        start, end = int(self._offsets[c]), int(self._offsets[c + 1])
+        if not 0 <= i < end - start or self._table[start + i] < 0:
+            raise KeyError(f"{chapter} has no unit {nr}.")
+        unit = int(self._table[start + i]) + offset
+        if not self._bounds[c] <= unit < self._bounds[c + 1]:
+            raise KeyError(f"{chapter} has no unit {offset} after {nr}.")
+        return unit
+
+    def locate(self, unit: int) -> Tuple[str, Tuple[int, int]]:
+        """Returns the chapter and the first and last number of the nr of a unit."""
+        chapter, start, end = self.units[unit].tolist()
+        return self.chapters[chapter], (start, end)
+
+
+class Alignment:
+    """
+    An alignment table written by build_alignment.
+
+    Attributes:
+        source (AlignedCorpus): The units of the source.
+        target (AlignedCorpus): The units of the target.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Opens an alignment table.
+
+        Args:
+            path (str): The directory written by build_alignment.
+        """
+        path = Path(path)
+        with open(path / META, encoding="utf-8") as f:
+            chapters = json.load(f)
+        self.source = AlignedCorpus(path, "source", chapters["source"])
+        self.target = AlignedCorpus(path, "target", chapters["target"])
+
+    def map(self, unit: int, reverse: bool = False) -> range:
+        """
+        Returns the units of the other side aligned to a unit.
+
+        Args:
+            unit (int): A unit of the source, or of the target when reverse is True.
+            reverse (bool, optional): Map from the target to the source. Defaults to
+                False.
+
+        Returns:
+            range: The aligned units, empty if the unit is not aligned.
+        """
+        side = self.target if reverse else self.source
+        first, last = side.align[unit].tolist()
+        return range(first, last + 1) if first >= 0 else range(0)
+
+    def lookup(
+        self, chapter: str, nr: int, offset: int = 0, reverse: bool = False
+    ) -> List[Tuple[str, Tuple[int, int], int]]:
+        """
+        Returns the units of the other side aligned to a numbered unit, see
+        AlignedCorpus.unit.
+
+        Args:
+            chapter (str): The chapter, as referenced by the toc.
+            nr (int): The number of a paragraph or verse.
+            offset (int, optional): The position of the unit after the numbered one.
+                Defaults to 0.
+            reverse (bool, optional): Look up a unit of the target. Defaults to False.
+
+        Returns:
+            List[Tuple[str, Tuple[int, int], int]]: The chapter, the numbers of the nr
+            and the unit of every aligned unit.
+
+        Raises:
+            KeyError: If the chapter has no such unit.
+        """
+        side, other = self.source, self.target
+        if reverse:
+            side, other = other, side
+        return [
+            (*other.locate(u), u)
+            for u in self.map(side.unit(chapter, nr, offset), reverse)
+        ]
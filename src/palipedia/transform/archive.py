@@ -0,0 +1,237 @@
+"""A single file archive of chapters, as an alternative to writing a file per chapter.
+
+The archive starts with a header: a magic number, the length of the index and the
+index itself, a JSON object that maps the name of every chapter to the offset and length
+of its data. The offsets are relative to the end of the header. Every chapter is
+compressed on its own, so a single chapter is read with one positioned read and
+decompressed without looking at the rest of the archive.
+"""
+import contextlib
+import json
+import os
+import struct
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional
+
+from lxml import etree
+
+import palipedia.transform.xml as xml
+
+MAGIC = b"PALIARC\x01"
+_LENGTH = struct.Struct("<Q")
+
+
+class ArchiveWriter:
+    """
+    Writes chapters into an archive.
+
+    The index has to be at the front, but is only known once every chapter is added,
+    so the compressed chapters are collected in a temporary file and copied behind the
+    index when the archive is closed. The archive replaces fname atomically on close.
+    Chapters can be added from multiple threads; adding a name twice keeps the last
+    chapter. Closing with the names in the order of the toc writes the same archive
+    however the threads were scheduled.
+    """
+
+    def __init__(self, fname: str, level: int = 6) -> None:
+        """
+        Starts a new archive.
+
+        Args:
+            fname (str): The archive file.
+            level (int, optional): The zlib compression level. Defaults to 6.
+        """
+        self.fname = str(fname)
+        self.level = level
+        self._entries: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+        self._data_name = xml.temporary_name(self.fname) + ".data"
+        self._data = open(self._data_name, "wb")
+        self._size = 0
+
+    def add(self, name: str, data: bytes) -> int:
+        """
+        Compresses and appends a chapter.
+
+        Args:
+            name (str): The name of the chapter, as referenced by the toc.
+            data (bytes): The serialized chapter.
+
+        Returns:
+            int: The compressed size of the chapter.
+        """
+        packed = zlib.compress(data, self.level)
+        with self._lock:
+            self._data.write(packed)
+            self._entries[name] = [self._size, len(packed)]
+            self._size += len(packed)
+        return len(packed)
+
+    def close(self, names: Optional[Iterable[str]] = None) -> None:
+        """
+        Writes the index followed by the chapters, and moves the archive in place.
+
+        Args:
+            names (Iterable[str], optional): The order of the chapters in the
+                archive, chapters that are not named follow in the order they were
+                added. Defaults to None, the order they were added.
+        """
+        if self._data.closed:
+            return
+        self._data.close()
+        order = dict.fromkeys(n for n in names or () if n in self._entries)
+        order.update(dict.fromkeys(self._entries))
+        entries, offset = {}, 0
+        for name in order:
+            entries[name] = [offset, self._entries[name][1]]
+            offset += self._entries[name][1]
+        index = json.dumps(
+            {"compression": "zlib", "entries": entries},
+            ensure_ascii=False,
+            separators=(",", ":"),
+        ).encode("utf-8")
+        tmp = xml.temporary_name(self.fname)
+        try:
+            with open(tmp, "wb") as out, open(self._data_name, "rb") as data:
+                out.write(MAGIC)
+                out.write(_LENGTH.pack(len(index)))
+                out.write(index)
+                for name in order:
+                    start, length = self._entries[name]
+                    data.seek(start)
+                    out.write(data.read(length))
+            os.replace(tmp, self.fname)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp)
+            raise
+        finally:
+            with contextlib.suppress(OSError):
+                os.remove(self._data_name)
+
+    def abort(self) -> None:
+        """Discards the archive, leaving fname untouched. Does nothing after close."""
+        if self._data.closed:
+            return
+        self._data.close()
+        with contextlib.suppress(OSError):
+            os.remove(self._data_name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class ArchiveReader:
+    """
+    Reads chapters from an archive.
+
+    Only the header is read when the archive is opened. Chapters are read with
+    positioned reads, so a reader can be shared between threads.
+    """
+
+    def __init__(self, fname: str) -> None:
+        """
+        Opens an archive and reads its index.
+
+        Args:
+            fname (str): The archive file.
+
+        Raises:
+            ValueError: If the file is not an archive.
+        """
+        self.fname = str(fname)
+        self._fd = os.open(self.fname, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        try:
+            head = os.pread(self._fd, len(MAGIC) + _LENGTH.size, 0)
+            if head[: len(MAGIC)] != MAGIC:
+                raise ValueError(f"{fname} is not a chapter archive.")
+            (length,) = _LENGTH.unpack(head[len(MAGIC) :])
+            index = json.loads(os.pread(self._fd, length, len(head)))
+        except BaseException:
+            os.close(self._fd)
+            raise
+        self._entries: Dict[str, List[int]] = index["entries"]
+        self._start = len(head) + length
+
+    def names(self) -> List[str]:
+        """Returns the names of all chapters, in the order they are stored."""
+        return list(self._entries)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def read(self, name: str, size: Optional[int] = None) -> bytes:
+        """
+        Reads a chapter, or its start.
+
+        Args:
+            name (str): The name of the chapter.
+            size (Optional[int], optional): Only decompress this many bytes from the
+                start of the chapter. Defaults to None, the whole chapter.
+
+        Returns:
+            bytes: The serialized chapter.
+
+        Raises:
+            KeyError: If the archive has no chapter with this name.
+        """
+        offset, length = self._entries[name]
+        packed = os.pread(self._fd, length, self._start + offset)
+        if size is not None:
+            return zlib.decompressobj().decompress(packed, size)
+        return zlib.decompress(packed)
+
+    def parse(
+        self, name: str, parser: Optional[etree.XMLParser] = None
+    ) -> etree._Element:
+        """
+        Reads and parses a chapter.
+
+        Args:
+            name (str): The name of the chapter.
+            parser (etree.XMLParser, optional): The parser to use. Defaults to
+                xml.default_parser().
+
+        Returns:
+            etree._Element: The chapter element.
+        """
+        return etree.fromstring(self.read(name), parser or xml.default_parser())
+
+    def include(self, toc: etree._Element) -> etree._Element:
+        """
+        Replaces the xi:include elements of a toc with the chapters they reference,
+        like XInclude does for a toc that references chapter files.
+
+        Args:
+            toc (etree._Element): The toc, which is modified in place.
+
+        Returns:
+            etree._Element: The toc.
+        """
+        for node in list(toc.iter("{" + xml.XI + "}include")):
+            chapter = self.parse(node.get("href"))
+            chapter.tail = node.tail
+            node.getparent().replace(node, chapter)
+        return toc
+
+    def close(self) -> None:
+        """Closes the archive."""
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
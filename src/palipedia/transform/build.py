@@ -0,0 +1,123 @@
+"""Keeps track of the inputs that produced the files in an output directory."""
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict
+
+from absl import logging
+
+
+def digest(data: bytes) -> str:
+    """
+    Computes the content hash of a sequence of bytes.
+
+    Args:
+        data (bytes): The data to hash.
+
+    Returns:
+        str: The hex encoded sha256 of the data.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(fname: str) -> str:
+    """
+    Computes the content hash of a file.
+
+    Args:
+        fname (str): The name of the file to hash.
+
+    Returns:
+        str: The hex encoded sha256 of the file contents.
+    """
+    with open(fname, "rb") as f:
+        return digest(f.read())
+
+
+class BuildManifest:
+    """
+    A persistent record of the inputs every output file was produced from.
+
+    The manifest is stored in the output directory. Every entry maps the name of an
+    output file to a dictionary describing its inputs. An entry from the previous run
+    can only be reused if the pipeline description (version, stylesheet hash) is
+    unchanged, so changing the pipeline invalidates every output file.
+
+    Attributes:
+        path (Path): The location of the manifest file.
+        pipeline (Dict[str, Any]): Describes the pipeline that produces the output
+            files.
+        previous (Dict[str, Any]): The entries written by the previous run.
+        entries (Dict[str, Any]): The entries recorded during this run.
+    """
+
+    FILENAME = ".build_manifest.json"
+
+    def __init__(self, dest_dir: str, pipeline: Dict[str, Any]) -> None:
+        """
+        Initializes the manifest, loading the entries of the previous run if there are
+        any.
+
+        Args:
+            dest_dir (str): The output directory.
+            pipeline (Dict[str, Any]): Describes the pipeline that produces the output
+                files.
+        """
+        self.dest_dir = Path(dest_dir)
+        self.path = self.dest_dir / self.FILENAME
+        self.pipeline = pipeline
+        self.previous = {}
+        self.entries = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning("Ignoring unreadable manifest %s: %s", self.path, e)
+            return
+        if data.get("pipeline") == self.pipeline:
+            self.previous = data.get("files", {})
+        else:
+            logging.info("Pipeline changed, rebuilding everything.")
+
+    def up_to_date(self, name: str, entry: Dict[str, Any]) -> bool:
+        """
+        Checks whether an output file was produced from the given inputs by the
+        previous run.
+
+        Args:
+            name (str): The name of the output file, relative to the output directory.
+            entry (Dict[str, Any]): Describes the inputs of the output file.
+
+        Returns:
+            bool: True if the output file exists and was produced from the same inputs.
+        """
+        return self.previous.get(name) == entry and (self.dest_dir / name).exists()
+
+    def record(self, name: str, entry: Dict[str, Any]) -> None:
+        """
+        Records the inputs of an output file produced (or reused) by this run.
+
+        Args:
+            name (str): The name of the output file, relative to the output directory.
+            entry (Dict[str, Any]): Describes the inputs of the output file.
+        """
+        self.entries[name] = entry
+
+    def save(self) -> None:
+        """Replaces the manifest file with the entries of this run."""
+        self.dest_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {"pipeline": self.pipeline, "files": self.entries},
+                f,
+                indent=1,
+                sort_keys=True,
+            )
+        os.replace(tmp, self.path)
@@ -0,0 +1,86 @@
+"""A bounded cache for parsed and transformed XML trees."""
+import copy
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Hashable
+
+from lxml import etree
+
+
+class TreeCache:
+    """
+    A least recently used cache of XML trees derived from source files.
+
+    Entries are keyed by a kind (for example "parse" or "xslt"), the resolved path of
+    the source file and its modification time, so a file that changes on disk is never
+    served from the cache. The cleanup passes modify trees in place, so every lookup
+    returns a deep copy of the cached tree. The cache can be shared between threads.
+
+    Attributes:
+        maxsize (int): The maximum number of trees held by the cache.
+        hits (int): The number of lookups that were served from the cache.
+        misses (int): The number of lookups that had to build the tree.
+    """
+
+    def __init__(self, maxsize: int = 64) -> None:
+        """
+        Initializes a new, empty cache.
+
+        Args:
+            maxsize (int, optional): The maximum number of trees held by the cache. A
+                size of 0 disables caching. Defaults to 64.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._trees = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._trees)
+
+    def get(
+        self, kind: Hashable, fname: str, build: Callable[[], etree._Element]
+    ) -> etree._Element:
+        """
+        Returns a copy of the tree derived from the given file, building it if needed.
+
+        Args:
+            kind (Hashable): Identifies how the tree is derived from the file.
+            fname (str): The source file the tree is derived from.
+            build (Callable[[], etree._Element]): Builds the tree when it is not cached.
+
+        Returns:
+            etree._Element: A tree that can be freely modified by the caller.
+        """
+        if self.maxsize <= 0:
+            with self._lock:
+                self.misses += 1
+            return build()
+
+        fpath = Path(fname).resolve()
+        key = (kind, str(fpath), os.stat(fpath).st_mtime_ns)
+        with self._lock:
+            tree = self._trees.get(key)
+            if tree is not None:
+                self.hits += 1
+                self._trees.move_to_end(key)
+            else:
+                self.misses += 1
+        if tree is not None:
+            return copy.deepcopy(tree)
+
+        # Built without holding the lock, two threads may build the same tree.
+        tree = build()
+        with self._lock:
+            self._trees[key] = tree
+            if len(self._trees) > self.maxsize:
+                self._trees.popitem(last=False)
+        return copy.deepcopy(tree)
+
+    def clear(self) -> None:
+        """Removes all trees from the cache, the counters are left untouched."""
+        with self._lock:
+            self._trees.clear()
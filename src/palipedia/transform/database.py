@@ -0,0 +1,201 @@
+"""Exports a transformation into a SQLite database, for ad-hoc queries.
+
+The database has three tables:
+
+    nodes       the collections, pitikas, nikayas, books and chapters of the toc, with
+                their parent node, level, title and nr, and the name of the chapter file
+                for chapters.
+    units       the paragraphs and verses of every chapter in document order, with their
+                tag, class, nr, the first and last number of the nr, and their text.
+    units_fts   an FTS5 index over the text of the units, whose rowids are the ids of
+                the units. Diacritics are folded, so "sutam" matches "sutaṃ".
+
+For example, the paragraphs of a book that contain a word:
+
+    SELECT units.nr, units.text FROM units_fts
+    JOIN units ON units.id = units_fts.rowid
+    JOIN nodes AS chapter ON chapter.id = units.chapter
+    JOIN nodes AS book ON book.id = chapter.parent
+    WHERE units_fts MATCH 'bhagava' AND book.title = '1. Vagga ñ0'
+
+Rows are inserted in large batches with journaling turned off, and the indexes and the
+full-text index are built once all rows are loaded. The database is written to a
+temporary file that replaces the previous database when it is complete.
+"""
+import contextlib
+import itertools
+import os
+import sqlite3
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from lxml import etree
+
+import palipedia.transform.xml as xml
+from palipedia.transform.flat import ChapterSource, parse_nr, unit_text, units
+
+_INCLUDE = "{" + xml.XI + "}include"
+
+SCHEMA = """
+CREATE TABLE nodes (
+    id INTEGER PRIMARY KEY,
+    parent INTEGER REFERENCES nodes(id),
+    level TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    title TEXT,
+    nr TEXT,
+    href TEXT
+);
+CREATE TABLE units (
+    id INTEGER PRIMARY KEY,
+    chapter INTEGER NOT NULL REFERENCES nodes(id),
+    position INTEGER NOT NULL,
+    tag TEXT NOT NULL,
+    class TEXT,
+    nr TEXT,
+    nr_start INTEGER,
+    nr_end INTEGER,
+    text TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE units_fts USING fts5(
+    text, content='units', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+"""
+
+# Built after the load, which is faster than maintaining them while inserting.
+INDEXES = """
+CREATE INDEX nodes_parent ON nodes(parent, position);
+CREATE INDEX nodes_level ON nodes(level, title);
+CREATE UNIQUE INDEX nodes_href ON nodes(href);
+CREATE INDEX units_chapter ON units(chapter, position);
+CREATE INDEX units_nr ON units(nr_start, nr_end);
+INSERT INTO units_fts(units_fts) VALUES ('rebuild');
+ANALYZE;
+"""
+
+_NODE = "INSERT INTO nodes VALUES (?, ?, ?, ?, ?, ?, ?)"
+_UNIT = "INSERT INTO units VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+
+class SqliteExporter:
+    """
+    Writes the hierarchy and the text of a transformation into a SQLite database.
+
+    The toc is walked in document order and every included chapter is read on its own,
+    from a chapter file or from the archive named by the toc.
+    """
+
+    def __init__(self, dest_dir: str, batch_size: int = 50000) -> None:
+        """
+        Initializes the exporter.
+
+        Args:
+            dest_dir (str): The output directory of a TipitikaTransformer.
+            batch_size (int, optional): The number of rows inserted per transaction.
+                Defaults to 50000.
+        """
+        self.dest_dir = Path(dest_dir)
+        self.batch_size = batch_size
+
+    def export(self, db_file: str) -> int:
+        """
+        Writes the database, replacing the database in db_file if there is one.
+
+        Args:
+            db_file (str): The database file.
+
+        Returns:
+            int: The number of exported paragraphs and verses.
+        """
+        tmp = xml.temporary_name(db_file)
+        try:
+            with contextlib.closing(sqlite3.connect(tmp)) as db:
+                count = self._load(db)
+            os.replace(tmp, db_file)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp)
+            raise
+        return count
+
+    def _load(self, db: sqlite3.Connection) -> int:
+        db.execute("PRAGMA journal_mode = OFF")
+        db.execute("PRAGMA synchronous = OFF")
+        db.executescript(SCHEMA)
+        nodes: List[tuple] = []
+        rows: List[tuple] = []
+        count = 0
+        with ChapterSource(self.dest_dir) as source:
+            for node in self._nodes(source, source.toc, None, itertools.count()):
+                nodes.append(node[:-1])
+                chapter = node[-1]
+                if chapter is None:
+                    continue
+                for position, unit in enumerate(units(chapter)):
+                    start, end = parse_nr(unit.get("nr"))
+                    rows.append(
+                        (
+                            count,
+                            node[0],
+                            position,
+                            unit.tag,
+                            unit.get("class"),
+                            unit.get("nr"),
+                            start if start >= 0 else None,
+                            end if end >= 0 else None,
+                            unit_text(unit),
+                        )
+                    )
+                    count += 1
+                if len(rows) >= self.batch_size:
+                    self._insert(db, nodes, rows)
+        self._insert(db, nodes, rows)
+        db.executescript(INDEXES)
+        db.commit()
+        return count
+
+    def _nodes(
+        self,
+        source: ChapterSource,
+        element: etree._Element,
+        parent: Optional[int],
+        ids: Iterator[int],
+    ) -> Iterator[tuple]:
+        """Yields the row of every node below an element of the toc, followed by the
+        parsed chapter for chapters and None otherwise."""
+        for position, child in enumerate(element):
+            id_ = next(ids)
+            if child.tag == _INCLUDE:
+                href = child.get("href")
+                chapter = source.parse(href)
+                yield (
+                    id_,
+                    parent,
+                    "chapter",
+                    position,
+                    chapter.get("title"),
+                    chapter.get("nr"),
+                    href,
+                    chapter,
+                )
+                continue
+            yield (
+                id_,
+                parent,
+                child.tag,
+                position,
+                child.get("title"),
+                child.get("nr"),
+                None,
+                None,
+            )
+            yield from self._nodes(source, child, id_, ids)
+
+    @staticmethod
+    def _insert(db: sqlite3.Connection, nodes: List[tuple], rows: List[tuple]) -> None:
+        """Inserts and clears the collected rows in a single transaction."""
+        with db:
+            db.executemany(_NODE, nodes)
+            db.executemany(_UNIT, rows)
+        nodes.clear()
+        rows.clear()
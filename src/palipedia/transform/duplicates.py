@@ -0,0 +1,189 @@
+"""Finds repeated passages, the peyyāla and stock formulas of the canon.
+
+Two paragraphs or verses are near duplicates when the sets of their word shingles, the
+runs of SHINGLE consecutive words, have a Jaccard similarity of at least a threshold.
+The similarity is estimated with MinHash signatures, and candidates are found with
+locality sensitive hashing (LSH): a signature is cut into bands, and units that share a
+band land in the same bucket.
+
+Units are added in document order. A unit whose estimated similarity to the canonical
+unit of a bucket it shares reaches the threshold is a repeat of that canonical unit,
+otherwise it becomes canonical itself and is added to its buckets. Every unit is only
+compared to the canonical units of its buckets, so the whole corpus is processed in time
+linear in its size, even for formulas that are repeated thousands of times.
+
+The result is a passage cluster table: the canonical unit of every unit, the unit itself
+for a unit that is not a repeat, which FlatCorpus.unique uses to sample the corpus.
+FlatExporter uses a detector to write deduplicated corpora, in which a repeat with
+exactly the text of its canonical unit is an empty line that refers to it.
+"""
+import io
+import json
+import zlib
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+
+import palipedia.transform.xml as xml
+from palipedia.transform.flat import CLUSTERS, FlatCorpus
+from palipedia.transform.tokenizer import words
+
+DUPLICATES = "duplicates.json"
+
+# The number of words of a shingle.
+SHINGLE = 3
+
+# A Mersenne prime larger than the hashes of the shingles.
+_PRIME = (1 << 61) - 1
+
+
+class PassageDetector:
+    """
+    Assigns every unit added to it to a cluster of near duplicates.
+
+    Attributes:
+        threshold (float): The estimated Jaccard similarity of a repeat to its canonical
+            unit.
+        canonical (array): The canonical unit of every unit added so far.
+    """
+
+    def __init__(
+        self, threshold: float = 0.8, bands: int = 16, rows: int = 4, seed: int = 1
+    ) -> None:
+        """
+        Initializes an empty detector.
+
+        Args:
+            threshold (float, optional): The similarity of repeats. Defaults to 0.8.
+            bands (int, optional): The number of LSH bands. Defaults to 16.
+            rows (int, optional): The number of MinHash values per band. With 16 bands
+                of 4 rows, units with a similarity of 0.8 share a band with a
+                probability of 0.9998. Defaults to 4.
+            seed (int, optional): Seeds the hash functions. Defaults to 1.
+        """
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = rows
+        rng = np.random.default_rng(seed)
+        size = bands * rows
+        self._a = rng.integers(1, 1 << 31, size, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 31, size, dtype=np.uint64)
+        self._buckets: List[Dict[bytes, int]] = [{} for _ in range(bands)]
+        self._signatures: Dict[int, np.ndarray] = {}
+        self.canonical = array("i")
+
+    def __len__(self) -> int:
+        return len(self.canonical)
+
+    def signature(self, text: str) -> np.ndarray:
+        """
+        Returns the MinHash signature of a text.
+
+        Args:
+            text (str): The text of a unit, which is split into normalized words.
+
+        Returns:
+            np.ndarray: The minimum of every hash function over the shingles.
+        """
+        tokens = words(text)
+        shingles = {
+            zlib.crc32(" ".join(tokens[i : i + SHINGLE]).encode("utf-8"))
+            for i in range(max(1, len(tokens) - SHINGLE + 1))
+        }
+        x = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+        return ((np.outer(x, self._a) + self._b) % _PRIME).min(axis=0)
+
+    def add(self, text: str) -> int:
+        """
+        Adds the next unit.
+
+        Args:
+            text (str): The text of the unit.
+
+        Returns:
+            int: The canonical unit of the unit, the number of the unit itself if it
+            is not a repeat.
+        """
+        unit = len(self.canonical)
+        signature = self.signature(text)
+        keys = [
+            signature[b * self.rows : (b + 1) * self.rows].tobytes()
+            for b in range(self.bands)
+        ]
+        best, similarity = unit, self.threshold
+        for bucket, key in zip(self._buckets, keys):
+            candidate = bucket.get(key)
+            if candidate is None or candidate == best:
+                continue
+            estimate = float(np.mean(self._signatures[candidate] == signature))
+            if estimate >= similarity:
+                best, similarity = candidate, estimate
+        if best == unit:
+            self._signatures[unit] = signature
+            for bucket, key in zip(self._buckets, keys):
+                bucket.setdefault(key, unit)
+        self.canonical.append(best)
+        return best
+
+    def save(self, out_dir: str) -> Dict[str, Any]:
+        """
+        Writes the cluster table, and a summary of the clusters.
+
+        Args:
+            out_dir (str): The directory that receives the table, usually a flat corpus.
+
+        Returns:
+            Dict[str, Any]: The number of "units", of "clusters" with repeats and of
+            "repeats", and the similarity "threshold".
+        """
+        out = Path(out_dir)
+        canonical = np.frombuffer(self.canonical, dtype=np.int32)
+        table = io.BytesIO()
+        np.save(table, canonical)
+        xml.write_atomic(out / CLUSTERS, table.getvalue())
+        repeats = canonical != np.arange(len(canonical))
+        summary = {
+            "units": len(canonical),
+            "clusters": len(np.unique(canonical[repeats])),
+            "repeats": int(repeats.sum()),
+            "threshold": self.threshold,
+        }
+        xml.write_atomic(out / DUPLICATES, json.dumps(summary).encode("utf-8"))
+        return summary
+
+
+def find_duplicates(texts: Iterable[str], threshold: float = 0.8) -> np.ndarray:
+    """
+    Clusters the near duplicates of a sequence of texts.
+
+    Args:
+        texts (Iterable[str]): The texts, in document order.
+        threshold (float, optional): The similarity of repeats. Defaults to 0.8.
+
+    Returns:
+        np.ndarray: The canonical unit of every text.
+    """
+    detector = PassageDetector(threshold)
+    for text in texts:
+        detector.add(text)
+    return np.frombuffer(detector.canonical, dtype=np.int32)
+
+
+def cluster_corpus(corpus_dir: str, threshold: float = 0.8) -> Dict[str, Any]:
+    """
+    Writes the cluster table of a flat corpus into the corpus, see FlatCorpus.clusters.
+
+    Args:
+        corpus_dir (str): The directory written by FlatExporter.export.
+        threshold (float, optional): The similarity of repeats. Defaults to 0.8.
+
+    Returns:
+        Dict[str, Any]: The summary of the clusters, see PassageDetector.save.
+    """
+    corpus = FlatCorpus(corpus_dir)
+    detector = PassageDetector(threshold)
+    for i in range(len(corpus)):
+        detector.add(corpus[i])
+    return detector.save(corpus_dir)
@@ -0,0 +1,414 @@
+"""Exports the transformed scriptures as a flat text corpus for model training.
+
+The text of every paragraph and verse is written into a single UTF-8 file, one unit per
+line, in document order. NumPy arrays next to it hold the byte offsets of the units, the
+ids of the collection, pitika, nikaya, book and chapter every unit belongs to, and the
+numbers lifted into the nr attributes. All arrays are memory mapped when the corpus is
+opened, so opening the whole canon and slicing it does not touch lxml.
+"""
+import io
+import json
+import re
+from array import array
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from lxml import etree
+
+import palipedia.transform.xml as xml
+from palipedia.transform.archive import ArchiveReader
+
+# The levels of the output hierarchy, the columns of the ids array.
+LEVELS = ["collection", "pitika", "nikaya", "book", "chapter"]
+
+# The elements whose text is exported.
+UNITS = ("p", "verse")
+
+TEXT = "text.bin"
+OFFSETS = "offsets.npy"
+IDS = "ids.npy"
+NR = "nr.npy"
+META = "meta.json"
+# The canonical unit of every unit, see duplicates.PassageDetector.
+CLUSTERS = "clusters.npy"
+# The unit whose text is stored for every unit of a deduplicated corpus.
+REFERENCES = "references.npy"
+
+_INCLUDE = "{" + xml.XI + "}include"
+# The bytes of an archived chapter that are decompressed to read its start tag.
+_HEAD = 4096
+_NR = re.compile(r"(\d+)(?:-(\d+))?")
+
+
+class ChapterSource:
+    """
+    Reads the chapters of a transformation, from chapter files or from the archive
+    named by the toc.
+
+    Attributes:
+        toc (etree._Element): The parsed toc.
+    """
+
+    def __init__(self, dest_dir: str) -> None:
+        """
+        Reads the toc, and opens the archive if there is one.
+
+        Args:
+            dest_dir (str): The output directory of a TipitikaTransformer.
+        """
+        self.dest_dir = Path(dest_dir)
+        self.toc = xml.parse(str(self.dest_dir / "toc.xml"))
+        self._archive: Optional[ArchiveReader] = None
+        if self.toc.get("archive"):
+            self._archive = ArchiveReader(self.dest_dir / self.toc.get("archive"))
+
+    def names(self) -> List[str]:
+        """Returns the names of all chapters, in the order of the toc."""
+        return [node.get("href") for node in self.toc.iter(_INCLUDE)]
+
+    def parse(self, name: str) -> etree._Element:
+        """
+        Reads and parses a chapter.
+
+        Args:
+            name (str): The name of the chapter, as referenced by the toc.
+
+        Returns:
+            etree._Element: The chapter element.
+        """
+        if self._archive is not None:
+            return self._archive.parse(name)
+        return xml.parse(str(self.dest_dir / name))
+
+    def read(self, name: str) -> bytes:
+        """Returns the serialized chapter, without parsing it."""
+        if self._archive is not None:
+            return self._archive.read(name)
+        return (self.dest_dir / name).read_bytes()
+
+    def path(self, name: str) -> Path:
+        """Returns the file that holds a chapter, its own file or the archive."""
+        if self._archive is not None:
+            return Path(self._archive.fname)
+        return self.dest_dir / name
+
+    def attributes(self, name: str) -> Dict[str, str]:
+        """
+        Returns the attributes of a chapter element, such as its title and nr, without
+        parsing the rest of a chapter file. Only the start of an archived chapter is
+        decompressed.
+
+        Args:
+            name (str): The name of the chapter, as referenced by the toc.
+
+        Returns:
+            Dict[str, str]: The attributes.
+        """
+        if self._archive is None:
+            return _start_attributes(str(self.dest_dir / name))
+        try:
+            return _start_attributes(io.BytesIO(self._archive.read(name, _HEAD)))
+        except etree.XMLSyntaxError:
+            # The start tag is longer than the decompressed head.
+            return _start_attributes(io.BytesIO(self.read(name)))
+
+    def close(self) -> None:
+        """Closes the archive."""
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+def _start_attributes(source) -> Dict[str, str]:
+    """Returns the attributes of the document element of a file or stream."""
+    for _, node in etree.iterparse(source, events=("start",)):
+        return dict(node.attrib)
+    return {}
+
+
+def units(node: etree._Element) -> Iterator[etree._Element]:
+    """
+    Yields the paragraphs and verses below a node, in document order.
+
+    Args:
+        node (etree._Element): A chapter or any element of a chapter.
+
+    Yields:
+        etree._Element: The paragraphs and verses, but not those nested in another one.
+    """
+    for child in node:
+        if child.tag in UNITS:
+            yield child
+        else:
+            yield from units(child)
+
+
+def unit_text(node: etree._Element) -> str:
+    """Returns the text of a paragraph or verse, on a single line."""
+    return "".join(node.itertext()).replace("\n", " ")
+
+
+def parse_nr(value: Optional[str]) -> Tuple[int, int]:
+    """
+    Parses an nr attribute, such as "12" or "12-15".
+
+    Args:
+        value (Optional[str]): The attribute, or None.
+
+    Returns:
+        Tuple[int, int]: The first and last number, or -1, -1 without a number.
+    """
+    m = _NR.match(value or "")
+    if not m:
+        return -1, -1
+    start = int(m.group(1))
+    return start, int(m.group(2) or start)
+
+
+class Hierarchy:
+    """
+    Walks the paragraphs and verses of a transformation in document order, together
+    with the elements of the levels in LEVELS they belong to.
+
+    The elements of a level are numbered in document order, their titles are collected
+    while walking.
+
+    Attributes:
+        titles (Dict[str, List[str]]): The titles of the elements of a level seen so
+            far, by id.
+    """
+
+    def __init__(self, source: ChapterSource) -> None:
+        """
+        Initializes the walk.
+
+        Args:
+            source (ChapterSource): The chapters of the transformation.
+        """
+        self.source = source
+        self.titles: Dict[str, List[str]] = {level: [] for level in LEVELS}
+
+    def units(self) -> Iterator[Tuple[etree._Element, Tuple[int, ...]]]:
+        """
+        Yields the paragraphs and verses.
+
+        Yields:
+            Tuple[etree._Element, Tuple[int, ...]]: A paragraph or verse and the ids of
+            the elements it belongs to, one per level in LEVELS, -1 where it does not
+            belong to an element of the level.
+        """
+        yield from self._walk(self.source.toc, (-1,) * len(LEVELS))
+
+    def _walk(self, node: etree._Element, ids: tuple):
+        for child in node:
+            if child.tag == _INCLUDE:
+                child = self.source.parse(child.get("href"))
+            if child.tag in UNITS:
+                yield child, ids
+                continue
+            child_ids = ids
+            if child.tag in self.titles:
+                titles = self.titles[child.tag]
+                level = LEVELS.index(child.tag)
+                child_ids = ids[:level] + (len(titles),) + ids[level + 1 :]
+                titles.append(child.get("title", ""))
+            yield from self._walk(child, child_ids)
+
+
+class FlatExporter:
+    """
+    Writes the flat text corpus of a transformation.
+
+    The toc is walked in document order and every included chapter is read on its own,
+    from a chapter file or from the archive named by the toc.
+    """
+
+    def __init__(self, dest_dir: str) -> None:
+        """
+        Initializes the exporter.
+
+        Args:
+            dest_dir (str): The output directory of a TipitikaTransformer.
+        """
+        self.dest_dir = Path(dest_dir)
+
+    def export(self, out_dir: str, detector=None) -> int:
+        """
+        Writes the corpus.
+
+        Args:
+            out_dir (str): The directory that receives the text and the arrays.
+            detector (duplicates.PassageDetector, optional): Writes a deduplicated
+                corpus: every unit is added to the detector, and a repeat with exactly
+                the text of its canonical unit is written as an empty line that
+                refers to it. Near duplicates keep their own text, and are only
+                grouped in the cluster table. Defaults to None, every unit is written.
+
+        Returns:
+            int: The number of exported paragraphs and verses.
+        """
+        out = Path(out_dir)
+        out.mkdir(parents=True, exist_ok=True)
+        offsets = array("q", [0])
+        ids = array("i")
+        nr = array("i")
+        references = array("i")
+        with ChapterSource(self.dest_dir) as source, open(out / TEXT, "w+b") as text:
+            hierarchy = Hierarchy(source)
+            for node, unit_ids in hierarchy.units():
+                content = unit_text(node)
+                data = content.encode("utf-8")
+                reference = len(offsets) - 1
+                if detector is not None:
+                    canonical = detector.add(content)
+                    if _stored(text, offsets, canonical) == data:
+                        reference = canonical
+                    references.append(reference)
+                if reference == len(offsets) - 1:
+                    text.write(data)
+                text.write(b"\n")
+                offsets.append(text.tell())
+                ids.extend(unit_ids)
+                nr.extend(parse_nr(node.get("nr")))
+
+        count = len(offsets) - 1
+        np.save(out / OFFSETS, np.frombuffer(offsets, dtype=np.int64))
+        np.save(
+            out / IDS,
+            np.frombuffer(ids, dtype=np.int32).reshape(count, len(LEVELS)),
+        )
+        np.save(out / NR, np.frombuffer(nr, dtype=np.int32).reshape(count, 2))
+        if detector is not None:
+            np.save(out / REFERENCES, np.frombuffer(references, dtype=np.int32))
+            detector.save(out)
+        with open(out / META, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "units": count,
+                    "levels": LEVELS,
+                    "titles": hierarchy.titles,
+                    "deduplicated": detector is not None,
+                },
+                f,
+                ensure_ascii=False,
+            )
+        return count
+
+
+def _stored(text: io.BufferedRandom, offsets: array, unit: int) -> Optional[bytes]:
+    """Reads back the text of an earlier unit from the text file being written, None
+    for the unit that is being written."""
+    if unit >= len(offsets) - 1:
+        return None
+    end = text.tell()
+    text.seek(offsets[unit])
+    data = text.read(offsets[unit + 1] - 1 - offsets[unit])
+    text.seek(end)
+    return data
+
+
+class FlatCorpus:
+    """
+    A flat text corpus written by FlatExporter, memory mapped.
+
+    Attributes:
+        offsets (np.ndarray): The byte offsets of the units, unit i is followed by a
+            newline at offsets[i + 1] - 1.
+        ids (np.ndarray): The ids of the levels every unit belongs to, one column per
+            level in LEVELS, -1 where a unit is not below an element of the level.
+        nr (np.ndarray): The first and last number of the nr attribute of every unit,
+            -1 for units without a number.
+        titles (Dict[str, List[str]]): The titles of the elements of a level, by id.
+        clusters (Optional[np.ndarray]): The canonical unit of every unit, if the
+            cluster table of the repeated passages was written, see duplicates.
+        deduplicated (bool): Whether exact repeats are stored as empty lines, and
+            read as the text of the unit they refer to.
+        references (Optional[np.ndarray]): The unit whose text is stored for every
+            unit of a deduplicated corpus, the unit itself unless it is an exact
+            repeat.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Opens a corpus, only the metadata is read.
+
+        Args:
+            path (str): The directory written by FlatExporter.export.
+        """
+        path = Path(path)
+        with open(path / META, encoding="utf-8") as f:
+            meta = json.load(f)
+        self.titles: Dict[str, List[str]] = meta["titles"]
+        self.offsets = np.load(path / OFFSETS, mmap_mode="r")
+        self.ids = np.load(path / IDS, mmap_mode="r")
+        self.nr = np.load(path / NR, mmap_mode="r")
+        self.deduplicated: bool = meta.get("deduplicated", False)
+        self.clusters: Optional[np.ndarray] = None
+        if (path / CLUSTERS).exists():
+            self.clusters = np.load(path / CLUSTERS, mmap_mode="r")
+        self.references: Optional[np.ndarray] = None
+        if self.deduplicated:
+            self.references = np.load(path / REFERENCES, mmap_mode="r")
+        if self.offsets[-1] > 0:
+            self._text = np.memmap(path / TEXT, dtype=np.uint8, mode="r")
+        else:
+            self._text = np.empty(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        """Returns the text of a unit, read from the unit it refers to for an exact
+        repeat in a deduplicated corpus."""
+        if self.references is not None:
+            i = int(self.references[i])
+        start, end = self.offsets[i], self.offsets[i + 1] - 1
+        return self._text[start:end].tobytes().decode("utf-8")
+
+    def data(self, start: int, stop: int) -> memoryview:
+        """
+        Returns the bytes of a range of units, newline separated, without copying.
+        Exact repeats in a deduplicated corpus are empty.
+
+        Args:
+            start (int): The first unit.
+            stop (int): The unit after the last one.
+
+        Returns:
+            memoryview: The UTF-8 text of the units.
+        """
+        return memoryview(self._text[self.offsets[start] : self.offsets[stop]])
+
+    def select(self, level: str, id_: int) -> range:
+        """
+        Returns the units below an element of the hierarchy, which are consecutive.
+
+        Args:
+            level (str): The level, one of LEVELS.
+            id_ (int): The id of the element within the level.
+
+        Returns:
+            range: The units, empty if the element has no paragraphs or verses.
+        """
+        units = np.flatnonzero(self.ids[:, LEVELS.index(level)] == id_)
+        if len(units) == 0:
+            return range(0)
+        return range(int(units[0]), int(units[-1]) + 1)
+
+    def unique(self) -> np.ndarray:
+        """
+        Returns the units that are not repeats, to sample the corpus without duplicates.
+
+        Returns:
+            np.ndarray: The canonical units, all units without a cluster table.
+        """
+        if self.clusters is None:
+            return np.arange(len(self))
+        return np.flatnonzero(self.clusters == np.arange(len(self)))
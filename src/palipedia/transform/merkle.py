@@ -0,0 +1,175 @@
+"""Describes the content of an output directory as a Merkle tree, and what changed.
+
+Every chapter, the toc and the reference index are leaves, hashed by their content. The
+chapter names are paths of the transliterated titles of the toc, so the directories of
+the tree follow the collections, pitikas, nikayas and books of the toc. The hash of a
+directory covers the names and hashes of its entries, so two output directories have the
+same content exactly when their root hashes are equal, and a directory with an unchanged
+hash can be skipped when mirroring.
+
+After every transformation the tree is compared to the one of the previous run, and the
+entries that were added, modified or removed are written to a change feed. Directories
+in the feed end with a slash.
+"""
+import json
+import os
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from absl import logging
+
+import palipedia.transform.xml as xml
+from palipedia.transform.build import digest, file_digest
+
+# Files next to the toc that are part of the tree when they exist.
+EXTRA = ["references.json"]
+
+
+def tree_hashes(files: Dict[str, str]) -> Dict[str, str]:
+    """
+    Rolls the hashes of files up into the hashes of their directories.
+
+    Args:
+        files (Dict[str, str]): The hash of every file, by its path.
+
+    Returns:
+        Dict[str, str]: The hash of every directory by its path ending in a slash, the
+        root is "".
+    """
+    entries: Dict[str, Dict[str, Optional[str]]] = defaultdict(dict)
+    entries[""] = {}
+    for name, hash_ in files.items():
+        parts = name.split("/")
+        for i, part in enumerate(parts):
+            parent = "".join(p + "/" for p in parts[:i])
+            if i == len(parts) - 1:
+                entries[parent][part] = hash_
+            else:
+                # A directory, hashed once its own entries are.
+                entries[parent][part + "/"] = None
+
+    hashes = {}
+    # Children have longer paths than their parents, so they are hashed first.
+    for path in sorted(entries, key=lambda p: p.count("/"), reverse=True):
+        lines = []
+        for child, hash_ in sorted(entries[path].items()):
+            if hash_ is None:
+                hash_ = hashes[path + child]
+            lines.append(f"{child}\t{hash_}\n")
+        hashes[path] = digest("".join(lines).encode("utf-8"))
+    return hashes
+
+
+def changes(previous: Dict[str, str], current: Dict[str, str]) -> Dict[str, List[str]]:
+    """
+    Compares the hashes of two trees.
+
+    Args:
+        previous (Dict[str, str]): The hashes of the files and directories of the old
+            tree, by path.
+        current (Dict[str, str]): The hashes of the new tree.
+
+    Returns:
+        Dict[str, List[str]]: The sorted paths that were "added", "modified" and
+        "removed". The root is never listed.
+    """
+    return {
+        "added": sorted(p for p in current if p and p not in previous),
+        "modified": sorted(
+            p for p in current if p and p in previous and previous[p] != current[p]
+        ),
+        "removed": sorted(p for p in previous if p and p not in current),
+    }
+
+
+class MerkleManifest:
+    """
+    The Merkle tree of an output directory, stored in it along with the change feed.
+
+    Files whose size and modification time did not change since the previous run are not
+    hashed again.
+
+    Attributes:
+        previous (Dict[str, list]): The files of the previous run, as [hash, size,
+            mtime_ns], by name.
+        previous_root (Optional[str]): The root hash of the previous run.
+    """
+
+    FILENAME = "merkle.json"
+    CHANGES = "changes.json"
+
+    def __init__(self, dest_dir: str) -> None:
+        """
+        Loads the tree of the previous run, if there is one.
+
+        Args:
+            dest_dir (str): The output directory.
+        """
+        self.dest_dir = Path(dest_dir)
+        self.path = self.dest_dir / self.FILENAME
+        self.previous: Dict[str, list] = {}
+        self._previous_tree: Dict[str, str] = {}
+        self.previous_root: Optional[str] = None
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning("Ignoring unreadable manifest %s: %s", self.path, e)
+            return
+        self.previous = data.get("files", {})
+        self._previous_tree = data.get("tree", {})
+        self.previous_root = self._previous_tree.get("")
+
+    def _file_entry(self, name: str) -> list:
+        fname = self.dest_dir / name
+        st = os.stat(fname)
+        entry = self.previous.get(name)
+        if entry is not None and entry[1:] == [st.st_size, st.st_mtime_ns]:
+            return entry
+        return [file_digest(fname), st.st_size, st.st_mtime_ns]
+
+    def update(
+        self, chapters: Iterable[str], read: Callable[[str], bytes] = None
+    ) -> Dict[str, Any]:
+        """
+        Hashes the output directory, and writes the manifest and the change feed.
+
+        Args:
+            chapters (Iterable[str]): The names of the chapters, as in the toc.
+            read (Callable[[str], bytes], optional): Reads a chapter that is not a file,
+                such as an archive entry. Defaults to None, chapters are files.
+
+        Returns:
+            Dict[str, Any]: The change feed, the "previous_root" and "root" hashes and
+            the paths that changed, see changes.
+        """
+        files = {}
+        for name in chapters:
+            if read is not None:
+                files[name] = [digest(read(name)), -1, -1]
+            else:
+                files[name] = self._file_entry(name)
+        for name in ["toc.xml"] + EXTRA:
+            if (self.dest_dir / name).exists():
+                files[name] = self._file_entry(name)
+
+        hashes = {name: entry[0] for name, entry in files.items()}
+        tree = tree_hashes(hashes)
+        previous = {name: entry[0] for name, entry in self.previous.items()}
+        previous.update(self._previous_tree)
+        feed = {"previous_root": self.previous_root, "root": tree[""]}
+        feed.update(changes(previous, {**hashes, **tree}))
+        xml.write_atomic(
+            self.path,
+            json.dumps({"files": files, "tree": tree}, indent=1, sort_keys=True).encode(
+                "utf-8"
+            ),
+        )
+        xml.write_atomic(
+            self.dest_dir / self.CHANGES,
+            json.dumps(feed, indent=1, ensure_ascii=False).encode("utf-8"),
+        )
+        return feed
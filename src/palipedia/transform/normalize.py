@@ -0,0 +1,177 @@
+"""Normalizes Pali text with precompiled translation tables.
+
+The sources mix composed and decomposed diacritics, write the niggahita both as ṃ and as
+ṁ, and contain runs of whitespace within the text. A Normalizer applies a Profile of
+steps, in this order:
+
+- nfc: compose letters and their diacritics, so ṃ is a single character.
+- niggahita: write every niggahita as the given character, ṃ or ṁ.
+- fold: remove the diacritics of Latin letters, so sutaṃ becomes sutam.
+- whitespace: replace every run of whitespace by a single space.
+
+The niggahita and folding steps are a single str.translate with a table built when the
+normalizer is created. Texts are normalized in batches: a batch is joined into one
+string, normalized with a single call per step and split again, so the cost per text is
+small. TipitikaTransformer normalizes the text and the titles of every chapter, and
+the titles of the toc, with a profile, after which the indexes and exports read
+normalized text.
+"""
+import re
+import unicodedata
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from lxml import etree
+
+# The niggahita, with a dot below and with a dot above.
+NIGGAHITA = ("ṃ", "ṁ")
+
+# Separates the texts of a batch, XML text cannot contain it.
+_SEPARATOR = "\0"
+# The attributes that hold text rather than names or numbers.
+_TEXT_ATTRIBUTES = ("title",)
+_WHITESPACE = re.compile(r"\s+")
+
+
+class Profile(NamedTuple):
+    """
+    The steps of a normalization.
+
+    Attributes:
+        nfc (bool): Compose characters to NFC.
+        niggahita (Optional[str]): Write the niggahita as "ṃ" or "ṁ", None keeps both.
+        fold (bool): Remove the diacritics of Latin letters.
+        whitespace (bool): Collapse runs of whitespace into a single space.
+    """
+
+    nfc: bool = True
+    niggahita: Optional[str] = None
+    fold: bool = False
+    whitespace: bool = False
+
+
+PROFILES: Dict[str, Profile] = {
+    "nfc": Profile(),
+    "canonical": Profile(niggahita="ṃ", whitespace=True),
+    "folded": Profile(niggahita="ṃ", fold=True, whitespace=True),
+}
+
+
+def _fold_table() -> Dict[int, Optional[str]]:
+    """Maps the Latin letters with diacritics to their base letters, and removes the
+    combining marks that were not composed."""
+    table: Dict[int, Optional[str]] = {c: None for c in range(0x300, 0x370)}
+    for first, last in ((0xC0, 0x24F), (0x1E00, 0x1EFF)):
+        for c in range(first, last + 1):
+            decomposed = unicodedata.normalize("NFD", chr(c))
+            base = "".join(d for d in decomposed if not unicodedata.combining(d))
+            if base != chr(c) and base.isascii() and base.isalpha():
+                table[c] = base
+    return table
+
+
+class Normalizer:
+    """
+    Normalizes texts with a profile.
+
+    Attributes:
+        profile (Profile): The steps applied to every text.
+    """
+
+    def __init__(self, profile: Profile = Profile()) -> None:
+        """
+        Builds the translation table of a profile.
+
+        Args:
+            profile (Profile, optional): The steps, see PROFILES. Defaults to NFC only.
+
+        Raises:
+            ValueError: If the niggahita of the profile is not one of NIGGAHITA.
+        """
+        if profile.niggahita is not None and profile.niggahita not in NIGGAHITA:
+            raise ValueError(f"Unknown niggahita {profile.niggahita!r}.")
+        self.profile = profile
+        table: Dict[int, Optional[str]] = {}
+        if profile.niggahita is not None:
+            for n in NIGGAHITA:
+                table[ord(n)] = profile.niggahita
+                table[ord(n.upper())] = profile.niggahita.upper()
+        if profile.fold:
+            table.update(_fold_table())
+        self._table = table or None
+
+    def __call__(self, text: str) -> str:
+        """Returns a normalized text."""
+        profile = self.profile
+        if profile.nfc and not unicodedata.is_normalized("NFC", text):
+            text = unicodedata.normalize("NFC", text)
+        if self._table is not None:
+            text = text.translate(self._table)
+        if profile.whitespace:
+            text = _WHITESPACE.sub(" ", text)
+        return text
+
+    def batch(self, texts: Iterable[str]) -> List[str]:
+        """
+        Normalizes a batch of texts.
+
+        Args:
+            texts (Iterable[str]): The texts.
+
+        Returns:
+            List[str]: The normalized texts, in the same order.
+        """
+        texts = list(texts)
+        joined = _SEPARATOR.join(texts)
+        if joined.count(_SEPARATOR) != max(len(texts) - 1, 0):
+            return [self(text) for text in texts]
+        return self(joined).split(_SEPARATOR) if texts else []
+
+    def tree(self, nodes: Iterable[etree._Element]) -> int:
+        """
+        Normalizes the text, tail and title of elements in place, as a single batch.
+
+        Args:
+            nodes (Iterable[etree._Element]): The elements, like tree.iter("*").
+
+        Returns:
+            int: The number of texts, tails and titles that changed.
+        """
+        targets = []
+        texts = []
+        for node in nodes:
+            if node.text:
+                targets.append((node, "text"))
+                texts.append(node.text)
+            if node.tail:
+                targets.append((node, "tail"))
+                texts.append(node.tail)
+            for name in _TEXT_ATTRIBUTES:
+                value = node.get(name)
+                if value:
+                    targets.append((node, name))
+                    texts.append(value)
+        changed = 0
+        for (node, attr), text, normalized in zip(targets, texts, self.batch(texts)):
+            # Only assign when something changes, assigning text is not free.
+            if normalized != text:
+                if attr in _TEXT_ATTRIBUTES:
+                    node.set(attr, normalized)
+                else:
+                    setattr(node, attr, normalized)
+                changed += 1
+        return changed
+
+
+def normalizer(name: str) -> Normalizer:
+    """
+    Returns a normalizer for a profile in PROFILES.
+
+    Args:
+        name (str): The name of the profile.
+
+    Raises:
+        ValueError: If there is no such profile.
+    """
+    if name not in PROFILES:
+        raise ValueError(f"Unknown profile {name}, expected one of {list(PROFILES)}.")
+    return Normalizer(PROFILES[name])
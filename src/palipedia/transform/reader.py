@@ -0,0 +1,203 @@
+"""Browses the output of a transformation without loading the whole canon.
+
+Only the toc is parsed when a reader is opened. Its elements are exposed as nodes that
+can be navigated by title, and every xi:include is a chapter node whose content is
+parsed on demand into a bounded cache of chapters. The titles of chapters are kept on
+their includes in the toc, so navigating does not open any chapter.
+"""
+from typing import Dict, Iterator, List, Optional, Union
+
+from lxml import etree
+
+import palipedia.transform.xml as xml
+from palipedia.transform.cache import TreeCache
+from palipedia.transform.flat import ChapterSource
+
+_INCLUDE = "{" + xml.XI + "}include"
+
+
+class Node:
+    """
+    An element of the hierarchy: the root, a collection, pitika, nikaya, book or
+    chapter.
+
+    Attributes:
+        parent (Optional[Node]): The parent node, None for the root.
+        href (Optional[str]): The name of the chapter, None if this is not a chapter.
+    """
+
+    def __init__(
+        self, reader: "CorpusReader", element: etree._Element, parent: "Node" = None
+    ) -> None:
+        self._reader = reader
+        self._element = element
+        self._children: Optional[List[Node]] = None
+        self._attributes: Optional[Dict[str, str]] = None
+        self.parent = parent
+        self.href = element.get("href") if element.tag == _INCLUDE else None
+
+    @property
+    def is_chapter(self) -> bool:
+        return self.href is not None
+
+    @property
+    def tag(self) -> str:
+        """The level of the node, like "book" or "chapter"."""
+        return "chapter" if self.is_chapter else self._element.tag
+
+    @property
+    def attributes(self) -> Dict[str, str]:
+        """The attributes of the node, for a chapter those of its include in the toc.
+        Outputs whose toc has no chapter titles read them from the start of the
+        chapter."""
+        if self._attributes is None:
+            attributes = dict(self._element.attrib)
+            if self.is_chapter:
+                del attributes["href"]
+                if "title" not in attributes:
+                    attributes = self._reader.source.attributes(self.href)
+            self._attributes = attributes
+        return self._attributes
+
+    @property
+    def title(self) -> Optional[str]:
+        return self.attributes.get("title")
+
+    @property
+    def nr(self) -> Optional[str]:
+        return self.attributes.get("nr")
+
+    @property
+    def children(self) -> List["Node"]:
+        """The child nodes, a chapter has none."""
+        if self._children is None:
+            if self.is_chapter:
+                self._children = []
+            else:
+                self._children = [Node(self._reader, e, self) for e in self._element]
+        return self._children
+
+    def __iter__(self) -> Iterator["Node"]:
+        return iter(self.children)
+
+    def __len__(self) -> int:
+        return len(self.children)
+
+    def __getitem__(self, key: Union[int, str]) -> "Node":
+        """
+        Returns a child by position, or the first child with a title.
+
+        Args:
+            key (Union[int, str]): The position or the title of the child.
+
+        Raises:
+            KeyError: If no child has the title.
+        """
+        if isinstance(key, int):
+            return self.children[key]
+        for child in self.children:
+            if child.title == key:
+                return child
+        raise KeyError(key)
+
+    def path(self) -> List[str]:
+        """Returns the titles of the nodes from the root down to this node."""
+        titles = []
+        node = self
+        while node.parent is not None:
+            titles.append(node.title)
+            node = node.parent
+        return titles[::-1]
+
+    def chapters(self) -> Iterator["Node"]:
+        """Yields the chapters below this node, or the node itself for a chapter."""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.is_chapter:
+                yield node
+            else:
+                stack.extend(reversed(node.children))
+
+    def load(self) -> etree._Element:
+        """
+        Returns the content of a chapter.
+
+        Returns:
+            etree._Element: The chapter element, a copy that may be modified.
+
+        Raises:
+            ValueError: If this node is not a chapter.
+        """
+        if not self.is_chapter:
+            raise ValueError(f"{self.tag} {self.title} is not a chapter.")
+        return self._reader.load(self.href)
+
+    def __repr__(self) -> str:
+        return f"<{self.tag} {self.title!r}>"
+
+
+class CorpusReader:
+    """
+    Reads the output directory of a TipitikaTransformer, chapter files or an archive.
+
+    Attributes:
+        root (Node): The root of the hierarchy.
+        cache (TreeCache): The cache of parsed chapters.
+    """
+
+    def __init__(self, dest_dir: str, cache_size: int = 32) -> None:
+        """
+        Opens the output directory, only the toc is parsed.
+
+        Args:
+            dest_dir (str): The output directory of a TipitikaTransformer.
+            cache_size (int, optional): The number of parsed chapters kept in memory.
+                Defaults to 32.
+        """
+        self.source = ChapterSource(dest_dir)
+        self.cache = TreeCache(cache_size)
+        self.root = Node(self, self.source.toc)
+
+    def load(self, href: str) -> etree._Element:
+        """
+        Parses a chapter, or takes it from the cache.
+
+        Args:
+            href (str): The name of the chapter, as referenced by the toc.
+
+        Returns:
+            etree._Element: The chapter element, a copy that may be modified.
+        """
+        return self.cache.get(
+            ("chapter", href), self.source.path(href), lambda: self.source.parse(href)
+        )
+
+    def find(self, *titles: str) -> Node:
+        """
+        Returns the node reached by following children with the given titles.
+
+        Args:
+            *titles (str): The titles, starting below the root.
+
+        Raises:
+            KeyError: If a title is not found.
+        """
+        node = self.root
+        for title in titles:
+            node = node[title]
+        return node
+
+    def chapters(self) -> Iterator[Node]:
+        """Yields all chapters, in the order of the toc."""
+        return self.root.chapters()
+
+    def close(self) -> None:
+        """Closes the archive, if any."""
+        self.source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
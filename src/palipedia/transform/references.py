@@ -0,0 +1,382 @@
+"""Resolves citations to the chapters and elements of a transformation.
+
+The numbers lifted into nr attributes, from titles and hangnum paragraphs, are
+collected into a reference index next to the toc. Every chapter and every element with
+an nr gets a key; the index maps the key to the chapter, the position of the element in
+the chapter in document order, and the byte range of the element within the serialized
+chapter. Keys look like:
+
+    Pitaka 0/Nikaya 0.0/1. Vagga n0/1            the chapter
+    Pitaka 0/Nikaya 0.0/1. Vagga n0/1#12         paragraph or verse 12
+    Pitaka 0/Nikaya 0.0/1. Vagga n0/1#section3   section 3
+    Pitaka 0/Nikaya 0.0/1. Vagga n0/1#section3.subsection2
+                                                 subsection 2 of section 3
+
+The chapter part is the name of the chapter file without its suffix. A paragraph with a
+range of numbers, like nr="12-15", has a key for every number in the range. The numbers
+of sections and subsections restart within their parents, so their keys are qualified
+by the numbered sections and subsections they are in.
+
+Citations name a sutta by its nikaya and number rather than by its file, so every
+element of a chapter whose title starts with a number, like "2. Brahmajālasuttaṃ",
+also has keys built from the hierarchy numbers:
+
+    Nikaya 0.0/2                                 chapter 2 of the nikaya
+    Nikaya 0.0/2#12                              paragraph or verse 12 of chapter 2
+
+The nikaya part is the transliterated title of the nikaya, the directory above the
+book of the chapter. Where chapter numbers restart within the books of a nikaya, or a
+nikaya title is repeated in several pitakas, the first chapter in toc order wins, and
+the others are only found by their file.
+
+The byte ranges are found by scanning the serialized chapters, which are written by
+lxml without comments or CDATA, so no chapter is parsed to build the index, and a lookup
+only reads the bytes of the element it resolves to.
+"""
+import html
+import json
+import re
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from lxml import etree
+from unidecode import unidecode
+
+import palipedia.transform.xml as xml
+from palipedia.transform.archive import ArchiveReader
+from palipedia.transform.flat import UNITS, ChapterSource, parse_nr
+
+INDEX = "references.json"
+
+# A comment, a processing instruction or a tag with its name, attributes and slashes.
+_TAG = re.compile(rb"<!--.*?-->|<\?.*?\?>|<(/?)([^\s/>]+)([^>]*?)(/?)>", re.DOTALL)
+_ATTRIBUTE = re.compile(rb'([^\s=]+)="([^"]*)"')
+# The number of a chapter title, like "12. Brahmajālasuttaṃ" or "3-4. Vagga".
+_CHAPTER_NR = re.compile(r"(\d+(?:-\d+)?)\. ")
+
+
+def elements(data: bytes) -> Iterator[Tuple[str, Dict[str, str], int, int]]:
+    """
+    Yields the elements of a serialized document with their byte ranges.
+
+    Args:
+        data (bytes): The UTF-8 document, as written by lxml.
+
+    Yields:
+        Tuple[str, Dict[str, str], int, int]: The tag, the attributes, and the start
+        and end of every element in document order. The range starts at the start tag
+        and ends after the end tag.
+    """
+    stack = []
+    found = []
+    for m in _TAG.finditer(data):
+        closing, name, attrs, empty = m.groups()
+        if name is None:
+            continue
+        if closing:
+            i = stack.pop()
+            found[i][3] = m.end()
+            continue
+        attributes = {
+            k.decode("utf-8"): html.unescape(v.decode("utf-8"))
+            for k, v in _ATTRIBUTE.findall(attrs)
+        }
+        entry = [name.decode("utf-8"), attributes, m.start(), m.end()]
+        if not empty:
+            stack.append(len(found))
+        found.append(entry)
+    for tag, attributes, start, end in found:
+        yield tag, attributes, start, end
+
+
+def chapter_key(chapter: str) -> str:
+    """
+    Returns the key of a chapter.
+
+    Args:
+        chapter (str): The name of the chapter file, with or without its suffix. Titles
+            with diacritics are transliterated like file names.
+
+    Returns:
+        str: The key.
+    """
+    chapter = unidecode(chapter)
+    return chapter[: -len(".xml")] if chapter.endswith(".xml") else chapter
+
+
+def citation_key(chapter: str, title: Optional[str]) -> Optional[str]:
+    """
+    Returns the chapter part of the citation keys of a chapter, its nikaya and number.
+
+    Args:
+        chapter (str): The name of the chapter file, like
+            "Pitaka 0/Nikaya 0.0/Book/2.xml".
+        title (Optional[str]): The title of the chapter element.
+
+    Returns:
+        Optional[str]: The key, like "Nikaya 0.0/2", None if the title has no number or
+        the chapter is not in a book of a nikaya.
+    """
+    m = _CHAPTER_NR.match(title or "")
+    parts = Path(chapter).parts
+    if m is None or len(parts) < 3:
+        return None
+    return f"{unidecode(parts[-3])}/{m.group(1)}"
+
+
+def reference_key(
+    chapter: str, nr: Optional[str] = None, tag: str = None, within: str = None
+) -> str:
+    """
+    Returns the key of a chapter or of a numbered element of a chapter.
+
+    Args:
+        chapter (str): The name of the chapter file, see chapter_key.
+        nr (Optional[str], optional): The number of a paragraph, verse or other
+            element. Defaults to None, the chapter itself.
+        tag (str, optional): The tag of an element that is not a paragraph or verse,
+            like "section". Defaults to None.
+        within (str, optional): The numbered elements that contain an element that is
+            not a paragraph or verse, like "section3". Defaults to None.
+
+    Returns:
+        str: The key.
+    """
+    key = chapter_key(chapter)
+    if nr is None:
+        return key
+    if tag is None or tag in UNITS:
+        return f"{key}#{nr}"
+    if within:
+        return f"{key}#{within}.{tag}{nr}"
+    return f"{key}#{tag}{nr}"
+
+
+def element_keys(chapter: str, tag: str, nr: str, within: str = None) -> List[str]:
+    """
+    Returns the keys of a numbered element, one more for every number of a paragraph
+    range.
+
+    Args:
+        chapter (str): The name of the chapter file, see chapter_key.
+        tag (str): The tag of the element.
+        nr (str): The nr attribute of the element.
+        within (str, optional): The numbered elements that contain an element that is
+            not a paragraph or verse, see reference_key. Defaults to None.
+
+    Returns:
+        List[str]: The keys.
+    """
+    if tag not in UNITS:
+        return [reference_key(chapter, nr, tag, within)]
+    keys = [reference_key(chapter, nr)]
+    start, end = parse_nr(nr)
+    if f"{start}-{end}" == nr:
+        keys.extend(reference_key(chapter, str(n)) for n in range(start, end + 1))
+    return keys
+
+
+def chapter_keys(name: str, data: bytes) -> Iterator[Tuple[List[str], int, int, int]]:
+    """
+    Yields the keys of a chapter and of its numbered elements, including their
+    citation keys.
+
+    Args:
+        name (str): The name of the chapter file.
+        data (bytes): The serialized chapter.
+
+    Yields:
+        Tuple[List[str], int, int, int]: The keys, position, start and end of the
+        chapter element and of every numbered element, in document order.
+    """
+    # The qualified names and ends of the numbered elements that contain the current
+    # element, outermost first.
+    parents: List[Tuple[str, int]] = []
+    citation = None
+    for position, (tag, attributes, start, end) in enumerate(elements(data)):
+        if position == 0:
+            citation = citation_key(name, attributes.get("title"))
+            keys = [chapter_key(name)]
+            if citation is not None:
+                keys.append(citation)
+            yield keys, position, start, end
+            continue
+        nr = attributes.get("nr")
+        if not nr:
+            continue
+        while parents and parents[-1][1] <= start:
+            parents.pop()
+        within = ".".join(qualified for qualified, _ in parents)
+        keys = element_keys(name, tag, nr, within)
+        if citation is not None:
+            keys.extend(element_keys(citation, tag, nr, within))
+        yield keys, position, start, end
+        if tag not in UNITS:
+            parents.append((f"{tag}{nr}", end))
+
+
+def build_references(dest_dir: str) -> int:
+    """
+    Writes the reference index of a transformation into its output directory.
+
+    Args:
+        dest_dir (str): The output directory of a TipitikaTransformer.
+
+    Returns:
+        int: The number of keys.
+    """
+    dest = Path(dest_dir)
+    keys = {}
+    with ChapterSource(dest) as source:
+        names = source.names()
+        archive = source.toc.get("archive")
+        for i, name in enumerate(names):
+            for found, position, start, end in chapter_keys(name, source.read(name)):
+                for key in found:
+                    # The first element with a number wins, like a paragraph before
+                    # the verse its number was lifted to.
+                    keys.setdefault(key, [i, position, start, end])
+    xml.write_atomic(
+        dest / INDEX,
+        json.dumps(
+            {"archive": archive, "chapters": names, "keys": keys},
+            ensure_ascii=False,
+            separators=(",", ":"),
+        ).encode("utf-8"),
+    )
+    return len(keys)
+
+
+class Reference(NamedTuple):
+    """
+    The element a key resolves to.
+
+    Attributes:
+        chapter (str): The chapter, as referenced by the toc.
+        position (int): The position of the element in the chapter, in document order.
+            The chapter element itself is at position 0.
+        start (int): The offset of the start tag in the serialized chapter.
+        end (int): The offset after the end tag in the serialized chapter.
+    """
+
+    chapter: str
+    position: int
+    start: int
+    end: int
+
+
+class ReferenceIndex:
+    """
+    A reference index written by build_references.
+
+    Resolving a key is a dictionary lookup. Chapters are only read when the content of
+    a reference is asked for, and then only the bytes of the referenced element are
+    read from a chapter file.
+    """
+
+    def __init__(self, dest_dir: str) -> None:
+        """
+        Loads the index, without reading the toc or any chapter.
+
+        Args:
+            dest_dir (str): The output directory of a TipitikaTransformer.
+        """
+        self.dest_dir = Path(dest_dir)
+        with open(self.dest_dir / INDEX, encoding="utf-8") as f:
+            index = json.load(f)
+        self.chapters: List[str] = index["chapters"]
+        self._keys: Dict[str, List[int]] = index["keys"]
+        self._archive_name: Optional[str] = index["archive"]
+        self._archive: Optional[ArchiveReader] = None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._keys
+
+    def resolve(self, key: str) -> Reference:
+        """
+        Resolves a key, see reference_key.
+
+        Args:
+            key (str): The key.
+
+        Returns:
+            Reference: The element the key refers to.
+
+        Raises:
+            KeyError: If the key is unknown.
+        """
+        chapter, position, start, end = self._keys[key]
+        return Reference(self.chapters[chapter], position, start, end)
+
+    def lookup(
+        self,
+        chapter: str,
+        nr: Optional[str] = None,
+        tag: str = None,
+        within: str = None,
+    ) -> Reference:
+        """
+        Resolves a chapter or a numbered element of a chapter.
+
+        Args:
+            chapter (str): The name of the chapter file, see chapter_key, or the
+                nikaya and number of the chapter, see citation_key.
+            nr (Optional[str], optional): The number of the element. Defaults to None,
+                the chapter itself.
+            tag (str, optional): The tag of an element that is not a paragraph or
+                verse. Defaults to None.
+            within (str, optional): The numbered elements that contain it, like
+                "section3", see reference_key. Defaults to None.
+
+        Returns:
+            Reference: The element.
+
+        Raises:
+            KeyError: If there is no such element.
+        """
+        return self.resolve(reference_key(chapter, nr, tag, within))
+
+    def read(self, ref: Reference) -> bytes:
+        """
+        Reads the serialized element of a reference.
+
+        Args:
+            ref (Reference): The reference.
+
+        Returns:
+            bytes: The UTF-8 XML of the element.
+        """
+        if self._archive_name is not None:
+            if self._archive is None:
+                self._archive = ArchiveReader(self.dest_dir / self._archive_name)
+            return self._archive.read(ref.chapter)[ref.start : ref.end]
+        with open(self.dest_dir / ref.chapter, "rb") as f:
+            f.seek(ref.start)
+            return f.read(ref.end - ref.start)
+
+    def element(self, ref: Reference) -> etree._Element:
+        """
+        Reads and parses the element of a reference, but not the rest of its chapter.
+
+        Args:
+            ref (Reference): The reference.
+
+        Returns:
+            etree._Element: The element.
+        """
+        return etree.fromstring(self.read(ref), xml.default_parser())
+
+    def close(self) -> None:
+        """Closes the archive, if it was opened."""
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
@@ -0,0 +1,281 @@
+"""Finds words and phrases in the transformed scriptures with an inverted index.
+
+Every paragraph and verse is a unit, numbered in document order, and every word of a
+unit has a position. The index holds the positions of every word twice: once keyed by
+the normalized word with its diacritics, and once keyed by the word folded to ASCII
+with unidecode, the folding that is used for file names. Searching "samma" in the
+folded keys finds "sammā" and "saṃma".
+
+Each key space is stored as three files: the sorted terms, one per line, the offsets
+of the postings of every term, and the postings themselves, pairs of unit and position
+sorted by unit and position. The arrays are memory mapped, so loading an index reads
+the terms and nothing else.
+"""
+import bisect
+import json
+from array import array
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Tuple
+
+import numpy as np
+from unidecode import unidecode
+
+from palipedia.transform.flat import ChapterSource, parse_nr, unit_text, units
+from palipedia.transform.tokenizer import words
+
+META = "index.json"
+UNITS = "units.npy"
+
+# The key spaces, with diacritics and folded to ASCII.
+EXACT = "exact"
+FOLDED = "folded"
+
+
+def fold_word(word: str) -> str:
+    """Returns a normalized word without its diacritics, like unidecode("saṃgha")."""
+    return unidecode(word)
+
+
+class Hit(NamedTuple):
+    """
+    An occurrence of a word or phrase.
+
+    Attributes:
+        chapter (str): The chapter, as referenced by the toc.
+        nr (Tuple[int, int]): The first and last number of the paragraph or verse, -1,
+            -1 if it has no nr.
+        unit (int): The paragraph or verse, numbered in document order.
+        position (int): The position of the (first) word within the unit.
+    """
+
+    chapter: str
+    nr: Tuple[int, int]
+    unit: int
+    position: int
+
+
+def _keys(postings: np.ndarray) -> np.ndarray:
+    """Packs the unit and position of postings into sortable 64 bit keys."""
+    return (postings[:, 0].astype(np.int64) << 32) | postings[:, 1]
+
+
+def _unpack(keys: np.ndarray) -> np.ndarray:
+    return np.stack([keys >> 32, keys & 0xFFFFFFFF], axis=1).astype(np.int32)
+
+
+def _write_terms(out: Path, space: str, postings: Dict[str, np.ndarray]) -> None:
+    terms = sorted(postings)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(postings[t]) for t in terms])
+    data = [postings[t] for t in terms]
+    np.save(
+        out / f"{space}.postings.npy",
+        np.concatenate(data) if data else np.empty((0, 2), dtype=np.int32),
+    )
+    np.save(out / f"{space}.offsets.npy", offsets)
+    with open(out / f"{space}.terms", "w", encoding="utf-8") as f:
+        f.write("\n".join(terms))
+
+
+def build_index(dest_dir: str, out_dir: str) -> int:
+    """
+    Indexes the paragraphs and verses of a transformation.
+
+    Args:
+        dest_dir (str): The output directory of a TipitikaTransformer.
+        out_dir (str): The directory that receives the index.
+
+    Returns:
+        int: The number of indexed paragraphs and verses.
+    """
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    found = defaultdict(lambda: array("i"))
+    info = array("i")
+    unit = 0
+    with ChapterSource(dest_dir) as source:
+        names = source.names()
+        for chapter, name in enumerate(names):
+            for node in units(source.parse(name)):
+                for position, word in enumerate(words(unit_text(node))):
+                    found[word].extend((unit, position))
+                info.append(chapter)
+                info.extend(parse_nr(node.get("nr")))
+                unit += 1
+
+    exact = {
+        term: np.frombuffer(postings, dtype=np.int32).reshape(-1, 2)
+        for term, postings in found.items()
+    }
+    del found
+    groups = defaultdict(list)
+    for term in exact:
+        groups[fold_word(term)].append(term)
+    folded = {}
+    for key, terms in groups.items():
+        if len(terms) == 1:
+            folded[key] = exact[terms[0]]
+        else:
+            keys = np.concatenate([_keys(exact[t]) for t in terms])
+            keys.sort()
+            folded[key] = _unpack(keys)
+
+    _write_terms(out, EXACT, exact)
+    _write_terms(out, FOLDED, folded)
+    np.save(out / UNITS, np.frombuffer(info, dtype=np.int32).reshape(unit, 3))
+    with open(out / META, "w", encoding="utf-8") as f:
+        json.dump({"units": unit, "chapters": names}, f, ensure_ascii=False)
+    return unit
+
+
+class _Terms:
+    """The terms of a key space, with their memory mapped postings."""
+
+    def __init__(self, path: Path, space: str) -> None:
+        with open(path / f"{space}.terms", encoding="utf-8") as f:
+            text = f.read()
+        self.terms: List[str] = text.split("\n") if text else []
+        self.offsets = np.load(path / f"{space}.offsets.npy", mmap_mode="r")
+        self.postings = np.load(path / f"{space}.postings.npy", mmap_mode="r")
+
+    def get(self, term: str) -> np.ndarray:
+        i = bisect.bisect_left(self.terms, term)
+        if i == len(self.terms) or self.terms[i] != term:
+            return self.postings[:0]
+        return self.postings[self.offsets[i] : self.offsets[i + 1]]
+
+    def prefix(self, prefix: str) -> Tuple[List[str], np.ndarray]:
+        lo = bisect.bisect_left(self.terms, prefix)
+        hi = lo
+        while hi < len(self.terms) and self.terms[hi].startswith(prefix):
+            hi += 1
+        return self.terms[lo:hi], self.postings[self.offsets[lo] : self.offsets[hi]]
+
+
+class SearchIndex:
+    """
+    An index written by build_index, memory mapped.
+
+    Queries are normalized like the indexed text. With fold=True they are folded as
+    well and matched against the folded keys, so diacritics are ignored.
+
+    Attributes:
+        chapters (List[str]): The chapters, as referenced by the toc.
+        units (np.ndarray): The chapter and the first and last number of the nr of every
+            paragraph and verse.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Opens an index.
+
+        Args:
+            path (str): The directory written by build_index.
+        """
+        path = Path(path)
+        with open(path / META, encoding="utf-8") as f:
+            self.chapters: List[str] = json.load(f)["chapters"]
+        self.units = np.load(path / UNITS, mmap_mode="r")
+        self._spaces = {space: _Terms(path, space) for space in (EXACT, FOLDED)}
+
+    def __len__(self) -> int:
+        return len(self.units)
+
+    def postings(self, word: str, fold: bool = False) -> np.ndarray:
+        """
+        Returns the unit and position of every occurrence of a word.
+
+        Args:
+            word (str): The word, normalized like the indexed text.
+            fold (bool, optional): Ignore diacritics. Defaults to False.
+
+        Returns:
+            np.ndarray: The pairs of unit and position, sorted.
+        """
+        key = fold_word(word) if fold else word
+        return self._spaces[FOLDED if fold else EXACT].get(key)
+
+    def hits(self, postings: np.ndarray) -> List[Hit]:
+        """Returns the hits of postings, pairs of unit and position."""
+        info = self.units[postings[:, 0]].tolist()
+        chapters = self.chapters
+        return [
+            Hit(chapters[chapter], (start, end), unit, position)
+            for (chapter, start, end), (unit, position) in zip(
+                info, postings.tolist()
+            )
+        ]
+
+    def term(self, word: str, fold: bool = False) -> List[Hit]:
+        """
+        Finds every occurrence of a word.
+
+        Args:
+            word (str): The word, which is normalized first.
+            fold (bool, optional): Ignore diacritics. Defaults to False.
+
+        Returns:
+            List[Hit]: The occurrences, in document order.
+        """
+        found = words(word)
+        if len(found) != 1:
+            return []
+        return self.hits(self.postings(found[0], fold))
+
+    def phrase(self, text: str, fold: bool = False) -> List[Hit]:
+        """
+        Finds every occurrence of consecutive words within a paragraph or verse.
+
+        Args:
+            text (str): The words, which are normalized first. Punctuation is ignored.
+            fold (bool, optional): Ignore diacritics. Defaults to False.
+
+        Returns:
+            List[Hit]: The occurrences, at the position of the first word, in document
+            order.
+        """
+        found = words(text)
+        if not found:
+            return []
+        # Start with the rarest word, every other word must follow at its offset.
+        postings = [self.postings(word, fold) for word in found]
+        order = sorted(range(len(found)), key=lambda i: len(postings[i]))
+        first = order[0]
+        # Drop occurrences that would start the phrase before the start of the unit.
+        start = postings[first]
+        keys = _keys(start[start[:, 1] >= first]) - first
+        for i in order[1:]:
+            if len(keys) == 0:
+                break
+            keys = np.intersect1d(keys, _keys(postings[i]) - i, assume_unique=True)
+        return self.hits(_unpack(keys))
+
+    def prefix(self, prefix: str, fold: bool = False) -> List[Hit]:
+        """
+        Finds every occurrence of the words that start with a prefix.
+
+        Args:
+            prefix (str): The start of the words, which is normalized first.
+            fold (bool, optional): Ignore diacritics. Defaults to False.
+
+        Returns:
+            List[Hit]: The occurrences, in document order.
+        """
+        found = words(prefix)
+        if len(found) != 1:
+            return []
+        key = fold_word(found[0]) if fold else found[0]
+        _, postings = self._spaces[FOLDED if fold else EXACT].prefix(key)
+        keys = _keys(postings)
+        keys.sort()
+        return self.hits(_unpack(keys))
+
+    def terms(self, prefix: str, fold: bool = False) -> List[str]:
+        """Returns the indexed words that start with a prefix, for completion."""
+        found = words(prefix)
+        if len(found) != 1:
+            return []
+        key = fold_word(found[0]) if fold else found[0]
+        terms, _ = self._spaces[FOLDED if fold else EXACT].prefix(key)
+        return terms
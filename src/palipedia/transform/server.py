@@ -0,0 +1,272 @@
+"""Serves the output of a transformation over HTTP.
+
+    GET /toc.xml                     the toc
+    GET /<chapter>                   a chapter, by its name in the toc
+    GET /<chapter>?nr=12             the first element of the chapter numbered 12
+    GET /<chapter>?nr=3&tag=section  the section numbered 3
+    GET /<chapter>?nr=2&tag=subsection&within=section3
+                                     the subsection numbered 2 of section 3
+
+Elements are sliced from the serialized chapter by their byte range, see
+references.elements, so the chapter is not parsed. Every response carries the hash of
+its body as ETag, and a request whose If-None-Match lists it, or is *, is answered with
+304 Not Modified, which has no body and no Content-Length. Responses are kept in a
+bounded LRU cache; concurrent requests for a response that is not cached yet wait for a
+single read instead of each reading the chapter.
+
+The output directory is expected not to change while it is served, see
+ChapterService.clear.
+"""
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Hashable, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from absl import logging
+
+from palipedia.transform.build import digest
+from palipedia.transform.flat import ChapterSource
+from palipedia.transform.references import chapter_keys, reference_key
+
+TOC = "toc.xml"
+XML = "application/xml; charset=utf-8"
+
+# An entity tag of an If-None-Match list, weak or strong, or the wildcard.
+_ETAG = re.compile(r'\*|(?:W/)?"[^"]*"')
+
+
+class Response(NamedTuple):
+    """
+    A response of the service.
+
+    Attributes:
+        status (int): The HTTP status.
+        body (bytes): The body, empty for 304 Not Modified.
+        etag (Optional[str]): The quoted hash of the body.
+    """
+
+    status: int
+    body: bytes
+    etag: Optional[str] = None
+
+
+class ResponseCache:
+    """
+    A least recently used cache of response bodies and their ETags.
+
+    A body that is not cached is built by the first thread that asks for it; other
+    threads asking for it at the same time wait for that thread.
+
+    Attributes:
+        maxsize (int): The maximum number of responses held by the cache.
+        hits (int): The number of lookups that were served from the cache.
+        misses (int): The number of lookups that had to build the response.
+    """
+
+    def __init__(self, maxsize: int = 256) -> None:
+        """
+        Initializes a new, empty cache.
+
+        Args:
+            maxsize (int, optional): The maximum number of responses held by the cache.
+                Defaults to 256.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._pending: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, build: Callable[[], bytes]) -> Tuple[bytes, str]:
+        """
+        Returns a cached body and its ETag, building the body if needed.
+
+        Args:
+            key (Hashable): Identifies the response.
+            build (Callable[[], bytes]): Builds the body when it is not cached.
+
+        Returns:
+            Tuple[bytes, str]: The body and its ETag.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            pending = self._pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._pending[key] = Future()
+        if not owner:
+            return pending.result()
+
+        try:
+            body = build()
+            entry = body, f'"{digest(body)}"'
+        except BaseException as e:
+            with self._lock:
+                del self._pending[key]
+            pending.set_exception(e)
+            raise
+        with self._lock:
+            del self._pending[key]
+            self.misses += 1
+            if self.maxsize > 0:
+                self._entries[key] = entry
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        pending.set_result(entry)
+        return entry
+
+    def clear(self) -> None:
+        """Drops all cached responses."""
+        with self._lock:
+            self._entries.clear()
+
+
+class ChapterService:
+    """
+    Answers requests for the toc, chapters and numbered elements of chapters.
+
+    Attributes:
+        cache (ResponseCache): The cached responses.
+    """
+
+    def __init__(self, dest_dir: str, cache_size: int = 256) -> None:
+        """
+        Opens the output directory, from chapter files or an archive.
+
+        Args:
+            dest_dir (str): The output directory of a TipitikaTransformer.
+            cache_size (int, optional): The number of responses kept in memory.
+                Defaults to 256.
+        """
+        self.source = ChapterSource(dest_dir)
+        self.cache = ResponseCache(cache_size)
+        self._names = set(self.source.names())
+
+    def get(self, target: str, if_none_match: Optional[str] = None) -> Response:
+        """
+        Answers a GET request.
+
+        Args:
+            target (str): The path and query of the request.
+            if_none_match (Optional[str], optional): The If-None-Match header.
+                Defaults to None.
+
+        Returns:
+            Response: The response.
+        """
+        url = urlsplit(target)
+        name = unquote(url.path).lstrip("/")
+        query = parse_qs(url.query)
+        nr = query.get("nr", [None])[0]
+        tag = query.get("tag", [None])[0]
+        within = query.get("within", [None])[0]
+        if name == TOC:
+            build = (self.source.dest_dir / TOC).read_bytes
+        elif name not in self._names:
+            return Response(HTTPStatus.NOT_FOUND, b"")
+        elif nr is None:
+            build = lambda: self.source.read(name)  # noqa: E731
+        else:
+            build = lambda: self._slice(name, nr, tag, within)  # noqa: E731
+
+        try:
+            body, etag = self.cache.get((name, nr, tag, within), build)
+        except KeyError:
+            return Response(HTTPStatus.NOT_FOUND, b"")
+        if if_none_match is not None and _matches(if_none_match, etag):
+            return Response(HTTPStatus.NOT_MODIFIED, b"", etag)
+        return Response(HTTPStatus.OK, body, etag)
+
+    def _slice(
+        self, name: str, nr: str, tag: Optional[str], within: Optional[str]
+    ) -> bytes:
+        """Returns the first element of a chapter with the key of nr, tag and within."""
+        key = reference_key(name, nr, tag, within)
+        data = self.source.read(name)
+        for keys, position, start, end in chapter_keys(name, data):
+            if position > 0 and key in keys:
+                return data[start:end]
+        raise KeyError(key)
+
+    def clear(self) -> None:
+        """Drops the cached responses, after the output directory changed."""
+        self.cache.clear()
+
+    def close(self) -> None:
+        """Closes the archive, if any."""
+        self.source.close()
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    """Returns whether an If-None-Match header matches an ETag, comparing weakly."""
+    for tag in _ETAG.findall(if_none_match):
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class ChapterHandler(BaseHTTPRequestHandler):
+    """Answers HTTP requests with the ChapterService of the server."""
+
+    server_version = "palipedia"
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def _respond(self, send_body):
+        response = self.server.service.get(
+            self.path, self.headers.get("If-None-Match")
+        )
+        self.send_response(response.status)
+        if response.etag is not None:
+            self.send_header("ETag", response.etag)
+        if response.status == HTTPStatus.OK:
+            self.send_header("Content-Type", XML)
+        if response.status != HTTPStatus.NOT_MODIFIED:
+            self.send_header("Content-Length", str(len(response.body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(response.body)
+
+    def log_message(self, format, *args):
+        logging.debug(format, *args)
+
+
+def make_server(
+    dest_dir: str, host: str = "127.0.0.1", port: int = 8000, cache_size: int = 256
+) -> ThreadingHTTPServer:
+    """
+    Creates a server for the output of a transformation, that handles every request in
+    its own thread.
+
+    Args:
+        dest_dir (str): The output directory of a TipitikaTransformer.
+        host (str, optional): The address to listen on. Defaults to "127.0.0.1".
+        port (int, optional): The port to listen on, 0 picks a free port. Defaults to
+            8000.
+        cache_size (int, optional): The number of responses kept in memory. Defaults
+            to 256.
+
+    Returns:
+        ThreadingHTTPServer: The server, call serve_forever to run it.
+    """
+    server = ThreadingHTTPServer((host, port), ChapterHandler)
+    server.daemon_threads = True
+    server.service = ChapterService(dest_dir, cache_size)
+    return server
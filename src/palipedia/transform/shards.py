@@ -0,0 +1,307 @@
+"""Splits a transformation into shards of training examples, and loads the shards.
+
+Every paragraph and verse is an example: a JSON object with its text, its nr and the
+ids and titles of the collection, pitika, nikaya, book and chapter it belongs to.
+Example i goes to shard i % N, so the shards differ by at most one example, and the
+same corpus always gives the same shards.
+
+Shards are written as JSON lines, or as binary files where every example is prefixed
+with its length as a 32 bit little endian integer. An index, shards.json, lists the
+shards with their format and number of examples.
+"""
+import json
+import queue
+import random
+import struct
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import palipedia.transform.xml as xml
+from palipedia.transform.flat import (
+    LEVELS,
+    ChapterSource,
+    Hierarchy,
+    parse_nr,
+    unit_text,
+)
+
+INDEX = "shards.json"
+FORMATS = {"jsonl": ".jsonl", "binary": ".bin"}
+
+_LENGTH = struct.Struct("<I")
+
+
+def shard_name(shard: int, count: int, fmt: str) -> str:
+    """Returns the file name of a shard, like "shard-00003-of-00016.bin"."""
+    return f"shard-{shard:05}-of-{count:05}{FORMATS[fmt]}"
+
+
+def export_shards(
+    dest_dir: str, out_dir: str, count: int, fmt: str = "binary"
+) -> List[int]:
+    """
+    Writes the examples of a transformation into shards.
+
+    Args:
+        dest_dir (str): The output directory of a TipitikaTransformer.
+        out_dir (str): The directory that receives the shards and the index.
+        count (int): The number of shards.
+        fmt (str, optional): Either "jsonl" or "binary". Defaults to "binary".
+
+    Returns:
+        List[int]: The number of examples in every shard.
+
+    Raises:
+        ValueError: If the format is unknown or count is not positive.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt}, expected one of {list(FORMATS)}.")
+    if count < 1:
+        raise ValueError("At least one shard is needed.")
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    names = [shard_name(i, count, fmt) for i in range(count)]
+    tmps = [xml.temporary_name(out / name) for name in names]
+    sizes = [0] * count
+    files = [open(tmp, "wb") for tmp in tmps]
+    try:
+        with ChapterSource(dest_dir) as source:
+            hierarchy = Hierarchy(source)
+            for i, (node, ids) in enumerate(hierarchy.units()):
+                example = {
+                    "id": i,
+                    "text": unit_text(node),
+                    "nr": parse_nr(node.get("nr")),
+                    "ids": ids,
+                    "titles": [
+                        hierarchy.titles[level][j] if j >= 0 else None
+                        for level, j in zip(LEVELS, ids)
+                    ],
+                }
+                data = json.dumps(example, ensure_ascii=False).encode("utf-8")
+                shard = files[i % count]
+                if fmt == "binary":
+                    shard.write(_LENGTH.pack(len(data)))
+                    shard.write(data)
+                else:
+                    shard.write(data + b"\n")
+                sizes[i % count] += 1
+        for f in files:
+            f.close()
+        for tmp, name in zip(tmps, names):
+            Path(tmp).replace(out / name)
+    finally:
+        for f, tmp in zip(files, tmps):
+            f.close()
+            Path(tmp).unlink(missing_ok=True)
+
+    with open(out / INDEX, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "format": fmt,
+                "levels": LEVELS,
+                "shards": [
+                    {"name": name, "examples": n} for name, n in zip(names, sizes)
+                ],
+            },
+            f,
+            indent=1,
+        )
+    return sizes
+
+
+def read_shard(fname: str, fmt: str) -> Iterator[bytes]:
+    """
+    Yields the encoded examples of a shard, without decoding them.
+
+    Args:
+        fname (str): The shard file.
+        fmt (str): The format of the shard, "jsonl" or "binary".
+
+    Yields:
+        bytes: The JSON of an example.
+    """
+    with open(fname, "rb", buffering=1 << 20) as f:
+        if fmt == "jsonl":
+            for line in f:
+                yield line.rstrip(b"\n")
+            return
+        while True:
+            head = f.read(_LENGTH.size)
+            if not head:
+                return
+            (length,) = _LENGTH.unpack(head)
+            yield f.read(length)
+
+
+def shards_for(worker: int, workers: int, count: int) -> List[int]:
+    """
+    Returns the shards read by one of several data loader workers.
+
+    Args:
+        worker (int): The index of the worker.
+        workers (int): The number of workers.
+        count (int): The number of shards.
+
+    Returns:
+        List[int]: The shards of the worker.
+    """
+    return list(range(worker, count, workers))
+
+
+# Ends the examples of a prefetch thread.
+_END = None
+
+# The number of examples passed from a prefetch thread to the loader at once.
+_CHUNK = 256
+
+_decode = json.JSONDecoder().decode
+
+
+class ShardLoader:
+    """
+    Loads the examples of shards in a seeded, shuffled and resumable order.
+
+    The order of the shards is shuffled for every epoch, and the examples pass through
+    a bounded shuffle buffer. Shards are read by prefetch threads, each with its own
+    bounded queue; the queues are consumed in a fixed rotation, so the order only
+    depends on the seed, the epoch and the shards. Examples are decoded when they leave
+    the shuffle buffer, so resuming skips examples without decoding them.
+
+    Attributes:
+        position (int): The number of examples yielded in the current epoch.
+    """
+
+    def __init__(
+        self,
+        shards_dir: str,
+        shards: Optional[Sequence[int]] = None,
+        seed: int = 0,
+        epoch: int = 0,
+        position: int = 0,
+        buffer_size: int = 10000,
+        prefetch: int = 2,
+        queue_size: int = 1024,
+    ) -> None:
+        """
+        Initializes the loader.
+
+        Args:
+            shards_dir (str): The directory written by export_shards.
+            shards (Optional[Sequence[int]], optional): The shards to read, see
+                shards_for. Defaults to all shards.
+            seed (int, optional): Seeds the order. Defaults to 0.
+            epoch (int, optional): The epoch, every epoch has a different order.
+                Defaults to 0.
+            position (int, optional): The number of examples of the epoch to skip,
+                as returned by state. Defaults to 0.
+            buffer_size (int, optional): The size of the shuffle buffer. Defaults to
+                10000.
+            prefetch (int, optional): The number of threads reading shards. Defaults
+                to 2.
+            queue_size (int, optional): The number of examples read ahead by every
+                prefetch thread. Defaults to 1024.
+        """
+        self.shards_dir = Path(shards_dir)
+        with open(self.shards_dir / INDEX, encoding="utf-8") as f:
+            self.index = json.load(f)
+        if shards is None:
+            shards = range(len(self.index["shards"]))
+        self.shards = list(shards)
+        self.seed = seed
+        self.epoch = epoch
+        self.position = position
+        self.buffer_size = max(1, buffer_size)
+        self.prefetch = max(1, prefetch)
+        self.queue_size = max(2, queue_size)
+
+    def __len__(self) -> int:
+        return sum(self.index["shards"][i]["examples"] for i in self.shards)
+
+    def state(self) -> Dict[str, int]:
+        """Returns the arguments that resume the loader where it is now."""
+        return {"seed": self.seed, "epoch": self.epoch, "position": self.position}
+
+    def set_epoch(self, epoch: int) -> None:
+        """Starts another epoch from its first example."""
+        self.epoch = epoch
+        self.position = 0
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Yields the remaining examples of the epoch."""
+        rng = random.Random(f"{self.seed}:{self.epoch}")
+        order = list(self.shards)
+        rng.shuffle(order)
+        skip = self.position
+        buffer = []
+        size = self.buffer_size
+        for chunk in self._prefetched(order):
+            for data in chunk:
+                if len(buffer) < size:
+                    buffer.append(data)
+                    continue
+                j = rng.randrange(size)
+                data, buffer[j] = buffer[j], data
+                if skip:
+                    skip -= 1
+                    continue
+                self.position += 1
+                yield _decode(data.decode("utf-8"))
+        rng.shuffle(buffer)
+        for data in buffer[skip:]:
+            self.position += 1
+            yield _decode(data.decode("utf-8"))
+
+    def _prefetched(self, order: List[int]) -> Iterator[List[bytes]]:
+        """Yields chunks of the examples of the shards, read by the prefetch threads."""
+        threads = min(self.prefetch, len(order))
+        if threads == 0:
+            return
+        size = max(2, self.queue_size // _CHUNK)
+        queues = [queue.Queue(maxsize=size) for _ in range(threads)]
+        stop = threading.Event()
+        errors = []
+
+        def read(shards, q):
+            try:
+                chunk = []
+                for shard in shards:
+                    name = self.shards_dir / self.index["shards"][shard]["name"]
+                    for data in read_shard(name, self.index["format"]):
+                        chunk.append(data)
+                        if len(chunk) == _CHUNK:
+                            if stop.is_set():
+                                return
+                            q.put(chunk)
+                            chunk = []
+                if chunk:
+                    q.put(chunk)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                q.put(_END)
+
+        workers = [
+            threading.Thread(target=read, args=(order[k::threads], q), daemon=True)
+            for k, q in enumerate(queues)
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            active = list(queues)
+            while active:
+                for q in list(active):
+                    chunk = q.get()
+                    if chunk is _END:
+                        active.remove(q)
+                    else:
+                        yield chunk
+            if errors:
+                raise errors[0]
+        finally:
+            stop.set()
+            for q in queues:
+                # Unblock readers that wait for room in a full queue.
+                while not q.empty():
+                    q.get_nowait()
@@ -0,0 +1,285 @@
+"""Records timings and counters of a transformation, and reports them as JSON."""
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+from lxml import etree
+
+
+class _Stage:
+    """Times a single stage, see RunStats.stage."""
+
+    def __init__(self, stats: "RunStats", name: str) -> None:
+        self._stats = stats
+        self._name = name
+        self._elements = 0
+
+    def elements(self, tree: etree._Element) -> None:
+        """Records the number of elements in a tree handled by the stage."""
+        self._elements += sum(1 for _ in tree.iter())
+
+    def __enter__(self):
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self._stats._add_stage(
+            self._name,
+            time.perf_counter() - self._wall,
+            time.thread_time() - self._cpu,
+            self._elements,
+        )
+
+
+class _Chapter:
+    """Times a single chapter, see RunStats.chapter."""
+
+    def __init__(self, stats: "RunStats", name: str) -> None:
+        self._stats = stats
+        self._name = name
+
+    def __enter__(self):
+        self._stats._local.chapter = self._stats._new_chapter(self._name)
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        record = self._stats._local.chapter
+        self._stats._local.chapter = None
+        record["wall"] += time.perf_counter() - self._wall
+        record["cpu"] += time.thread_time() - self._cpu
+
+
+class RunStats:
+    """
+    Timings and counters of a transformation.
+
+    Wall and CPU time, and the number of elements handled, are recorded per stage
+    (parsing, XSLT, cleanup, writing) and per chapter. The stats can be shared between
+    threads; the stats of worker processes are sent to the main process with take and
+    merge.
+
+    Attributes:
+        enabled (bool): Whether anything is recorded.
+        slowest (int): The number of slowest chapters listed separately in the report.
+    """
+
+    enabled = True
+
+    def __init__(self, slowest: int = 10) -> None:
+        """
+        Initializes empty stats.
+
+        Args:
+            slowest (int, optional): The number of slowest chapters listed separately in
+                the report. Defaults to 10.
+        """
+        self.slowest = slowest
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._stages = defaultdict(
+            lambda: {"calls": 0, "wall": 0.0, "cpu": 0.0, "elements": 0}
+        )
+        self._chapters = {}
+        self._counters = defaultdict(int)
+
+    def stage(self, name: str) -> _Stage:
+        """
+        Returns a context manager that times a stage, for example:
+
+            with stats.stage("xslt") as stage:
+                root = xslt(tree).getroot()
+                stage.elements(root)
+
+        Args:
+            name (str): The name of the stage.
+
+        Returns:
+            _Stage: The context manager.
+        """
+        return _Stage(self, name)
+
+    def chapter(self, name: str) -> _Chapter:
+        """
+        Returns a context manager that times a chapter. Stages and bytes recorded by the
+        same thread while it is active are attributed to the chapter.
+
+        Args:
+            name (str): The name of the chapter.
+
+        Returns:
+            _Chapter: The context manager.
+        """
+        return _Chapter(self, name)
+
+    def count(self, name: str, n: int = 1) -> None:
+        """
+        Increments a counter.
+
+        Args:
+            name (str): The name of the counter.
+            n (int, optional): The increment. Defaults to 1.
+        """
+        with self._lock:
+            self._counters[name] += n
+
+    def read(self, fname: str) -> None:
+        """Records that a file was read."""
+        self._add_bytes("bytes_read", os.stat(fname).st_size)
+
+    def written(self, fname: str, size: Optional[int] = None) -> None:
+        """Records that a file was written, size defaults to the size of the file."""
+        if size is None:
+            size = os.stat(fname).st_size
+        self._add_bytes("bytes_written", size)
+
+    def _add_bytes(self, name: str, size: int) -> None:
+        with self._lock:
+            self._counters[name] += size
+            chapter = getattr(self._local, "chapter", None)
+            if chapter is not None:
+                chapter[name] += size
+
+    def _new_chapter(self, name: str) -> Dict[str, Any]:
+        record = {
+            "name": name,
+            "wall": 0.0,
+            "cpu": 0.0,
+            "elements": 0,
+            "bytes_read": 0,
+            "bytes_written": 0,
+            "stages": {},
+        }
+        with self._lock:
+            self._chapters[name] = record
+        return record
+
+    def _add_stage(self, name: str, wall: float, cpu: float, elements: int) -> None:
+        with self._lock:
+            stage = self._stages[name]
+            stage["calls"] += 1
+            stage["wall"] += wall
+            stage["cpu"] += cpu
+            stage["elements"] += elements
+            chapter = getattr(self._local, "chapter", None)
+            if chapter is not None:
+                chapter["elements"] += elements
+                chapter["stages"][name] = chapter["stages"].get(name, 0.0) + wall
+
+    def take(self) -> Dict[str, Any]:
+        """
+        Returns everything recorded so far and starts over, used to send the stats of a
+        worker process to the main process.
+
+        Returns:
+            Dict[str, Any]: The recorded stages, chapters and counters.
+        """
+        with self._lock:
+            data = {
+                "stages": dict(self._stages),
+                "chapters": list(self._chapters.values()),
+                "counters": dict(self._counters),
+            }
+            self._reset()
+        return data
+
+    def merge(self, data: Optional[Dict[str, Any]]) -> None:
+        """
+        Adds stats taken from another RunStats.
+
+        Args:
+            data (Optional[Dict[str, Any]]): The result of take, or None.
+        """
+        if not data:
+            return
+        with self._lock:
+            for name, stage in data["stages"].items():
+                for key, value in stage.items():
+                    self._stages[name][key] += value
+            for chapter in data["chapters"]:
+                self._chapters[chapter["name"]] = chapter
+            for name, value in data["counters"].items():
+                self._counters[name] += value
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Summarizes the stats.
+
+        Returns:
+            Dict[str, Any]: The report, which can be serialized as JSON.
+        """
+        with self._lock:
+            chapters = sorted(self._chapters.values(), key=lambda c: c["name"])
+            return {
+                "wall": time.perf_counter() - self._wall,
+                "cpu": time.process_time() - self._cpu,
+                "stages": dict(self._stages),
+                "counters": dict(self._counters),
+                "slowest": sorted(chapters, key=lambda c: c["wall"], reverse=True)[
+                    : self.slowest
+                ],
+                "chapters": chapters,
+            }
+
+    def write(self, fname: str) -> None:
+        """
+        Writes the report as JSON.
+
+        Args:
+            fname (str): The file to write.
+        """
+        with open(fname, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=1)
+
+
+class _NullContext:
+    """A context manager that does nothing, shared by every NullStats call."""
+
+    def elements(self, tree: etree._Element) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        pass
+
+
+_NULL_CONTEXT = _NullContext()
+
+
+class NullStats:
+    """Stats that record nothing, so that disabled instrumentation is almost free."""
+
+    enabled = False
+
+    def stage(self, name: str) -> _NullContext:
+        return _NULL_CONTEXT
+
+    def chapter(self, name: str) -> _NullContext:
+        return _NULL_CONTEXT
+
+    def count(self, name: str, n: int = 1) -> None:
+        pass
+
+    def read(self, fname: str) -> None:
+        pass
+
+    def written(self, fname: str, size: Optional[int] = None) -> None:
+        pass
+
+    def take(self) -> None:
+        return None
+
+    def merge(self, data: Optional[Dict[str, Any]]) -> None:
+        pass
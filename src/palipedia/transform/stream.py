@@ -0,0 +1,249 @@
+"""Transforms chapter files with bounded memory, by streaming them through iterparse.
+
+The stylesheet only matches elements such as paragraphs and does not look at their
+context, so every top level matched element can be transformed on its own. This turns a
+source file into a flat stream of transformed items, which is exactly what the
+stylesheet produces for the whole document. All cleanup rules only relate siblings to
+each other, and siblings never cross a top level section marker, so the stream can be
+cut into segments at these markers and every segment can be cleaned up and written
+independently.
+"""
+import contextlib
+import os
+import re
+from typing import Callable, Iterator, List, Optional, Set
+
+from absl import logging
+from lxml import etree
+
+import palipedia.transform.xml as xml
+
+# Tags that start a new independent segment of a chapter.
+SECTION = "section"
+SUBSECTION = "subsection"
+
+_WRAPPER = "w"
+
+
+def template_tags(xslt_doc: etree._Element) -> Set[str]:
+    """
+    Returns the tags of the elements matched by the templates of a stylesheet.
+
+    Args:
+        xslt_doc (etree._Element): The root element of the stylesheet.
+
+    Returns:
+        Set[str]: The tag names that have a template, ignoring predicates.
+    """
+    tags = set()
+    for template in xslt_doc.iter("{http://www.w3.org/1999/XSL/Transform}template"):
+        m = re.match(r"[A-Za-z_][\w.\-]*$", template.get("match", "").split("[")[0])
+        if m and m.group(0) != "text":
+            tags.add(m.group(0))
+    return tags
+
+
+def iter_transformed(
+    fname: str, xslt: etree.XSLT, matched: Set[str]
+) -> Iterator[etree._Element]:
+    """
+    Streams a source file through a stylesheet, yielding the top level result elements.
+
+    Every yielded element is final, that is its tail will not change anymore. Processed
+    source elements are removed from the tree as soon as their tail has been read.
+
+    Args:
+        fname (str): The source file to transform.
+        xslt (etree.XSLT): The stylesheet, it may only use context free templates.
+        matched (Set[str]): The tags of the elements matched by the stylesheet.
+
+    Returns:
+        Iterator[etree._Element]: The elements of the transformed document, in order.
+    """
+    logging.info("streaming %s", fname)
+    last = None  # Most recent output element, it receives the text that follows.
+    pending = None  # (element, is_tail) whose text is complete at the next event.
+    inside = None  # The top level matched element that is being parsed.
+
+    def emit_text(text: Optional[str]) -> None:
+        if text and last is not None:
+            last.tail = (last.tail or "") + text
+
+    with open(fname, "rb") as f:
+        for event, elem in etree.iterparse(
+            f,
+            events=("start", "end"),
+            remove_blank_text=True,
+            remove_comments=True,
+            remove_pis=True,
+        ):
+            if inside is not None and elem is not inside:
+                continue
+
+            if pending is not None:
+                source, is_tail = pending
+                pending = None
+                if is_tail:
+                    emit_text(source.tail)
+                    parent = source.getparent()
+                    if parent is not None:
+                        parent.remove(source)
+                else:
+                    emit_text(source.text)
+
+            if event == "start":
+                if elem.tag in matched:
+                    inside = elem
+                else:
+                    pending = (elem, False)
+                continue
+
+            if elem is inside:
+                inside = None
+                result = xslt(elem).getroot()
+                emit_text(result.text)
+                for item in list(result):
+                    if last is not None:
+                        yield last
+                    last = item
+            pending = (elem, True)
+
+    if last is not None:
+        yield last
+
+
+def segments(items: Iterator[etree._Element]) -> Iterator[List[etree._Element]]:
+    """
+    Groups a stream of transformed items into segments that can be cleaned up
+    independently.
+
+    A new segment starts at every top level section. Subsections that come before the
+    first section adopt every element that follows them, so once the first section is
+    seen after such a subsection, the rest of the stream is a single segment.
+
+    Args:
+        items (Iterator[etree._Element]): The transformed items of a chapter.
+
+    Returns:
+        Iterator[List[etree._Element]]: The segments, in order.
+    """
+    segment = []
+    adopting = False  # An earlier top level subsection adopts all that follows.
+    seen_section = False
+    for item in items:
+        boundary = False
+        if item.tag == SECTION:
+            boundary = not adopting
+            seen_section = True
+        elif item.tag == SUBSECTION and not seen_section:
+            boundary = True
+            adopting = True
+        if boundary and segment:
+            yield segment
+            segment = []
+        segment.append(item)
+
+    if segment:
+        yield segment
+
+
+class ChapterWriter:
+    """
+    Writes a chapter file one top level element at a time.
+
+    Every element is serialized inside a temporary parent, so it is indented exactly as
+    it would be when the whole chapter is written with xml.write_xml.
+    """
+
+    def __init__(self, fname: str, title: str) -> None:
+        """
+        Opens the chapter file for writing.
+
+        Args:
+            fname (str): The file to write.
+            title (str): The title of the chapter.
+        """
+        logging.info("Writing %s", fname)
+        # Written to a temporary file that replaces fname once the chapter is complete.
+        self._fname = fname
+        self._tmp = xml.temporary_name(fname)
+        self._file = open(self._tmp, "wb")
+        self._empty = True
+        start = etree.tostring(
+            etree.Element("chapter", {"title": title}), encoding="utf-8"
+        )
+        self._start = start[: -len(b"/>")]
+        self._file.write(b"<?xml version='1.0' encoding='UTF-8'?>\n")
+
+    def write(self, elem: etree._Element) -> None:
+        """
+        Appends a top level element to the chapter.
+
+        Args:
+            elem (etree._Element): The element to write, including its tail.
+        """
+        if self._empty:
+            self._file.write(self._start + b">")
+            self._empty = False
+        wrapper = etree.Element(_WRAPPER)
+        wrapper.append(elem)
+        raw = etree.tostring(wrapper, encoding="utf-8", pretty_print=True)
+        body = raw[len(b"<w>") : raw.rindex(b"</w>")]
+        self._file.write(body[:-1] if body.endswith(b"\n") else body)
+
+    def close(self) -> None:
+        """Finishes the chapter, closes the file and moves it into place."""
+        try:
+            if self._empty:
+                self._file.write(self._start + b"/>\n")
+            else:
+                self._file.write(b"\n</chapter>\n")
+            self._file.close()
+            os.replace(self._tmp, self._fname)
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self) -> None:
+        """Closes and removes the unfinished chapter, leaving fname untouched."""
+        self._file.close()
+        with contextlib.suppress(OSError):
+            os.remove(self._tmp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def stream_chapter(
+    fname: str,
+    title: str,
+    dest: str,
+    xslt: etree.XSLT,
+    matched: Set[str],
+    cleanup: Callable[[etree._Element], etree._Element],
+) -> None:
+    """
+    Transforms a chapter file and writes the result, keeping a single segment in memory.
+
+    Args:
+        fname (str): The chapter source file.
+        title (str): The title of the chapter.
+        dest (str): The file to write.
+        xslt (etree.XSLT): The stylesheet to apply.
+        matched (Set[str]): The tags of the elements matched by the stylesheet.
+        cleanup (Callable[[etree._Element], etree._Element]): Cleans up a document
+            element holding the items of a segment, and returns it.
+    """
+    with ChapterWriter(dest, title) as writer:
+        for segment in segments(iter_transformed(fname, xslt, matched)):
+            doc = etree.Element("doc")
+            for item in segment:
+                doc.append(item)
+            for unit in list(cleanup(doc)):
+                writer.write(unit)
@@ -2,91 +2,576 @@
 import importlib.resources as pkg_resources
 import os
 import re
+import threading
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Sequence, Tuple
 
+from absl import logging
 from lxml import etree
 from unidecode import unidecode
 
 import palipedia.data
+import palipedia.transform.stream as stream
 import palipedia.transform.xml as xml
-from palipedia.dirtools import InDirectory
+from palipedia.transform.archive import ArchiveReader, ArchiveWriter
+from palipedia.transform.build import BuildManifest, digest, file_digest
+from palipedia.transform.cache import TreeCache
+from palipedia.transform.merkle import MerkleManifest
+from palipedia.transform.normalize import normalizer
+from palipedia.transform.references import build_references
+from palipedia.transform.stats import NullStats, RunStats
+from palipedia.transform.writer import AsyncWriter
 from pathlib import Path
 
+# Bump this whenever a change in the transformation changes the output, so that
+# incremental builds regenerate every chapter.
+PIPELINE_VERSION = 1
+
+# Titles that start with a number, like "12. Brahmajālasuttaṃ".
+_TITLE_NR = re.compile(r"([0-9\-]*)\. (.*)")
+
+_INCLUDE = "{" + xml.XI + "}include"
+
+# The attributes of toc elements that the tocs of all scripts share.
+_STRUCTURE = ("src", "action", "text")
+
 
 class TipitikaTransformer:
-    """Transforms the Pali scriptures data into a usable XML tree."""
+    """Transforms the Pali scriptures data into a usable XML tree.
+
+    Source paths are resolved against the directory of the toc file, the working
+    directory is never changed. Distinct transformers can run concurrently, a single
+    transformer runs one transformation at a time.
+    """
 
-    def __init__(self, toc_file: str, dest_dir: str):
+    # Dispatch table of the chapter cleanup, the rule that handles elements with a tag.
+    # Elements that are removed are not descended into.
+    _CLEANUP_RULES = {
+        "chapter": "remove",
+        "book": "remove",
+        "nikaya": "remove",
+        "section": "section",
+        "subsection": "subsection",
+        "verse": "verse",
+        "number": "number",
+    }
+
+    def __init__(
+        self,
+        toc_file: str,
+        dest_dir: str,
+        workers: int = 1,
+        incremental: bool = True,
+        cache_size: int = 64,
+        streaming: bool = False,
+        pool: str = "process",
+        stats: RunStats = None,
+        writers: int = 0,
+        archive: str = None,
+        references: bool = False,
+        scripts: Sequence[str] = (),
+        merkle: bool = False,
+        normalize: str = None,
+    ):
         """Initialize the transformer.
 
         Args:
             toc_file: The table of contents file for the scriptures.
             dest_dir: The directory where the resulting XML tree will be saved.
+            workers: The number of processes or threads used to transform chapters.
+                With a single worker all chapters are transformed in this thread.
+            incremental: Skip chapters that are unchanged since the last transformation
+                into dest_dir.
+            cache_size: The number of parsed and transformed source trees that are kept
+                in memory, for sources that are referenced more than once.
+            streaming: Stream chapters through the transformation, so that only a single
+                section of a chapter is kept in memory.
+            pool: Either "process" or "thread", the kind of pool used by multiple
+                workers. Threads avoid sending data between processes, and run
+                concurrently while lxml parses and transforms.
+            stats: Records timings and counters of the transformation, nothing is
+                recorded when this is None.
+            writers: The number of background threads that write chapter files, so
+                that transforming and writing overlap. With 0 writers every chapter is
+                written before the next one is transformed. Streamed chapters and
+                chapters transformed by worker processes are always written directly.
+            archive: The name of an archive file in dest_dir that receives all
+                chapters, instead of writing a file per chapter. The toc references the
+                archive entries by the names it uses for chapter files otherwise.
+                Chapters in an archive are always transformed again.
+            references: Write a reference index of the numbered elements of all
+                chapters next to the toc, see references.build_references.
+            scripts: Other scripts to transform along with the one of toc_file, by the
+                name of their directory next to the directory of toc_file, like "deva"
+                next to "romn". Their tocs must have the structure of toc_file, and are
+                walked together with it. Every script, including the one of toc_file,
+                is written to a subdirectory of dest_dir named after it, and the
+                chapters of every script are named after the titles in toc_file. The
+                chapters of all scripts are transformed by the same workers.
+            merkle: Write a Merkle tree of the content hashes of the output, and a feed
+                of the files and directories that changed since the previous run, see
+                merkle.MerkleManifest.
+            normalize: The name of a profile in normalize.PROFILES, applied to the text
+                and titles of every chapter and the titles of the toc, so that the
+                indexes and exports of the output read normalized text. The chapter
+                files are still named after the titles of the source. None leaves the
+                text as the stylesheet writes it.
         """
+        if pool not in ("process", "thread"):
+            raise ValueError(f"Unknown pool {pool}, expected process or thread.")
+        if archive is not None and streaming:
+            raise ValueError("Streamed chapters cannot be written to an archive.")
         cleanup_xsl = pkg_resources.read_text(palipedia.data, "cleanup.xsl")
-        self.xlst = etree.XSLT(etree.fromstring(cleanup_xsl))
+        self._cleanup_xsl = cleanup_xsl
+        self._local = threading.local()
+        self.xsl_tags = stream.template_tags(etree.fromstring(cleanup_xsl))
+        self.pipeline = {
+            "version": PIPELINE_VERSION,
+            "xsl": digest(cleanup_xsl.encode("utf-8")),
+        }
+        self.normalize = normalize
+        self._normalizer = None
+        if normalize is not None:
+            self._normalizer = normalizer(normalize)
+            self.pipeline["normalize"] = normalize
         self.toc_file = Path(toc_file).resolve()
         self.dest_dir = Path(dest_dir).resolve()
+        self.workers = workers
+        self.incremental = incremental
+        self.cache = TreeCache(cache_size)
+        self.streaming = streaming
+        self.pool = pool
+        self.stats = stats if stats is not None else NullStats()
+        self.writers = writers
+        self._writer = None
+        self.archive = archive
+        self._archive = None
+        self.references = references
+        self.merkle = merkle
+        self._jobs = None
+        self._manifest = None
+        self._written = set()
+        # Transliterated titles, every title is passed to unidecode once.
+        self._ascii = {}
+        # The transformers of the other scripts, which share the stylesheet, the cache
+        # and the stats of this one.
+        self._scripts = []
+        if scripts:
+            script_dir = self.toc_file.parent
+            self.dest_dir = self.dest_dir / script_dir.name
+            for script in scripts:
+                other = TipitikaTransformer(
+                    script_dir.parent / script / self.toc_file.name,
+                    Path(dest_dir).resolve() / script,
+                    workers,
+                    incremental,
+                    0,
+                    streaming,
+                    pool,
+                    stats,
+                    writers,
+                    archive,
+                    references,
+                    merkle=merkle,
+                    normalize=normalize,
+                )
+                other._local = self._local
+                other.cache = self.cache
+                self._scripts.append(other)
+
+    @property
+    def xlst(self):
+        """The compiled stylesheet. XSLT objects are not shared between threads."""
+        xslt = getattr(self._local, "xslt", None)
+        if xslt is None:
+            xslt = etree.XSLT(etree.fromstring(self._cleanup_xsl))
+            self._local.xslt = xslt
+        return xslt
 
     def transform(self):
         """Transform the Pali scriptures data into an XML tree."""
-        dirname = self.toc_file.parent
-        basename = self.toc_file.name
+        runs = [self] + self._scripts
+        trees = []
+        try:
+            for run in runs:
+                trees.append(run._start())
+            lanes = [
+                (run._parse(run.toc_file), tree, run.toc_file.parent, run)
+                for run, tree in zip(self._scripts, trees[1:])
+            ]
+            base = self.toc_file.parent
+            self._proc_tree(
+                self._parse(self.toc_file), trees[0], 0, Path(), base, lanes
+            )
+
+            if self._jobs is not None:
+                self._run_jobs(runs)
+            for run, tree in zip(runs, trees):
+                if run._archive is not None:
+                    # Threads add chapters as they finish, the archive follows the toc.
+                    run._archive.close(e.get("href") for e in tree.iter(_INCLUDE))
+        finally:
+            for run in runs:
+                run._close()
+
+        for run, tree in zip(runs, trees):
+            run._finish(tree)
+        logging.info(
+            "Tree cache: %d hits, %d misses", self.cache.hits, self.cache.misses
+        )
+        self.stats.count("cache_hits", self.cache.hits)
+        self.stats.count("cache_misses", self.cache.misses)
+
+    def _start(self):
+        """Prepares the output of a transformation, and returns the empty toc."""
         tree = etree.Element("root", {}, {"xi": xml.XI})
-        with InDirectory(dirname) as d:
-            self._proc_tree(xml.parse(basename), tree, 0)
+        if self.workers > 1:
+            # Chapters are collected while walking the toc, and transformed
+            # once the whole structure is known.
+            self._jobs = {}
+        if self.incremental and self.archive is None:
+            self._manifest = BuildManifest(self.dest_dir, self.pipeline)
+        self._written = set()
+        if self.archive is not None:
+            tree.set("archive", self.archive)
+            self.dest_dir.mkdir(parents=True, exist_ok=True)
+            self._archive = ArchiveWriter(self.dest_dir / self.archive)
+        elif self.writers > 0:
+            self._writer = AsyncWriter(self.writers)
+        return tree
+
+    def _close(self):
+        """Waits for the writers, and discards an archive that was not closed."""
+        # Every chapter is on disk, or the error of a writer is raised, before
+        # the toc refers to them.
+        if self._writer is not None:
+            writer, self._writer = self._writer, None
+            writer.close()
+        if self._archive is not None:
+            archive, self._archive = self._archive, None
+            archive.abort()
+
+    def _finish(self, tree):
+        """Writes the toc once all chapters are written."""
+        toc = self.dest_dir / "toc.xml"
+        with self.stats.stage("write"):
+            xml.write_xml(toc, tree)
+        self.stats.written(toc)
+        if self.references:
+            with self.stats.stage("references"):
+                build_references(self.dest_dir)
+        if self.merkle:
+            chapters = [node.get("href") for node in tree.iter(_INCLUDE)]
+            with self.stats.stage("merkle"):
+                manifest = MerkleManifest(self.dest_dir)
+                if self.archive is not None:
+                    with ArchiveReader(self.dest_dir / self.archive) as archive:
+                        manifest.update(chapters, archive.read)
+                else:
+                    manifest.update(chapters)
+        if self._manifest is not None:
+            self._manifest.save()
+            self._manifest = None
+
+    def _run_jobs(self, runs):
+        """Transforms the collected chapters of every script using a pool of workers.
+
+        Args:
+            runs: The transformers of the scripts, starting with this one. Their
+                chapters are collected in a dictionary from output file name to
+                (action, title, entry) tuples.
+        """
+        todo = []
+        for i, run in enumerate(runs):
+            jobs = [
+                (i, name, (action, title))
+                for name, (action, title, entry) in run._jobs.items()
+                if not run._up_to_date(name, entry)
+            ]
+            self.stats.count("chapters_skipped", len(run._jobs) - len(jobs))
+            todo.extend(jobs)
+        if self.pool == "thread":
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for _ in pool.map(
+                    lambda job: runs[job[0]]._write_chapter(*job[2], job[1]), todo
+                ):
+                    pass
+        else:
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(
+                    [(str(run.toc_file), str(run.dest_dir)) for run in runs],
+                    self.streaming,
+                    self.stats.enabled,
+                    self._archive is not None,
+                    self.normalize,
+                ),
+            ) as pool:
+                for i, name, data, stats in pool.map(_transform_chapter, todo):
+                    if data is not None:
+                        runs[i]._archive.add(name, data)
+                    self.stats.merge(stats)
+
+        for run in runs:
+            if run._manifest is not None:
+                for name, (_, _, entry) in run._jobs.items():
+                    run._manifest.record(name, entry)
+            run._jobs = None
+
+    def _up_to_date(self, name, entry):
+        """Whether the chapter written to name during a previous run can be reused."""
+        return (
+            self._manifest is not None
+            and name not in self._written
+            and self._manifest.up_to_date(name, entry)
+        )
 
-        xml.write_xml(self.dest_dir / "toc.xml", tree)
+    def _chapter_entry(self, action, title):
+        """Describes the inputs of a chapter, as recorded in the build manifest."""
+        if self._manifest is None:
+            return None
+        return {"source": file_digest(action), "title": title}
 
-    def _proc_tree(self, tree, nxt, depth):
+    def _proc_tree(self, tree, nxt, depth, path, base, lanes=()):
+        """Converts the toc tree into the output tree.
+
+        Args:
+            tree: The toc element whose children are converted.
+            nxt: The output element that receives the converted children.
+            depth: The depth of the children in the toc.
+            path: The transliterated path of nxt, used to name the chapter files.
+            base: The directory that relative source paths are resolved against.
+            lanes: The toc elements of the other scripts that correspond to tree, as
+                (tree, nxt, base, transformer) tuples, converted along with tree.
+        """
         tagl = ["collection", "pitika", "nikaya", "book", "chapter"]
-        for node in tree:
+        for i, node in enumerate(tree):
+            others = [
+                (_corresponding(other, i, node, run), other_nxt, other_base, run)
+                for other, other_nxt, other_base, run in lanes
+            ]
             if len(node.attrib) == 0:
-                self._proc_tree(node, nxt, depth + 1)
+                self._proc_tree(node, nxt, depth + 1, path, base, others)
                 continue
 
-            subtree = etree.SubElement(
-                nxt, tagl[depth], {"title": xml.xstr(node.get("text"))}
-            )
+            title = xml.xstr(node.get("text"))
+            if "action" in node.attrib and "src" not in node.attrib:
+                # This is a chapter with the actual sutta
+                fname = str((path / self._transliterate(title)).with_suffix(".xml"))
+                self._add_chapter(
+                    base / node.get("action"), self._title(title), fname, nxt
+                )
+                for other, other_nxt, other_base, run in others:
+                    run._add_chapter(
+                        other_base / other.get("action"),
+                        run._title(xml.xstr(other.get("text"))),
+                        fname,
+                        other_nxt,
+                    )
+                continue
+
+            subtree = etree.SubElement(nxt, tagl[depth], {"title": self._title(title)})
+            subtree_path = path / self._transliterate(title)
+            others = [
+                (
+                    other,
+                    etree.SubElement(
+                        other_nxt,
+                        tagl[depth],
+                        {"title": run._title(xml.xstr(other.get("text")))},
+                    ),
+                    other_base,
+                    run,
+                )
+                for other, other_nxt, other_base, run in others
+            ]
             if "src" in node.attrib:
                 # We are still indexing.
-                next_tree = xml.parse(node.get("src"))
-                self._proc_tree(next_tree, subtree, depth + 1)
-            elif "action" in node.attrib:
-                # This is a chapter with the actual sutta
-                next_tree = xml.parse(node.get("action"))
-                nodes = self._proc_chapter(next_tree)
-                subtree.tag = "chapter"
-                subtree.getparent().tag = "book"
-                for n in nodes:
-                    subtree.append(n)
-                fname = str(self._path_name(subtree).with_suffix(".xml"))
-                nxt.remove(subtree)
-                xml.append_external(nxt, subtree, fname, self.dest_dir)
+                next_tree = self._parse(base / node.get("src"))
+                others = [
+                    (run._parse(other_base / other.get("src")), sub, other_base, run)
+                    for other, sub, other_base, run in others
+                ]
+                self._proc_tree(
+                    next_tree, subtree, depth + 1, subtree_path, base, others
+                )
             elif "text" in node.attrib:
                 # sometimes there are empty intermediate nodes..
-                self._proc_tree(node, subtree, depth + 1)
+                self._proc_tree(node, subtree, depth + 1, subtree_path, base, others)
 
         return nxt
 
-    def _proc_chapter(self, tree):
-        root = self.xlst(tree).getroot()
-        # Let's make it all consistent..
-        xml.remove(root, ["chapter", "book", "nikaya"])
-        for child in ["chapter", "section", "subsection"]:
-            xml.siblings_to_child(root, child)
+    def _add_chapter(self, action, title, name, nxt):
+        """Includes a chapter in the output tree, and transforms or collects it.
 
-        # Some cleaning steps..
-        self._merge_verses(root)
-        self._lift_numbers(root)
-        xml.trim_text(root)
-        self._extract_nr_from_title(root)
+        Args:
+            action: The path of the chapter source file.
+            title: The title of the chapter.
+            name: The transliterated name of the chapter file, relative to the output
+                directory.
+            nxt: The output element that includes the chapter, which becomes a book.
+        """
+        nxt.tag = "book"
+        entry = self._chapter_entry(action, title)
+        xml.include_external(nxt, name, title)
+        if self._jobs is not None:
+            # Later chapters with the same name overwrite earlier ones,
+            # just like they do when transforming serially.
+            self._jobs.pop(name, None)
+            self._jobs[name] = (str(action), title, entry)
+            return
+
+        if not self._up_to_date(name, entry):
+            self._write_chapter(action, title, name)
+            self._written.add(name)
+        else:
+            self.stats.count("chapters_skipped")
+        if self._manifest is not None:
+            self._manifest.record(name, entry)
+
+    def _title(self, title):
+        """Returns a title of the toc as it is written, normalized if a profile is
+        set."""
+        if self._normalizer is None:
+            return title
+        return self._normalizer(title)
+
+    def _transliterate(self, title):
+        """Returns the ascii version of a title, as used in file names."""
+        name = self._ascii.get(title)
+        if name is None:
+            name = self._ascii[title] = unidecode(title)
+        return name
+
+    def _write_chapter(self, action, title, name):
+        """Transforms a chapter and writes it to name, relative to the output
+        directory."""
+        dest = self.dest_dir / name
+        with self.stats.chapter(name):
+            if self.streaming:
+                # Parsing, transforming and writing are interleaved.
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                with self.stats.stage("stream"):
+                    stream.stream_chapter(
+                        action,
+                        title,
+                        str(dest),
+                        self.xlst,
+                        self.xsl_tags,
+                        self._cleanup,
+                    )
+                self.stats.read(action)
+                self.stats.written(dest)
+            elif self._archive is not None:
+                chapter = self._build_chapter(action, title)
+                with self.stats.stage("serialize"):
+                    data = xml.serialize(chapter)
+                with self.stats.stage("write"):
+                    size = self._archive.add(name, data)
+                self.stats.written(name, size)
+            elif self._writer is not None:
+                chapter = self._build_chapter(action, title)
+                with self.stats.stage("serialize"):
+                    data = xml.serialize(chapter)
+                self._writer.write(dest, data)
+                self.stats.written(dest, len(data))
+            else:
+                chapter = self._build_chapter(action, title)
+                with self.stats.stage("write"):
+                    xml.write_external(chapter, name, self.dest_dir)
+                self.stats.written(dest)
+        self.stats.count("chapters_written")
+
+    def _build_chapter(self, action, title):
+        """Parses and cleans up a chapter file.
+
+        Args:
+            action: The path of the chapter source file.
+            title: The title of the chapter.
+
+        Returns:
+            A chapter element containing the cleaned up content.
+        """
+        chapter = etree.Element("chapter", {"title": title})
+        root = self.cache.get("xslt", action, lambda: self._apply_xslt(action))
+        with self.stats.stage("cleanup") as stage:
+            for n in self._cleanup(root):
+                chapter.append(n)
+            stage.elements(chapter)
+        return chapter
+
+    def _apply_xslt(self, action):
+        """Parses a chapter file and applies the stylesheet, returning the root.
+
+        Only the result of the stylesheet is cached, the parsed chapter is not needed
+        again once it is.
+        """
+        tree = self._read(action)
+        with self.stats.stage("xslt") as stage:
+            root = self.xlst(tree).getroot()
+            stage.elements(root)
         return root
 
-    def _path_name(self, node):
-        if node is None:
-            return Path()
+    def _parse(self, fname):
+        """Parses a toc or index file, reusing the cached tree if the file was seen
+        before."""
+        return self.cache.get("parse", fname, lambda: self._read(fname))
+
+    def _read(self, fname):
+        """Parses a source file."""
+        with self.stats.stage("parse") as stage:
+            tree = xml.parse(fname)
+            stage.elements(tree)
+        self.stats.read(fname)
+        return tree
 
-        return Path(self._path_name(node.getparent())) / unidecode(node.get("title", ""))
+    def _cleanup(self, root):
+        """Cleans up the result of the stylesheet with a single traversal of the tree.
+
+        This is equivalent to removing the chapter, book and nikaya elements, making the
+        sections and subsections adopt their siblings, and then calling _merge_verses,
+        _lift_numbers, xml.trim_text, _extract_nr_from_title and normalizing the text
+        and titles when a profile is set. None of these steps creates elements or
+        changes the document order of the remaining ones, so the elements every step
+        visits are known after a single scan.
+        """
+        rules = defaultdict(list)
+        nodes = []
+        skip = None
+        for node in root.iter("*"):
+            if skip is not None and node in skip:
+                continue
+            rule = self._CLEANUP_RULES.get(node.tag)
+            if rule == "remove":
+                if len(node):
+                    skip = skip or set()
+                    skip.update(node.iter())
+                rules[rule].append(node)
+                continue
+            if rule:
+                rules[rule].append(node)
+            nodes.append(node)
+
+        # Let's make it all consistent..
+        for node in rules["remove"]:
+            node.getparent().remove(node)
+        for tag in ["section", "subsection"]:
+            for node in rules[tag]:
+                xml.adopt_siblings(node, tag)
+
+        # Some cleaning steps..
+        self._merge_verse_list(rules["verse"])
+        for node in rules["number"]:
+            self._lift_number(node)
+        for node in nodes:
+            xml.trim_node(node)
+            if node.get("title") is not None:
+                self._set_nr_from_title(node)
+        if self._normalizer is not None:
+            self._normalizer.tree(nodes)
+        return root
 
     def _extract_nr_from_title(self, tree: etree.Element) -> None:
         """Extracts and sets the 'nr' attribute from the 'title' attribute of elements in a given lxml tree.
@@ -102,12 +587,17 @@ class TipitikaTransformer:
 
         """
         for node in tree.xpath("//*[@title]"):
-            # Extract the number from the title
-            m = re.match("([0-9\-]*)\. (.*)", node.get("title"))
-            if m:
-                # If number is successfully extracted, set 'nr' attribute and update 'title' attribute
-                node.set("nr", m.group(1))
-                node.set("title", m.group(2))
+            self._set_nr_from_title(node)
+
+    def _set_nr_from_title(self, node: etree.Element) -> None:
+        """Moves the number of the title of a single element into its nr."""
+        # Extract the number from the title
+        m = _TITLE_NR.match(node.get("title"))
+        if m:
+            # If number is successfully extracted, set 'nr' attribute and update
+            # 'title' attribute
+            node.set("nr", m.group(1))
+            node.set("title", m.group(2))
 
     def _lift_numbers(self, tree):
         """
@@ -119,28 +609,38 @@ class TipitikaTransformer:
             tree (Element): The XML tree to process.
         """
         for node in tree.xpath("//number"):
-            # Get the parent and next sibling elements of the 'number' element.
-            parent = node.getparent()
-            nxt = node.getnext()
+            self._lift_number(node)
+
+    def _lift_number(self, node):
+        """Lifts the 'nr' attribute of a single 'number' element, see _lift_numbers."""
+        # Get the parent and next sibling elements of the 'number' element.
+        parent = node.getparent()
+        nxt = node.getnext()
 
-            # If the parent is a 'p' tag, set its 'nr' attribute to the 'nr' attribute of the 'number' element, and
-            # concatenate the 'tail' text of the 'number' element to the 'text' of the 'p' element.
-            if parent.tag == "p":
-                parent.set("nr", node.get("nr"))
-                if node.tail:
-                    parent.text = node.tail + xml.xstr(parent.text)
+        # If the parent is a 'p' tag, set its 'nr' attribute to the 'nr' attribute of
+        # the 'number' element, and concatenate the 'tail' text of the 'number' element
+        # to the 'text' of the 'p' element.
+        if parent.tag == "p":
+            parent.set("nr", node.get("nr"))
+            if node.tail:
+                parent.text = node.tail + xml.xstr(parent.text)
 
-            # If the next sibling element is a 'verse' tag, set its 'nr' attribute to the 'nr' attribute of the
-            # 'number' element.
-            if nxt is not None and nxt.tag == "verse":
-                nxt.set("nr", node.get("nr"))
+        # If the next sibling element is a 'verse' tag, set its 'nr' attribute to the
+        # 'nr' attribute of the 'number' element.
+        if nxt is not None and nxt.tag == "verse":
+            nxt.set("nr", node.get("nr"))
 
-            # Remove the 'number' element.
-            parent.remove(node)
+        # Remove the 'number' element.
+        parent.remove(node)
 
     def _merge_verses(self, xml_tree: etree.Element) -> None:
         """Merges adjacent <verse> elements in the given XML tree into a single <verse> element."""
-        verses = list(xml_tree.xpath("//verse"))
+        self._merge_verse_list(list(xml_tree.xpath("//verse")))
+
+    def _merge_verse_list(self, verses) -> None:
+        """Merges adjacent verses, given the <verse> elements of a tree in document
+        order."""
+        verses = list(verses)
         verses.reverse()
 
         for current_verse, next_verse in xml.pairwise(verses):
@@ -157,3 +657,92 @@ class TipitikaTransformer:
 
         if verses:
             verses[-1].attrib.clear()
+
+
+# The transformers used by a worker process, one per script, see _init_worker.
+_workers = []
+
+
+class _ChapterBuffer:
+    """Keeps the chapter added by a worker process, to send it to the archive writer."""
+
+    def __init__(self):
+        self.data = None
+
+    def add(self, name, data):
+        self.data = data
+        return len(data)
+
+    def take(self):
+        data, self.data = self.data, None
+        return data
+
+
+def _init_worker(
+    scripts: List[Tuple[str, str]],
+    streaming: bool,
+    stats: bool,
+    archive: bool,
+    normalize: str = None,
+) -> None:
+    """Creates the transformers used by a worker process.
+
+    XSLT objects cannot be shared between processes, so every worker compiles its own,
+    which is shared by the transformers of all scripts. When writing an archive, the
+    chapters are sent back to the main process instead.
+
+    Args:
+        scripts: The toc file and output directory of every script.
+        streaming: Whether chapters are streamed.
+        stats: Whether stats are recorded.
+        archive: Whether chapters are written to an archive.
+        normalize: The normalization profile of the chapters, or None.
+    """
+    recorder = RunStats() if stats else None
+    _workers.clear()
+    for toc_file, dest_dir in scripts:
+        worker = TipitikaTransformer(
+            toc_file,
+            dest_dir,
+            streaming=streaming,
+            stats=recorder,
+            normalize=normalize,
+        )
+        if _workers:
+            worker._local = _workers[0]._local
+            worker.cache = _workers[0].cache
+        if archive:
+            worker._archive = _ChapterBuffer()
+        _workers.append(worker)
+
+
+def _transform_chapter(job):
+    """Transforms a single chapter in a worker process and writes it to disk.
+
+    Args:
+        job: A (script, name, (action, title)) tuple as collected by _proc_tree.
+
+    Returns:
+        The script, the name of the written file, the serialized chapter when writing an
+        archive or None, and the stats recorded while transforming it or None.
+    """
+    script, name, (action, title) = job
+    worker = _workers[script]
+    worker._write_chapter(action, title, name)
+    data = worker._archive.take() if worker._archive is not None else None
+    return script, name, data, worker.stats.take()
+
+
+def _corresponding(tree, i, node, run):
+    """Returns child i of the toc element of another script, which must match node.
+
+    Raises:
+        ValueError: If the toc of the other script has a different structure.
+    """
+    if i < len(tree):
+        other = tree[i]
+        if all((key in other.attrib) == (key in node.attrib) for key in _STRUCTURE):
+            return other
+    raise ValueError(
+        f"The toc of {run.toc_file} does not match at {xml.path(node)} {i}."
+    )
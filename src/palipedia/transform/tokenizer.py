@@ -0,0 +1,398 @@
+"""Builds subword vocabularies of the transformed scriptures and encodes text with them.
+
+Text is normalized to NFC and lower case, so that letters with diacritics such as
+ṃ, ṅ, ñ, ṭ, ḍ, ṇ, ḷ and the long vowels are single characters. Words are split into
+characters that keep any remaining combining marks attached to their letter, so a
+diacritic is never separated from its letter by the vocabulary.
+
+Words and character n-grams are counted in a process pool with counters that can be
+merged, after which a byte pair encoding (BPE) vocabulary is learned from the word
+counts. The first symbol of every word is marked with WORD_START.
+"""
+import functools
+import heapq
+import json
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Dict, Iterable, List, Mapping, Sequence, Tuple
+
+from palipedia.transform.flat import ChapterSource, unit_text, units
+
+WORD_START = "▁"
+UNK = "<unk>"
+
+# Letters and digits, including combining marks that were not composed by NFC.
+_WORD = re.compile(r"[\w\u0300-\u036f]+")
+
+
+def normalize(text: str) -> str:
+    """Returns the NFC normalized, lower case version of a text."""
+    return unicodedata.normalize("NFC", text).lower()
+
+
+def words(text: str) -> List[str]:
+    """
+    Splits a text into normalized words.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        List[str]: The words, without punctuation.
+    """
+    return _WORD.findall(normalize(text))
+
+
+def characters(word: str) -> List[str]:
+    """
+    Splits a word into characters, keeping combining marks with the preceding letter.
+
+    Args:
+        word (str): A normalized word.
+
+    Returns:
+        List[str]: The characters of the word.
+    """
+    chars = []
+    for c in word:
+        if chars and unicodedata.combining(c):
+            chars[-1] += c
+        else:
+            chars.append(c)
+    return chars
+
+
+class Counts:
+    """
+    Counts of words and character n-grams, that can be merged with other counts.
+
+    N-grams are counted within words, with "<" and ">" marking the start and end of a
+    word, for every size from 1 up to ngram.
+
+    Attributes:
+        ngram (int): The largest n-gram size.
+        words (Counter): The number of occurrences of every word.
+        ngrams (Counter): The number of occurrences of every n-gram.
+    """
+
+    def __init__(self, ngram: int = 3) -> None:
+        """
+        Initializes empty counts.
+
+        Args:
+            ngram (int, optional): The largest n-gram size. Defaults to 3.
+        """
+        self.ngram = ngram
+        self.words = Counter()
+        self.ngrams = Counter()
+
+    def update(self, text: str) -> None:
+        """
+        Counts the words and n-grams of a text.
+
+        Args:
+            text (str): The text.
+        """
+        counted = Counter(words(text))
+        self.words.update(counted)
+        for word, count in counted.items():
+            chars = ["<"] + characters(word) + [">"]
+            for n in range(1, self.ngram + 1):
+                for i in range(len(chars) - n + 1):
+                    self.ngrams["".join(chars[i : i + n])] += count
+
+    def merge(self, other: "Counts") -> "Counts":
+        """
+        Adds other counts to these counts.
+
+        Args:
+            other (Counts): The counts to add.
+
+        Returns:
+            Counts: These counts.
+        """
+        self.words.update(other.words)
+        self.ngrams.update(other.ngrams)
+        return self
+
+
+def _count_chapters(dest_dir: str, names: List[str], ngram: int) -> Counts:
+    counts = Counts(ngram)
+    with ChapterSource(dest_dir) as source:
+        for name in names:
+            for unit in units(source.parse(name)):
+                counts.update(unit_text(unit))
+    return counts
+
+
+def count_chapters(dest_dir: str, workers: int = 1, ngram: int = 3) -> Counts:
+    """
+    Counts the words and n-grams of all paragraphs and verses of a transformation.
+
+    Args:
+        dest_dir (str): The output directory of a TipitikaTransformer.
+        workers (int, optional): The number of processes that count chapters.
+            Defaults to 1.
+        ngram (int, optional): The largest n-gram size. Defaults to 3.
+
+    Returns:
+        Counts: The counts.
+    """
+    with ChapterSource(dest_dir) as source:
+        names = source.names()
+    if workers <= 1:
+        return _count_chapters(dest_dir, names, ngram)
+
+    # A few batches per worker balance the load, while few counters are sent back.
+    batches = workers * 4
+    total = Counts(ngram)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for counts in pool.map(
+            _count_chapters,
+            repeat(str(dest_dir)),
+            [names[i::batches] for i in range(batches)],
+            repeat(ngram),
+        ):
+            total.merge(counts)
+    return total
+
+
+def learn_merges(
+    word_counts: Mapping[str, int], vocab_size: int, min_count: int = 2
+) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """
+    Learns the merges of a byte pair encoding.
+
+    Pair counts are updated incrementally for the words that contain a merged pair, and
+    the most frequent pair is found with a heap of lazily invalidated entries, so every
+    merge only touches the words it changes. Ties are broken by the pair itself, so the
+    result is deterministic.
+
+    Args:
+        word_counts (Mapping[str, int]): The number of occurrences of every word.
+        vocab_size (int): The size of the vocabulary, including UNK. The characters
+            are always part of the vocabulary, even when there are more of them.
+        min_count (int, optional): Pairs that occur less often are never merged.
+            Defaults to 2.
+
+    Returns:
+        Tuple[List[str], List[Tuple[str, str]]]: The vocabulary, UNK followed by the
+        characters and the merged symbols in order, and the merged pairs in order.
+    """
+    seqs = []
+    freqs = []
+    alphabet = set()
+    for word, count in sorted(word_counts.items()):
+        chars = characters(word)
+        if chars:
+            alphabet.update(chars)
+            seqs.append([WORD_START + chars[0]] + chars[1:])
+            freqs.append(count)
+
+    # Every character, with and without WORD_START, so that any word that is spelled
+    # with known characters can be encoded.
+    symbols = alphabet | {WORD_START + c for c in alphabet}
+    vocab = [UNK] + sorted(symbols)
+    pairs = Counter()
+    where = defaultdict(set)
+    for i, seq in enumerate(seqs):
+        for pair in zip(seq, seq[1:]):
+            pairs[pair] += freqs[i]
+            where[pair].add(i)
+    heap = [(-count, pair) for pair, count in pairs.items()]
+    heapq.heapify(heap)
+
+    merges = []
+    while len(vocab) < vocab_size and heap:
+        count, pair = heapq.heappop(heap)
+        if pairs.get(pair) != -count:
+            continue
+        if -count < min_count:
+            break
+        first, second = pair
+        merged = first + second
+        merges.append(pair)
+        if merged not in symbols:
+            # Different pairs can spell the same symbol.
+            symbols.add(merged)
+            vocab.append(merged)
+
+        delta = Counter()
+        for i in where.pop(pair):
+            seq, freq = seqs[i], freqs[i]
+            for old in zip(seq, seq[1:]):
+                delta[old] -= freq
+            seq = _merge(seq, first, second, merged)
+            seqs[i] = seq
+            for new in zip(seq, seq[1:]):
+                delta[new] += freq
+                where[new].add(i)
+        for p, d in delta.items():
+            if d == 0:
+                continue
+            pairs[p] += d
+            if pairs[p] > 0:
+                heapq.heappush(heap, (-pairs[p], p))
+            else:
+                del pairs[p]
+    return vocab, merges
+
+
+def _merge(seq: List[str], first: str, second: str, merged: str) -> List[str]:
+    """Replaces every occurrence of the pair first, second in seq with merged."""
+    out = []
+    i = 0
+    while i < len(seq):
+        if i + 1 < len(seq) and seq[i] == first and seq[i + 1] == second:
+            out.append(merged)
+            i += 2
+        else:
+            out.append(seq[i])
+            i += 1
+    return out
+
+
+class Tokenizer:
+    """
+    Encodes text into subword ids with a byte pair encoding.
+
+    The merges are kept as a table from pair to rank, and the encoding of every word is
+    cached, so text with a typical word distribution is mostly encoded by lookups.
+    """
+
+    def __init__(
+        self,
+        vocab: Sequence[str],
+        merges: Sequence[Tuple[str, str]],
+        cache_size: int = 1 << 18,
+    ) -> None:
+        """
+        Initializes the tokenizer.
+
+        Args:
+            vocab (Sequence[str]): The symbols, by id. Must start with UNK.
+            merges (Sequence[Tuple[str, str]]): The merged pairs, in the order they were
+                learned.
+            cache_size (int, optional): The number of words whose encoding is cached.
+                Defaults to 262144.
+        """
+        self.vocab = list(vocab)
+        self.merges = [tuple(pair) for pair in merges]
+        self.ids: Dict[str, int] = {s: i for i, s in enumerate(self.vocab)}
+        self._ranks = {pair: rank for rank, pair in enumerate(self.merges)}
+        self._unk = self.ids[UNK]
+        self.encode_word = functools.lru_cache(maxsize=cache_size)(self._encode_word)
+
+    @classmethod
+    def train(
+        cls, word_counts: Mapping[str, int], vocab_size: int, min_count: int = 2
+    ) -> "Tokenizer":
+        """
+        Learns a tokenizer from word counts, see learn_merges.
+
+        Args:
+            word_counts (Mapping[str, int]): The number of occurrences of every word.
+            vocab_size (int): The size of the vocabulary, including UNK.
+            min_count (int, optional): Pairs that occur less often are never merged.
+                Defaults to 2.
+
+        Returns:
+            Tokenizer: The tokenizer.
+        """
+        return cls(*learn_merges(word_counts, vocab_size, min_count))
+
+    def __len__(self) -> int:
+        return len(self.vocab)
+
+    def _encode_word(self, word: str) -> Tuple[int, ...]:
+        chars = characters(word)
+        if not chars:
+            return ()
+        seq = [WORD_START + chars[0]] + chars[1:]
+        ranks = self._ranks
+        while len(seq) > 1:
+            pair = min(zip(seq, seq[1:]), key=lambda p: ranks.get(p, len(ranks)))
+            if pair not in ranks:
+                break
+            seq = _merge(seq, pair[0], pair[1], pair[0] + pair[1])
+        ids = self.ids
+        return tuple(ids.get(s, self._unk) for s in seq)
+
+    def encode(self, text: str) -> List[int]:
+        """
+        Encodes a text.
+
+        Args:
+            text (str): The text, which is normalized first.
+
+        Returns:
+            List[int]: The ids of the subwords.
+        """
+        ids = []
+        encode_word = self.encode_word
+        for word in words(text):
+            ids.extend(encode_word(word))
+        return ids
+
+    def encode_batch(self, texts: Iterable[str]) -> List[List[int]]:
+        """
+        Encodes many texts.
+
+        Args:
+            texts (Iterable[str]): The texts.
+
+        Returns:
+            List[List[int]]: The ids of the subwords of every text.
+        """
+        encode_word = self.encode_word
+        find = _WORD.findall
+        batch = []
+        for text in texts:
+            ids = []
+            for word in find(normalize(text)):
+                ids.extend(encode_word(word))
+            batch.append(ids)
+        return batch
+
+    def decode(self, ids: Iterable[int]) -> str:
+        """
+        Decodes ids into normalized words separated by spaces.
+
+        Args:
+            ids (Iterable[int]): The ids of subwords.
+
+        Returns:
+            str: The text.
+        """
+        text = "".join(self.vocab[i] for i in ids)
+        return text.replace(WORD_START, " ").lstrip(" ")
+
+    def save(self, fname: str) -> None:
+        """
+        Writes the vocabulary and the merges as JSON.
+
+        Args:
+            fname (str): The file to write.
+        """
+        with open(fname, "w", encoding="utf-8") as f:
+            json.dump(
+                {"vocab": self.vocab, "merges": self.merges}, f, ensure_ascii=False
+            )
+
+    @classmethod
+    def load(cls, fname: str) -> "Tokenizer":
+        """
+        Reads a tokenizer written by save.
+
+        Args:
+            fname (str): The file to read.
+
+        Returns:
+            Tokenizer: The tokenizer.
+        """
+        with open(fname, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["vocab"], data["merges"])
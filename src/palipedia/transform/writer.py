@@ -0,0 +1,107 @@
+"""Writes output files on background threads, overlapping transforming and writing."""
+import queue
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+from absl import logging
+
+import palipedia.transform.xml as xml
+
+# Tells a writer thread to stop.
+_DONE = None
+
+
+class AsyncWriter:
+    """
+    Writes serialized files on a fixed number of writer threads.
+
+    Every writer thread has a bounded queue, so a producer that is faster than the file
+    system blocks in write instead of piling up serialized chapters in memory. Files
+    are assigned to threads by name, so writes to the same file happen in the order they
+    were submitted. Files are written with xml.write_atomic, and the first error raised
+    by a writer thread is raised again by the next write, or by close.
+
+    The writer can be used as a context manager that closes it on exit.
+    """
+
+    def __init__(self, threads: int = 2, queue_size: int = 8) -> None:
+        """
+        Starts the writer threads.
+
+        Args:
+            threads (int, optional): The number of writer threads. Defaults to 2.
+            queue_size (int, optional): The number of files waiting to be written per
+                thread, before write blocks. Defaults to 8.
+        """
+        self._error: Optional[BaseException] = None
+        self._queues: List[queue.Queue] = [
+            queue.Queue(maxsize=queue_size) for _ in range(max(1, threads))
+        ]
+        self._threads = [
+            threading.Thread(target=self._run, args=(q,), daemon=True)
+            for q in self._queues
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def write(self, fname: str, data: bytes) -> None:
+        """
+        Queues a file to be written, creating its directory as needed.
+
+        Args:
+            fname (str): The file to write.
+            data (bytes): The contents of the file.
+
+        Raises:
+            RuntimeError: If the writer is closed.
+            Exception: The first error raised by a writer thread.
+        """
+        self._raise_error()
+        if not self._threads:
+            raise RuntimeError("The writer is closed.")
+        fname = str(fname)
+        self._queues[hash(fname) % len(self._queues)].put((fname, data))
+
+    def close(self) -> None:
+        """
+        Waits until all queued files are written and stops the writer threads.
+
+        Raises:
+            Exception: The first error raised by a writer thread.
+        """
+        if not self._threads:
+            self._raise_error()
+            return
+        for q in self._queues:
+            q.put(_DONE)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._raise_error()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def _run(self, q: queue.Queue) -> None:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                return
+            if self._error is not None:
+                # Files after an error are dropped, the run fails anyway.
+                continue
+            fname, data = item
+            try:
+                Path(fname).parent.mkdir(parents=True, exist_ok=True)
+                logging.info("Writing %s", fname)
+                xml.write_atomic(fname, data)
+            except BaseException as e:
+                self._error = self._error or e
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
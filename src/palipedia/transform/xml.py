@@ -1,7 +1,11 @@
 """Contains functions to manipulate XML. Used to transform the source data"""
+import contextlib
+import functools
 import itertools
+import os
+import threading
 from pathlib import Path
-from typing import Any, Tuple, List, Optional
+from typing import Any, Iterable, Tuple, List, Optional, Sequence
 
 from absl import logging
 from lxml import etree
@@ -10,6 +14,27 @@ from unidecode import unidecode
 DEFAULT_PARSER: etree.XMLParser = etree.XMLParser(remove_blank_text=True)
 XI: str = "http://www.w3.org/2001/XInclude"
 
+_local = threading.local()
+
+
+@functools.lru_cache(maxsize=256)
+def compiled_xpath(query: str) -> etree.XPath:
+    """
+    Returns the compiled version of an XPath query. The most recently used queries are
+    kept, so the queries of the helpers are compiled once.
+
+    Args:
+        query (str): An XPath query string.
+
+    Returns:
+        etree.XPath: The compiled query, which can be evaluated against any tree.
+    """
+    return etree.XPath(query)
+
+
+def _any_of(tags: Sequence[str]) -> str:
+    return "//" + "|//".join(tags)
+
 
 def pairwise(iterable: Any) -> Tuple:
     """
@@ -26,20 +51,37 @@ def pairwise(iterable: Any) -> Tuple:
     return zip(a, b)
 
 
-def parse(fname: str, parser: etree.XMLParser = DEFAULT_PARSER) -> etree._Element:
+def default_parser() -> etree.XMLParser:
+    """
+    Returns the parser used by parse. Parsers cannot be shared between threads, so the
+    main thread uses DEFAULT_PARSER and every other thread gets a copy of it.
+
+    Returns:
+        etree._XMLParser: The parser of the current thread.
+    """
+    if threading.current_thread() is threading.main_thread():
+        return DEFAULT_PARSER
+    parser = getattr(_local, "parser", None)
+    if parser is None:
+        parser = _local.parser = DEFAULT_PARSER.copy()
+    return parser
+
+
+def parse(fname: str, parser: Optional[etree.XMLParser] = None) -> etree._Element:
     """
     Parses an XML file and returns the root element.
 
     Args:
         fname (str): The name of the XML file to parse.
-        parser (etree.XMLParser, optional): The parser to use for parsing the XML file. Defaults to DEFAULT_PARSER.
+        parser (etree.XMLParser, optional): The parser to use for parsing the XML file.
+            Defaults to DEFAULT_PARSER, or a copy of it outside the main thread.
 
     Returns:
         etree._Element: The root element of the parsed XML file.
     """
     logging.info("parsing %s", fname)
-    with open(fname, "rb") as f:
-        return etree.parse(f, parser).getroot()
+    # Let libxml2 read the file, so that the GIL is released while parsing.
+    return etree.parse(str(fname), parser or default_parser()).getroot()
 
 
 def xstr(s: Optional[str]) -> str:
@@ -69,7 +111,7 @@ def depth(tree: etree._Element) -> int:
     """
     if tree is None:
         return 0
-    return 1 + depth(tree.getparent())
+    return 1 + sum(1 for _ in tree.iterancestors())
 
 
 def getroot(tree: etree._Element) -> etree._Element:
@@ -82,9 +124,9 @@ def getroot(tree: etree._Element) -> etree._Element:
     Returns:
         etree._Element: The root node of the XML tree.
     """
-    if tree.getparent() is None:
-        return tree
-    return getroot(tree.getparent())
+    for ancestor in tree.iterancestors():
+        tree = ancestor
+    return tree
 
 
 def append_external(
@@ -103,9 +145,46 @@ def append_external(
         None
     """
     name = unidecode(fname)
+    include_external(node, name)
+    write_external(child, name, outdir)
+
+
+def include_external(
+    node: etree._Element, name: str, title: Optional[str] = None
+) -> None:
+    """
+    Appends an xi:include element referencing an external file to a node.
+
+    Args:
+        node (etree._Element): The node to which the include element should be appended.
+        name (str): The transliterated name of the external file, used as the href.
+        title (Optional[str], optional): The title of the external file, kept on the
+            include so that it can be read without opening the file. XInclude ignores
+            it. Defaults to None.
+
+    Returns:
+        None
+    """
+    include = etree.SubElement(node, "{" + XI + "}include", {"href": name})
+    if title is not None:
+        include.set("title", title)
+
+
+def write_external(child: etree._Element, name: str, outdir: str) -> None:
+    """
+    Writes an element to a file below the output directory, creating directories as
+    needed.
+
+    Args:
+        child (etree._Element): The element to write.
+        name (str): The name of the output file, relative to outdir.
+        outdir (str): The output directory where the file should be written.
+
+    Returns:
+        None
+    """
     final_dest = Path(outdir) / name
     final_dest.parent.mkdir(parents=True, exist_ok=True)
-    etree.SubElement(node, "{" + XI + "}include", {"href": name})
     write_xml(str(final_dest), child)
 
 
@@ -119,11 +198,35 @@ def trim_text(tree: etree._Element) -> None:
     Returns:
         None
     """
-    for node in tree.iter("*"):
-        if node.text:
-            node.text = node.text.strip()
-        if node.tail:
-            node.tail = node.tail.strip()
+    _trim(tree.iter("*"))
+
+
+def _trim(nodes: Iterable[etree._Element]) -> None:
+    for node in nodes:
+        trim_node(node)
+
+
+def trim_node(node: etree._Element) -> None:
+    """
+    Trims the whitespace from the text and tail of a single element.
+
+    Args:
+        node (etree._Element): The element whose text and tail should be trimmed.
+
+    Returns:
+        None
+    """
+    # Only assign when something changes, assigning text is not free.
+    text = node.text
+    if text:
+        trimmed = text.strip()
+        if len(trimmed) != len(text):
+            node.text = trimmed
+    tail = node.tail
+    if tail:
+        trimmed = tail.strip()
+        if len(trimmed) != len(tail):
+            node.tail = trimmed
 
 
 def merge(n1: etree._Element, n2: etree._Element, text_sep: str = "") -> None:
@@ -163,8 +266,11 @@ def neighbor_to_child(tree: etree._Element, tags: List[str]) -> None:
     Returns:
         None
     """
-    xpath = "//" + "|//".join(tags)
-    for node in tree.xpath(xpath):
+    _neighbor_to_child(compiled_xpath(_any_of(tags))(tree), tags)
+
+
+def _neighbor_to_child(nodes: Iterable[etree._Element], tags: List[str]) -> None:
+    for node in nodes:
         nxt = node.getnext()
         while nxt is not None and nxt.tag not in tags:
             tmp = nxt.getnext()
@@ -185,7 +291,9 @@ def path(elem: etree._Element) -> str:
     """
     if elem is None:
         return ""
-    return path(elem.getparent()) + "-" + elem.tag
+    tags = [elem.tag]
+    tags.extend(ancestor.tag for ancestor in elem.iterancestors())
+    return "".join("-" + tag for tag in reversed(tags))
 
 
 def text_to_attr(tree: etree._Element, tag: str, attr: str) -> None:
@@ -202,17 +310,17 @@ def text_to_attr(tree: etree._Element, tag: str, attr: str) -> None:
     Returns:
         None
     """
-    for node in tree.xpath("//" + tag):
+    _text_to_attr(compiled_xpath("//" + tag)(tree), attr)
+
+
+def _text_to_attr(nodes: Iterable[etree._Element], attr: str) -> None:
+    for node in nodes:
         if len(node) > 0:
             raise ValueError("Has kids!")
         node.attrib[attr] = node.text
         node.text = None
 
 
-from typing import List
-from lxml import etree
-
-
 def remove_query(tree: etree._ElementTree, query: str) -> None:
     """
     Remove all elements matching the given query.
@@ -224,7 +332,11 @@ def remove_query(tree: etree._ElementTree, query: str) -> None:
     Returns:
         None
     """
-    for node in tree.xpath(query):
+    _remove(compiled_xpath(query)(tree))
+
+
+def _remove(nodes: Iterable[etree._Element]) -> None:
+    for node in nodes:
         node.getparent().remove(node)
 
 
@@ -239,9 +351,7 @@ def remove(tree: etree._ElementTree, tags: List[str]) -> None:
     Returns:
         None
     """
-    query = "//" + "|//".join(tags)
-    for node in tree.xpath(query):
-        node.getparent().remove(node)
+    _remove(compiled_xpath(_any_of(tags))(tree))
 
 
 def write_xml(xml_file: str, tree: etree._Element) -> None:
@@ -255,10 +365,62 @@ def write_xml(xml_file: str, tree: etree._Element) -> None:
     Returns:
         None
     """
-    root = etree.ElementTree(tree)
     logging.info("Writing %s", xml_file)
-    with open(xml_file, "wb") as res:
-        root.write(res, encoding="utf-8", xml_declaration=True, pretty_print=True)
+    write_atomic(xml_file, serialize(tree))
+
+
+def serialize(tree: etree._Element) -> bytes:
+    """
+    Serializes an XML tree exactly as write_xml writes it.
+
+    Args:
+        tree (etree._Element): The XML tree to serialize.
+
+    Returns:
+        bytes: The pretty printed document, including the XML declaration.
+    """
+    return etree.tostring(
+        etree.ElementTree(tree),
+        encoding="UTF-8",
+        xml_declaration=True,
+        pretty_print=True,
+    )
+
+
+def temporary_name(fname: str) -> str:
+    """
+    Returns the name of a temporary file next to fname, unique to the calling thread.
+
+    Args:
+        fname (str): The file that will be replaced by the temporary file.
+
+    Returns:
+        str: The temporary file name.
+    """
+    return f"{fname}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def write_atomic(fname: str, data: bytes) -> None:
+    """
+    Writes a file by renaming a temporary file into place, so that readers and crashes
+    never see a partially written file.
+
+    Args:
+        fname (str): The file to write.
+        data (bytes): The contents of the file.
+
+    Returns:
+        None
+    """
+    tmp = temporary_name(fname)
+    try:
+        with open(tmp, "wb") as res:
+            res.write(data)
+        os.replace(tmp, fname)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
 
 
 def siblings_to_child(tree: etree._ElementTree, tag: str) -> None:
@@ -272,14 +434,33 @@ def siblings_to_child(tree: etree._ElementTree, tag: str) -> None:
     Returns:
         None
     """
-    for node in tree.xpath("//" + tag):
-        # Make every sibling a child
-        nxt = node.getnext()
-        while nxt is not None and nxt.tag != tag:
-            following = nxt.getnext()
-            nxt.getparent().remove(nxt)
-            node.append(nxt)
-            nxt = following
+    _siblings_to_child(compiled_xpath("//" + tag)(tree), tag)
+
+
+def _siblings_to_child(nodes: Iterable[etree._Element], tag: str) -> None:
+    for node in nodes:
+        adopt_siblings(node, tag)
+
+
+def adopt_siblings(node: etree._Element, tag: str) -> None:
+    """
+    Move the following siblings of an element under it, up to the next sibling with
+    the given tag.
+
+    Args:
+        node (etree._Element): The element that adopts its siblings.
+        tag (str): The tag name that ends the adoption.
+
+    Returns:
+        None
+    """
+    # Make every sibling a child
+    nxt = node.getnext()
+    while nxt is not None and nxt.tag != tag:
+        following = nxt.getnext()
+        nxt.getparent().remove(nxt)
+        node.append(nxt)
+        nxt = following
 
 
 def remove_empty(tree: etree._ElementTree, tags: List[str]) -> None:
@@ -293,8 +474,11 @@ def remove_empty(tree: etree._ElementTree, tags: List[str]) -> None:
     Returns:
         None
     """
-    query = "//" + "|//".join(tags)
-    for node in tree.xpath(query):
+    _remove_empty(compiled_xpath(_any_of(tags))(tree))
+
+
+def _remove_empty(nodes: Iterable[etree._Element]) -> None:
+    for node in nodes:
         parent = node.getparent()
         if parent is None or not hasattr(parent, "tag"):
             continue
@@ -319,7 +503,11 @@ def rename(tree: etree._ElementTree, tag: str, new_tag: str) -> None:
     Returns:
         None
     """
-    for node in tree.xpath("//" + tag):
+    _rename(compiled_xpath("//" + tag)(tree), new_tag)
+
+
+def _rename(nodes: Iterable[etree._Element], new_tag: str) -> None:
+    for node in nodes:
         node.tag = new_tag
 
 
@@ -334,7 +522,11 @@ def lift_up(tree: etree._ElementTree, tag: str) -> None:
     Returns:
         None
     """
-    for node in tree.xpath("//" + tag):
+    _lift_up(compiled_xpath("//" + tag)(tree))
+
+
+def _lift_up(nodes: Iterable[etree._Element]) -> None:
+    for node in nodes:
         parent = node.getparent()
         parent.remove(node)
         if parent.text:
@@ -359,7 +551,11 @@ def combine_siblings(tree: etree._ElementTree, tag: str) -> None:
     Returns:
         None
     """
-    tags = list(tree.xpath("//" + tag))
+    _combine_siblings(compiled_xpath("//" + tag)(tree))
+
+
+def _combine_siblings(nodes: Iterable[etree._Element]) -> None:
+    tags = list(nodes)
     tags.reverse()
     for node, nxt in pairwise(tags):
         # neighbors?
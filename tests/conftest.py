@@ -1,10 +1,70 @@
 """
-    Dummy conftest.py for pali_learn.
+    Shared fixtures for the palipedia tests.
 
-    If you don't know what this is for, just leave it empty.
     Read more about conftest.py under:
     - https://docs.pytest.org/en/stable/fixture.html
     - https://docs.pytest.org/en/stable/writing_plugins.html
 """
+import multiprocessing
+import resource
 
-# import pytest
+import pytest
+
+import palipedia.transform.sutta as sutta
+from palipedia.synthetic import CorpusGenerator
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--corpus-scale",
+        type=int,
+        default=1,
+        help="Scale of the synthetic corpus used by the tests and benchmarks.",
+    )
+
+
+@pytest.fixture(scope="session")
+def corpus(request, tmp_path_factory):
+    """The toc file of a synthetic corpus, shared by all tests."""
+    scale = request.config.getoption("--corpus-scale")
+    dest = tmp_path_factory.mktemp("corpus")
+    return CorpusGenerator(
+        dest, chapters=3 * scale, paragraphs=4 * scale
+    ).generate()
+
+
+def read_tree(dest):
+    """Returns the contents of every xml file below dest, by relative path."""
+    return {
+        str(f.relative_to(dest)): f.read_bytes()
+        for f in sorted(dest.rglob("*.xml"))
+    }
+
+
+@pytest.fixture(scope="module")
+def serial(corpus, tmp_path_factory):
+    """The output of a serial transformation of the corpus, by relative path."""
+    dest = tmp_path_factory.mktemp("serial")
+    sutta.TipitikaTransformer(corpus, dest, incremental=False).transform()
+    return read_tree(dest)
+
+
+def _report_rss(fn, conn):
+    fn()
+    conn.send(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    conn.close()
+
+
+def peak_rss(fn):
+    """Runs fn in a forked process and returns the growth of its peak RSS in KiB."""
+    ctx = multiprocessing.get_context("fork")
+
+    def run(target):
+        recv, send = ctx.Pipe(duplex=False)
+        proc = ctx.Process(target=_report_rss, args=(target, send))
+        proc.start()
+        rss = recv.recv()
+        proc.join()
+        return rss
+
+    return run(fn) - run(lambda: None)
@@ -0,0 +1,94 @@
+import pytest
+
+from palipedia.transform.align import Alignment, build_alignment
+
+__author__ = "Erwin Jansen"
+__copyright__ = "Erwin Jansen"
+__license__ = "Apache-2.0"
+
+TOC = """<?xml version='1.0' encoding='UTF-8'?>
+<root xmlns:xi="http://www.w3.org/2001/XInclude">
+  <book title="Dīghanikāya">
+    <xi:include href="a/1.xml"/>
+    <xi:include href="a/{second}.xml"/>
+  </book>
+</root>
+"""
+
+# The verses after paragraph 2 are merged in the target, but not in the source.
+SOURCE = """<?xml version='1.0' encoding='UTF-8'?>
+<chapter title="Sutta">
+  <p>Namo tassa</p>
+  <p nr="1">evaṃ me sutaṃ ekaṃ samayaṃ</p>
+  <p nr="2">tatra kho bhagavā</p>
+  <verse>a b c d</verse>
+  <verse>e f</verse>
+  <verse>g h</verse>
+  <p nr="3-4">bhikkhū āmantesi</p>
+  <p nr="1">dutiyaṃ</p>
+</chapter>
+"""
+
+TARGET = """<?xml version='1.0' encoding='UTF-8'?>
+<chapter title="Sutta">
+  <p>नमो तस्स</p>
+  <p nr="1">एवं मे सुतं एकं समयं</p>
+  <p nr="2">तत्र खो भगवा</p>
+  <verse>अ ब च द ए फ</verse>
+  <verse>ग ह</verse>
+  <p nr="3-4">भिक्खू आमन्तेसि</p>
+  <p nr="1">दुतियं</p>
+</chapter>
+"""
+
+
+def _output(path, chapter, second):
+    (path / "a").mkdir(parents=True)
+    (path / "toc.xml").write_text(TOC.format(second=second), encoding="utf-8")
+    (path / "a" / "1.xml").write_text(chapter, encoding="utf-8")
+    (path / "a" / f"{second}.xml").write_text(chapter, encoding="utf-8")
+    return path
+
+
+@pytest.fixture
+def alignment(tmp_path):
+    source = _output(tmp_path / "romn", SOURCE, 2)
+    target = _output(tmp_path / "deva", TARGET, 3)
+    # The second chapters have different names and are not aligned.
+    assert build_alignment(source, target, tmp_path / "align") == 8
+    return Alignment(tmp_path / "align")
+
+
+def test_map(alignment):
+    assert (len(alignment.source), len(alignment.target)) == (16, 14)
+    assert [alignment.map(u) for u in range(8)] == [
+        range(0, 1),
+        range(1, 2),
+        range(2, 3),
+        range(3, 4),
+        range(3, 4),
+        range(4, 5),
+        range(5, 6),
+        range(6, 7),
+    ]
+    assert alignment.map(3, reverse=True) == range(3, 5)
+    assert alignment.map(8) == range(0)
+    assert alignment.map(7, reverse=True) == range(0)
+
+
+def test_lookup(alignment):
+    assert alignment.lookup("a/1.xml", 4) == [("a/1.xml", (3, 4), 5)]
+    assert alignment.lookup("a/1.xml", 2, offset=3) == [("a/1.xml", (-1, -1), 4)]
+    assert alignment.lookup("a/1.xml", 2, offset=1, reverse=True) == [
+        ("a/1.xml", (-1, -1), 3),
+        ("a/1.xml", (-1, -1), 4),
+    ]
+    # The first paragraph with a number is found, the repeated nr is aligned too.
+    assert alignment.lookup("a/1.xml", 1) == [("a/1.xml", (1, 1), 1)]
+    assert alignment.map(7) == range(6, 7)
+    with pytest.raises(KeyError):
+        alignment.lookup("a/1.xml", 5)
+    with pytest.raises(KeyError):
+        alignment.lookup("a/1.xml", 4, offset=3)
+    with pytest.raises(KeyError):
+        alignment.lookup("a/9.xml", 1)
@@ -0,0 +1,91 @@
+import pytest
+from lxml import etree
+
+import palipedia.transform.sutta as sutta
+from palipedia.transform.archive import ArchiveReader, ArchiveWriter
+
+__author__ = "Erwin Jansen"
+__copyright__ = "Erwin Jansen"
+__license__ = "Apache-2.0"
+
+_INCLUDE = "{http://www.w3.org/2001/XInclude}include"
+
+
+def test_round_trip(tmp_path):
+    fname = tmp_path / "a.pali"
+    with ArchiveWriter(fname) as writer:
+        writer.add("Ā/1.xml", b"<chapter/>")
+        writer.add("B/2.xml", b"<chapter>two</chapter>")
+        writer.add("Ā/1.xml", b"<chapter>one</chapter>")
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.pali"]
+
+    with ArchiveReader(fname) as reader:
+        assert reader.names() == ["Ā/1.xml", "B/2.xml"]
+        assert reader.read("Ā/1.xml") == b"<chapter>one</chapter>"
+        assert reader.parse("B/2.xml").text == "two"
+        assert reader.read("B/2.xml", 8) == b"<chapter"
+        with pytest.raises(KeyError):
+            reader.read("C/3.xml")
+
+
+def test_close_in_order(tmp_path):
+    fname = tmp_path / "a.pali"
+    writer = ArchiveWriter(fname)
+    for name in ["c.xml", "a.xml", "b.xml"]:
+        writer.add(name, f"<{name[0]}/>".encode())
+    writer.close(["a.xml", "b.xml", "x.xml"])
+    with ArchiveReader(fname) as reader:
+        assert reader.names() == ["a.xml", "b.xml", "c.xml"]
+        assert [reader.read(n) for n in reader.names()] == [b"<a/>", b"<b/>", b"<c/>"]
+
+
+def test_abort_leaves_no_file(tmp_path):
+    with pytest.raises(ValueError):
+        with ArchiveWriter(tmp_path / "a.pali") as writer:
+            writer.add("a.xml", b"<a/>")
+            raise ValueError()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_not_an_archive(tmp_path):
+    (tmp_path / "a.xml").write_bytes(b"<chapter/>")
+    with pytest.raises(ValueError):
+        ArchiveReader(tmp_path / "a.xml")
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{}, {"workers": 2}, {"workers": 2, "pool": "thread"}],
+    ids=["serial", "processes", "threads"],
+)
+def test_transform_archive(corpus, tmp_path, serial, options):
+    sutta.TipitikaTransformer(
+        corpus, tmp_path, archive="tipitaka.pali", **options
+    ).transform()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["tipitaka.pali", "toc.xml"]
+
+    toc = etree.parse(str(tmp_path / "toc.xml")).getroot()
+    assert toc.get("archive") == "tipitaka.pali"
+    with ArchiveReader(tmp_path / toc.get("archive")) as reader:
+        chapters = {name: reader.read(name) for name in reader.names()}
+        assert chapters == {k: v for k, v in serial.items() if k != "toc.xml"}
+        reader.include(toc)
+    assert len(toc.findall(".//chapter")) == len(chapters)
+
+
+def test_archive_cannot_stream(corpus, tmp_path):
+    with pytest.raises(ValueError):
+        sutta.TipitikaTransformer(corpus, tmp_path, archive="a.pali", streaming=True)
+
+
+def test_threads_are_reproducible(corpus, tmp_path):
+    archives = []
+    for run in ["first", "second"]:
+        sutta.TipitikaTransformer(
+            corpus, tmp_path / run, workers=4, pool="thread", archive="a.pali"
+        ).transform()
+        archives.append((tmp_path / run / "a.pali").read_bytes())
+        toc = etree.parse(str(tmp_path / run / "toc.xml")).getroot()
+        with ArchiveReader(tmp_path / run / "a.pali") as reader:
+            assert reader.names() == [e.get("href") for e in toc.iter(_INCLUDE)]
+    assert archives[0] == archives[1]
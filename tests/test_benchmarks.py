@@ -0,0 +1,148 @@
+"""Benchmarks of the xml helpers, the cleanup stages and the whole transformation.
+
+Run with a bigger corpus to get more stable numbers:
+    pytest tests/test_benchmarks.py --corpus-scale 10
+"""
+import copy
+import shutil
+
+import pytest
+
+import palipedia.transform.sutta as sutta
+import palipedia.transform.xml as xml
+from conftest import peak_rss
+
+__author__ = "Erwin Jansen"
+__copyright__ = "Erwin Jansen"
+__license__ = "Apache-2.0"
+
+HELPERS = [
+    ("remove", (["chapter", "book", "nikaya"],)),
+    ("remove_query", ("//pb",)),
+    ("rename", ("p", "para")),
+    ("lift_up", ("note",)),
+    ("siblings_to_child", ("section",)),
+    ("neighbor_to_child", (["subsection"],)),
+    ("remove_empty", (["p"],)),
+    ("combine_siblings", ("verse",)),
+    ("text_to_attr", ("note", "text")),
+    ("trim_text", ()),
+]
+
+# The passes that TipitikaTransformer._cleanup fuses into one traversal, in order.
+STAGES = [
+    ("remove", lambda t, root: xml.remove(root, ["chapter", "book", "nikaya"])),
+    ("siblings_to_child", lambda t, root: xml.siblings_to_child(root, "section")),
+    ("siblings_to_sub", lambda t, root: xml.siblings_to_child(root, "subsection")),
+    ("merge_verses", lambda t, root: t._merge_verses(root)),
+    ("lift_numbers", lambda t, root: t._lift_numbers(root)),
+    ("trim_text", lambda t, root: xml.trim_text(root)),
+    ("extract_nr_from_title", lambda t, root: t._extract_nr_from_title(root)),
+]
+
+
+@pytest.fixture(scope="module")
+def transformer(corpus, tmp_path_factory):
+    return sutta.TipitikaTransformer(corpus, tmp_path_factory.mktemp("out"))
+
+
+@pytest.fixture(scope="module")
+def chapter_file(corpus):
+    return sorted((corpus.parent / "cscd").glob("*.xml"))[0]
+
+
+@pytest.fixture(scope="module")
+def transformed(transformer, chapter_file):
+    """A chapter as produced by the stylesheet, before any cleanup."""
+    return transformer.xlst(xml.parse(chapter_file)).getroot()
+
+
+def record_throughput(benchmark, count, unit):
+    """Records the number of processed items per second of the benchmark."""
+    benchmark.extra_info[unit] = count
+    if benchmark.stats is None:
+        return  # Benchmarks are disabled.
+    benchmark.extra_info[unit + "_per_s"] = count / benchmark.stats.stats.mean
+
+
+@pytest.mark.parametrize("name,args", HELPERS, ids=[h[0] for h in HELPERS])
+def test_bench_helper(benchmark, transformed, name, args):
+    benchmark.group = "xml"
+    helper = getattr(xml, name)
+    benchmark.pedantic(
+        lambda tree: helper(tree, *args),
+        setup=lambda: ((copy.deepcopy(transformed),), {}),
+        rounds=50,
+    )
+    record_throughput(benchmark, len(list(transformed.iter())), "elements")
+
+
+def test_bench_parse(benchmark, chapter_file):
+    benchmark.group = "xml"
+    root = benchmark(xml.parse, chapter_file)
+    record_throughput(benchmark, len(list(root.iter())), "elements")
+
+
+def test_bench_write_xml(benchmark, transformed, tmp_path):
+    benchmark.group = "xml"
+    benchmark(xml.write_xml, str(tmp_path / "out.xml"), transformed)
+    record_throughput(benchmark, (tmp_path / "out.xml").stat().st_size, "bytes")
+
+
+def test_bench_xslt(benchmark, transformer, chapter_file):
+    benchmark.group = "stages"
+    tree = xml.parse(chapter_file)
+    benchmark(transformer.xlst, tree)
+    record_throughput(benchmark, len(list(tree.iter())), "elements")
+
+
+@pytest.mark.parametrize("stage", range(len(STAGES)), ids=[s[0] for s in STAGES])
+def test_bench_stage(benchmark, transformer, transformed, stage):
+    benchmark.group = "stages"
+
+    def setup():
+        root = copy.deepcopy(transformed)
+        for _, previous in STAGES[:stage]:
+            previous(transformer, root)
+        return (root,), {}
+
+    benchmark.pedantic(
+        lambda root: STAGES[stage][1](transformer, root), setup=setup, rounds=50
+    )
+    record_throughput(benchmark, len(list(transformed.iter())), "elements")
+
+
+def test_bench_cleanup(benchmark, transformer, transformed):
+    benchmark.group = "stages"
+    benchmark.pedantic(
+        transformer._cleanup,
+        setup=lambda: ((copy.deepcopy(transformed),), {}),
+        rounds=50,
+    )
+    record_throughput(benchmark, len(list(transformed.iter())), "elements")
+
+
+MODES = {
+    "serial": {},
+    "streaming": {"streaming": True},
+    "threads": {"workers": 2, "pool": "thread"},
+    "processes": {"workers": 2},
+}
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_bench_transform(benchmark, corpus, tmp_path, mode):
+    benchmark.group = "transform"
+    dest = tmp_path / "out"
+
+    def transform():
+        sutta.TipitikaTransformer(
+            corpus, dest, incremental=False, **MODES[mode]
+        ).transform()
+
+    benchmark.pedantic(
+        transform, setup=lambda: shutil.rmtree(dest, ignore_errors=True), rounds=3
+    )
+    chapters = len(list(dest.rglob("*.xml"))) - 1
+    record_throughput(benchmark, chapters, "chapters")
+    benchmark.extra_info["peak_rss_kb"] = peak_rss(transform)
@@ -0,0 +1,65 @@
+import os
+
+from lxml import etree
+
+import palipedia.transform.sutta as sutta
+from palipedia.transform.cache import TreeCache
+
+__author__ = "Erwin Jansen"
+__copyright__ = "Erwin Jansen"
+__license__ = "Apache-2.0"
+
+
+def test_cache(tmp_path):
+    fname = tmp_path / "a.xml"
+    fname.write_text("<a><b/></a>")
+    cache = TreeCache(2)
+    builds = []
+
+    def build():
+        builds.append(1)
+        return etree.fromstring(fname.read_bytes())
+
+    tree = cache.get("parse", fname, build)
+    tree.clear()
+    # Every lookup returns a copy, so changes to a result do not leak into the cache.
+    assert len(cache.get("parse", fname, build)) == 1
+    assert (cache.hits, cache.misses, len(builds)) == (1, 1, 1)
+
+    cache.get("xslt", fname, build)
+    assert cache.misses == 2
+
+    # A file that changed on disk is built again.
+    fname.write_text("<a><b/><c/></a>")
+    os.utime(fname, ns=(0, 10**9))
+    assert len(cache.get("parse", fname, build)) == 2
+    assert cache.misses == 3
+    assert len(cache) == 2
+
+
+def test_disabled_cache(tmp_path):
+    fname = tmp_path / "a.xml"
+    fname.write_text("<a/>")
+    cache = TreeCache(0)
+    for _ in range(2):
+        cache.get("parse", fname, lambda: etree.fromstring(fname.read_bytes()))
+    assert (cache.hits, cache.misses, len(cache)) == (0, 2, 0)
+
+
+def test_transformer_caches_stylesheet_results(corpus, tmp_path):
+    transformer = sutta.TipitikaTransformer(
+        corpus, tmp_path, incremental=False, cache_size=1000
+    )
+    transformer.transform()
+    kinds = {}
+    for kind, fname, _ in transformer.cache._trees:
+        kinds.setdefault(kind, set()).add(fname)
+    chapters = {str(f.resolve()) for f in (corpus.parent / "cscd").glob("*.xml")}
+    # Chapter files are only cached after the stylesheet, tocs only parsed.
+    assert kinds["xslt"] <= chapters
+    assert not kinds["parse"] & chapters
+
+    misses = transformer.cache.misses
+    transformer.transform()
+    assert transformer.cache.misses == misses
+    assert transformer.cache.hits >= len(kinds["xslt"]) + len(kinds["parse"])
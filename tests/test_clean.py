@@ -0,0 +1,60 @@
+import shutil
+import sqlite3
+
+import pytest
+
+import palipedia.clean as clean
+from palipedia.transform.flat import FlatCorpus
+from palipedia.transform.search import SearchIndex
+
+__author__ = "Erwin Jansen"
+__copyright__ = "Erwin Jansen"
+__license__ = "Apache-2.0"
+
+
+@pytest.fixture
+def run():
+    """Runs clean.py with command line arguments."""
+
+    def run(*args):
+        clean.FLAGS(["clean.py", *args])
+        clean.main([])
+
+    yield run
+    clean.FLAGS.unparse_flags()
+
+
+def test_exports(corpus, tmp_path, run):
+    run(
+        f"--src={corpus}",
+        f"--out={tmp_path / 'out'}",
+        f"--export_text={tmp_path / 'flat'}",
+        f"--index={tmp_path / 'index'}",
+        f"--sqlite={tmp_path / 'tipitika.db'}",
+    )
+    units = len(FlatCorpus(tmp_path / "flat"))
+    assert units > 0
+    assert len(SearchIndex(tmp_path / "index")) > 0
+    with sqlite3.connect(tmp_path / "tipitika.db") as db:
+        assert db.execute("SELECT COUNT(*) FROM units").fetchone() == (units,)
+
+
+def test_exports_per_script(corpus, tmp_path, run):
+    for script in ("romn", "deva"):
+        shutil.copytree(corpus.parent, tmp_path / "src" / script)
+    run(
+        f"--src={tmp_path / 'src' / 'romn' / corpus.name}",
+        f"--out={tmp_path / 'out'}",
+        "--scripts=deva",
+        f"--export_text={tmp_path / 'flat'}",
+        "--dedup",
+        f"--index={tmp_path / 'index'}",
+        f"--sqlite={tmp_path / 'tipitika.db'}",
+    )
+    for script in ("romn", "deva"):
+        units = len(FlatCorpus(tmp_path / "flat" / script))
+        assert units > 0
+        assert len(SearchIndex(tmp_path / "index" / script)) > 0
+        with sqlite3.connect(tmp_path / f"tipitika.{script}.db") as db:
+            assert db.execute("SELECT COUNT(*) FROM units").fetchone() == (units,)
+    assert not (tmp_path / "tipitika.db").exists()
@@ -0,0 +1,86 @@
+import contextlib
+import sqlite3
+
+import pytest
+
+import palipedia.transform.sutta as sutta
+from palipedia.transform.database import SqliteExporter
+from palipedia.transform.flat import ChapterSource, units
+
+__author__ = "Erwin Jansen"
+__copyright__ = "Erwin Jansen"
+__license__ = "Apache-2.0"
+
+
+@pytest.fixture(scope="module", params=[None, "chapters.arc"])
+def output(request, corpus, tmp_path_factory):
+    dest = tmp_path_factory.mktemp("database")
+    sutta.TipitikaTransformer(
+        corpus, dest, incremental=False, archive=request.param
+    ).transform()
+    return dest
+
+
+def test_export(output, tmp_path):
+    db_file = tmp_path / "canon.db"
+    count = SqliteExporter(output, batch_size=10).export(db_file)
+    with ChapterSource(output) as source:
+        names = source.names()
+        expected = sum(len(list(units(source.parse(n)))) for n in names)
+        first = source.parse(names[0])
+    assert count == expected
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["canon.db"]
+
+    with contextlib.closing(sqlite3.connect(db_file)) as db:
+        assert db.execute("SELECT count(*) FROM units").fetchone() == (count,)
+        chapters = db.execute(
+            "SELECT href FROM nodes WHERE level = 'chapter' ORDER BY id"
+        ).fetchall()
+        assert [c for c, in chapters] == names
+
+        # The path of the first chapter, up to the root.
+        levels = db.execute(
+            """
+            WITH RECURSIVE path(id, parent, level) AS (
+                SELECT id, parent, level FROM nodes WHERE href = ?
+                UNION ALL
+                SELECT nodes.id, nodes.parent, nodes.level
+                FROM nodes JOIN path ON nodes.id = path.parent
+            ) SELECT level FROM path
+            """,
+            (names[0],),
+        ).fetchall()
+        assert [level for level, in levels][0] == "chapter"
+        assert levels[-1] == ("collection",)
+
+        rows = db.execute(
+            "SELECT tag, class, units.nr FROM units "
+            "JOIN nodes ON nodes.id = units.chapter "
+            "WHERE nodes.href = ? ORDER BY units.position",
+            (names[0],),
+        ).fetchall()
+        assert rows == [(u.tag, u.get("class"), u.get("nr")) for u in units(first)]
+
+        nr = db.execute(
+            "SELECT nr, nr_start, nr_end FROM units WHERE nr IS NOT NULL LIMIT 1"
+        ).fetchone()
+        assert nr[1] == int(nr[0].split("-")[0])
+
+
+def test_full_text(output, tmp_path):
+    db_file = tmp_path / "canon.db"
+    SqliteExporter(output).export(db_file)
+    with contextlib.closing(sqlite3.connect(db_file)) as db:
+        query = (
+            "SELECT units.text FROM units_fts JOIN units ON units.id = units_fts.rowid"
+            " WHERE units_fts MATCH ? ORDER BY units.id"
+        )
+        found = db.execute(query, ("sutaṃ",)).fetchall()
+        assert found
+        assert all("sutaṃ" in text for text, in found)
+        # Diacritics are folded by the tokenizer.
+        assert db.execute(query, ("sutam",)).fetchall() == found
+
+    # Exporting again replaces the database.
+    SqliteExporter(output).export(db_file)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["canon.db"]
@@ -0,0 +1,87 @@
+import json
+
+import numpy as np
+import pytest
+
+import palipedia.transform.sutta as sutta
+from palipedia.transform.duplicates import (
+    DUPLICATES,
+    PassageDetector,
+    cluster_corpus,
+    find_duplicates,
+)
+from palipedia.transform.flat import FlatCorpus, FlatExporter
+
+__author__ = "Erwin Jansen"
+__copyright__ = "Erwin Jansen"
+__license__ = "Apache-2.0"
+
+FORMULA = (
+    "evaṃ me sutaṃ ekaṃ samayaṃ bhagavā sāvatthiyaṃ viharati jetavane "
+    "anāthapiṇḍikassa ārāme tatra kho bhagavā bhikkhū āmantesi bhikkhavo ti"
+)
+
+
+def test_detector():
+    texts = [
+        FORMULA,
+        "kusalaṃ dhammaṃ ñāṇadassanaṃ paṭipadā paññā",
+        FORMULA.upper(),
+        # One word changed at the end.
+        FORMULA.replace("bhikkhavo", "āvuso"),
+        "kusalaṃ dhammaṃ ñāṇadassanaṃ paṭipadā paññā",
+        "paññā paṭipadā ñāṇadassanaṃ dhammaṃ kusalaṃ",
+        "ti",
+        "ti",
+        "",
+    ]
+    assert find_duplicates(texts).tolist() == [0, 1, 0, 0, 1, 5, 6, 6, 8]
+    # A stricter threshold only keeps exact repeats.
+    assert find_duplicates(texts, threshold=1.0).tolist()[:4] == [0, 1, 0, 3]
+
+    detector = PassageDetector()
+    assert detector.signature(FORMULA).shape == (64,)
+    assert np.array_equal(detector.signature(FORMULA), detector.signature(FORMULA))
+
+
+@pytest.fixture(scope="module")
+def output(corpus, tmp_path_factory):
+    dest = tmp_path_factory.mktemp("duplicates")
+    sutta.TipitikaTransformer(corpus, dest, incremental=False).transform()
+    return dest
+
+
+def test_deduplicated_export(output, tmp_path):
+    count = FlatExporter(output).export(tmp_path / "flat")
+    FlatExporter(output).export(tmp_path / "dedup", PassageDetector())
+    full = FlatCorpus(tmp_path / "flat")
+    dedup = FlatCorpus(tmp_path / "dedup")
+    assert len(dedup) == count
+    assert full.clusters is None and not full.deduplicated
+    assert full.references is None
+    assert dedup.deduplicated
+
+    repeats = np.flatnonzero(dedup.clusters != np.arange(count))
+    assert len(repeats) > 0
+    assert (dedup.clusters[repeats] < repeats).all()
+    references = np.flatnonzero(dedup.references != np.arange(count))
+    assert len(references) > 0
+    assert set(references) < set(repeats)
+    assert (
+        (tmp_path / "dedup" / "text.bin").stat().st_size
+        < (tmp_path / "flat" / "text.bin").stat().st_size
+    )
+    for unit in references:
+        assert bytes(dedup.data(unit, unit + 1)) == b"\n"
+    # Near duplicates keep their own text, no unit reads back different text.
+    assert [dedup[u] for u in range(count)] == [full[u] for u in range(count)]
+    unique = dedup.unique()
+    assert len(unique) + len(repeats) == count
+
+    # Clustering the full corpus finds the same repeats.
+    summary = cluster_corpus(tmp_path / "flat")
+    assert summary["repeats"] == len(repeats)
+    assert summary["threshold"] == 0.8
+    assert json.loads((tmp_path / "flat" / DUPLICATES).read_text()) == summary
+    assert np.array_equal(FlatCorpus(tmp_path / "flat").clusters, dedup.clusters)
+    assert not FlatCorpus(tmp_path / "flat").deduplicated
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+import palipedia.transform.sutta as sutta
+from palipedia.transform.flat import LEVELS, FlatCorpus, FlatExporter
+
+__author__ = "Erwin Jansen"
+__copyright__ = "Erwin Jansen"
+__license__ = "Apache-2.0"
+
+CHAPTER = """<?xml version='1.0' encoding='UTF-8'?>
+<chapter title="Brahmajālasuttaṃ" nr="1">
+  <section title="Kathā">
+    <p nr="1">Evaṃ me <b>sutaṃ</b></p>
+    <verse nr="2-4">a, b.</verse>
+    <p>tatra</p>
+  </section>
+</chapter>
+"""
+
+TOC = """<?xml version='1.0' encoding='UTF-8'?>
+<root xmlns:xi="http://www.w3.org/2001/XInclude">
+  <collection title="Suttapiṭaka">
+    <book title="Dīghanikāya">
+      <xi:include href="a/1.xml"/>
+      <xi:include href="a/2.xml"/>
+    </book>
+  </collection>
+</root>
+"""
+
+
+@pytest.fixture
+def output(tmp_path):
+    dest = tmp_path / "out"
+    (dest / "a").mkdir(parents=True)
+    (dest / "toc.xml").write_text(TOC, encoding="utf-8")
+    (dest / "a" / "1.xml").write_text(CHAPTER, encoding="utf-8")
+    (dest / "a" / "2.xml").write_text(
+        CHAPTER.replace("Brahmajāla", "Sāmaññaphala"), encoding="utf-8"
+    )
+    return dest
+
+
+def test_export(output, tmp_path):
+    assert FlatExporter(output).export(tmp_path / "flat") == 6
+    corpus = FlatCorpus(tmp_path / "flat")
+    assert isinstance(corpus.offsets, np.memmap)
+    assert len(corpus) == 6
+    assert [corpus[i] for i in range(3)] == ["Evaṃ me sutaṃ", "a, b.", "tatra"]
+    assert bytes(corpus.data(1, 3)).decode("utf-8") == "a, b.\ntatra\n"
+    assert corpus.nr[:3].tolist() == [[1, 1], [2, 4], [-1, -1]]
+
+    chapter = LEVELS.index("chapter")
+    assert corpus.ids[:, chapter].tolist() == [0, 0, 0, 1, 1, 1]
+    assert corpus.titles["chapter"] == ["Brahmajālasuttaṃ", "Sāmaññaphalasuttaṃ"]
+    assert corpus.select("chapter", 1) == range(3, 6)
+    assert corpus.select("collection", 0) == range(0, 6)
+    assert corpus.select("nikaya", 0) == range(0)
+
+
+def test_export_empty(tmp_path):
+    (tmp_path / "out").mkdir()
+    (tmp_path / "out" / "toc.xml").write_text("<root/>")
+    assert FlatExporter(tmp_path / "out").export(tmp_path / "flat") == 0
+    assert len(FlatCorpus(tmp_path / "flat")) == 0
+
+
+def test_export_archive(corpus, tmp_path):
+    sutta.TipitikaTransformer(corpus, tmp_path / "files").transform()
+    sutta.TipitikaTransformer(
+        corpus, tmp_path / "archive", archive="tipitaka.pali"
+    ).transform()
+    files = FlatExporter(tmp_path / "files").export(tmp_path / "flat_files")
+    archive = FlatExporter(tmp_path / "archive").export(tmp_path / "flat_archive")
+    assert files == archive > 0
+    for name in ["text.bin", "offsets.npy", "ids.npy", "nr.npy"]:
+        assert (tmp_path / "flat_files" / name).read_bytes() == (
+            tmp_path / "flat_archive" / name
+        ).read_bytes()
@@ -0,0 +1,80 @@
+import json
+import shutil
+
+import palipedia.transform.sutta as sutta
+from palipedia.transform.merkle import MerkleManifest, changes, tree_hashes
+
+__author__ = "Erwin Jansen"
+__copyright__ = "Erwin Jansen"
+__license__ = "Apache-2.0"
+
+
+def test_tree_hashes():
+    files = {"toc.xml": "t", "a/b/1.xml": "1", "a/b/2.xml": "2", "a/c/1.xml": "3"}
+    before = tree_hashes(files)
+    assert set(before) == {"", "a/", "a/b/", "a/c/"}
+    after = tree_hashes({**files, "a/c/1.xml": "4"})
+    assert after["a/b/"] == before["a/b/"]
+    assert after["a/c/"] != before["a/c/"]
+    assert after[""] != before[""]
+
+    previous = {**files, **before}
+    del files["a/b/2.xml"]
+    files["d/1.xml"] = "5"
+    feed = changes(previous, {**files, **tree_hashes(files)})
+    assert feed["added"] == ["d/", "d/1.xml"]
+    assert feed["modified"] == ["a/", "a/b/"]
+    assert feed["removed"] == ["a/b/2.xml"]
+
+
+def _feed(dest):
+    with open(dest / MerkleManifest.CHANGES, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_change_feed(corpus, tmp_path):
+    src = tmp_path / "src"
+    shutil.copytree(corpus.parent, src)
+    toc = src / corpus.name
+    dest = tmp_path / "out"
+    sutta.TipitikaTransformer(toc, dest, merkle=True).transform()
+    feed = _feed(dest)
+    assert feed["previous_root"] is None
+    assert "toc.xml" in feed["added"]
+    first = feed["root"]
+
+    sutta.TipitikaTransformer(toc, dest, merkle=True).transform()
+    feed = _feed(dest)
+    assert feed["root"] == feed["previous_root"] == first
+    assert feed["added"] == feed["modified"] == feed["removed"] == []
+
+    chapter = sorted((src / "cscd").glob("*.xml"))[0]
+    chapter.write_text(
+        chapter.read_text("utf-8").replace("evaṃ", "evam"), encoding="utf-8"
+    )
+    sutta.TipitikaTransformer(toc, dest, merkle=True).transform()
+    feed = _feed(dest)
+    assert feed["previous_root"] == first != feed["root"]
+    assert feed["added"] == feed["removed"] == []
+    files = [p for p in feed["modified"] if not p.endswith("/")]
+    assert len(files) == 1
+    parts = files[0].split("/")
+    assert feed["modified"] == sorted(
+        ["/".join(parts[:i]) + "/" for i in range(1, len(parts))] + files
+    )
+
+
+def test_off_by_default(corpus, tmp_path):
+    sutta.TipitikaTransformer(corpus, tmp_path).transform()
+    assert not (tmp_path / MerkleManifest.FILENAME).exists()
+    assert not (tmp_path / MerkleManifest.CHANGES).exists()
+
+
+def test_archive(corpus, tmp_path):
+    sutta.TipitikaTransformer(
+        corpus, tmp_path, archive="chapters.arc", merkle=True
+    ).transform()
+    with open(tmp_path / MerkleManifest.FILENAME, encoding="utf-8") as f:
+        manifest = json.load(f)
+    assert manifest["tree"][""] == _feed(tmp_path)["root"]
+    assert len(manifest["files"]) > 1
@@ -0,0 +1,116 @@
+import shutil
+import unicodedata
+
+import pytest
+from conftest import read_tree
+from lxml import etree
+
+import palipedia.transform.sutta as sutta
+from palipedia.transform.flat import unit_text, units
+from palipedia.transform.normalize import PROFILES, Normalizer, Profile, normalizer
+
+__author__ = "Erwin Jansen"
+__copyright__ = "Erwin Jansen"
+__license__ = "Apache-2.0"
+
+# Decomposed ṃ, a ṁ and runs of whitespace.
+TEXT = "Evaṃ  me\tsutaṁ.\n Ekaṃ SAMAYAṀ"
+
+
+def test_profiles():
+    decomposed = unicodedata.normalize("NFD", "sutaṃ")
+    assert normalizer("nfc")(decomposed) == "sutaṃ"
+    assert normalizer("nfc")(TEXT) == "Evaṃ  me\tsutaṁ.\n Ekaṃ SAMAYAṀ"
+    assert normalizer("canonical")(TEXT) == "Evaṃ me sutaṃ. Ekaṃ SAMAYAṂ"
+    assert normalizer("folded")(TEXT) == "Evam me sutam. Ekam SAMAYAM"
+    assert normalizer("folded")("Ñāṇa ṭhāna ḍaṃsa ḷ ṅ ī ū") == (
+        "Nana thana damsa l n i u"
+    )
+    assert Normalizer(Profile(niggahita="ṁ"))("Evaṃ sutaṁ") == "Evaṁ sutaṁ"
+    with pytest.raises(ValueError):
+        Normalizer(Profile(niggahita="m"))
+    with pytest.raises(ValueError):
+        normalizer("lowercase")
+
+
+@pytest.mark.parametrize("name", list(PROFILES))
+def test_batch(name):
+    normalize = normalizer(name)
+    texts = [TEXT, "", " ", "̣a", "x\0y", TEXT.upper()]
+    assert normalize.batch(texts) == [normalize(t) for t in texts]
+    assert normalize.batch(texts[:4]) == [normalize(t) for t in texts[:4]]
+    assert normalize.batch([]) == []
+
+
+def test_tree():
+    root = etree.fromstring(
+        "<p>Evaṃ  me<b>sutaṁ</b> ekaṃ <pb/>samayaṁ</p>".encode("utf-8")
+    )
+    assert normalizer("canonical").tree(root.iter("*")) == 3
+    assert etree.tostring(root, encoding="unicode") == (
+        "<p>Evaṃ me<b>sutaṃ</b> ekaṃ <pb/>samayaṃ</p>"
+    )
+    assert normalizer("canonical").tree(root.iter("*")) == 0
+
+    decomposed = unicodedata.normalize("NFD", "Saṃyutta")
+    root = etree.fromstring(
+        f'<section title="{decomposed}"><p title="Evaṁ">x</p></section>'.encode("utf-8")
+    )
+    assert normalizer("canonical").tree(root.iter("*")) == 2
+    assert [n.get("title") for n in root.iter("*")] == ["Saṃyutta", "Evaṃ"]
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{}, {"workers": 2}, {"streaming": True}],
+    ids=["serial", "processes", "streaming"],
+)
+def test_transform(corpus, tmp_path, serial, options):
+    sutta.TipitikaTransformer(
+        corpus, tmp_path, incremental=False, normalize="folded", **options
+    ).transform()
+    tree = read_tree(tmp_path)
+    assert tree.keys() == serial.keys()
+    fold = normalizer("folded")
+    for name, data in tree.items():
+        chapter = etree.fromstring(data)
+        expected = etree.fromstring(serial[name])
+        assert [e.attrib for e in chapter.iter()] == [
+            {k: fold(v) if k == "title" else v for k, v in e.attrib.items()}
+            for e in expected.iter()
+        ]
+        assert [unit_text(u) for u in units(chapter)] == [
+            fold(unit_text(u)) for u in units(expected)
+        ]
+        assert all(t.isascii() for t in chapter.itertext())
+
+
+def test_titles(corpus, tmp_path):
+    # The same corpus, writing every niggahita as ṁ.
+    source = tmp_path / "source"
+    shutil.copytree(corpus.parent, source)
+    for f in source.rglob("*.xml"):
+        f.write_text(f.read_text(encoding="utf-8").replace("ṃ", "ṁ"), encoding="utf-8")
+    toc = source / corpus.name
+    sutta.TipitikaTransformer(toc, tmp_path / "raw", incremental=False).transform()
+    sutta.TipitikaTransformer(
+        toc, tmp_path / "out", incremental=False, normalize="canonical"
+    ).transform()
+
+    raw = read_tree(tmp_path / "raw")
+    out = read_tree(tmp_path / "out")
+    # The chapters are still named after the titles of the source.
+    assert out.keys() == raw.keys()
+    assert any("ṁ".encode("utf-8") in data for data in raw.values())
+    for name, data in out.items():
+        assert "ṁ".encode("utf-8") not in data, name
+        titles = [e.get("title") for e in etree.fromstring(data).iter("*")]
+        assert any(title and "ṃ" in title for title in titles), name
+
+
+def test_profile_change_rebuilds(corpus, tmp_path):
+    sutta.TipitikaTransformer(corpus, tmp_path).transform()
+    mtimes = {f: f.stat().st_mtime_ns for f in tmp_path.rglob("*.xml")}
+    sutta.TipitikaTransformer(corpus, tmp_path, normalize="canonical").transform()
+    for f, mtime in mtimes.items():
+        assert f.stat().st_mtime_ns != mtime
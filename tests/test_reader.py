@@ -0,0 +1,85 @@
+import shutil
+
+import pytest
+from lxml import etree
+
+import palipedia.transform.sutta as sutta
+from palipedia.transform.reader import CorpusReader
+
+__author__ = "Erwin Jansen"
+__copyright__ = "Erwin Jansen"
+__license__ = "Apache-2.0"
+
+
+@pytest.fixture(scope="module", params=[None, "chapters.arc"])
+def output(request, corpus, tmp_path_factory):
+    dest = tmp_path_factory.mktemp("reader")
+    sutta.TipitikaTransformer(
+        corpus, dest, incremental=False, archive=request.param
+    ).transform()
+    return dest
+
+
+def test_navigate(output):
+    with CorpusReader(output) as reader:
+        collection = reader.root[0]
+        assert collection.tag == "collection"
+        assert collection.parent is reader.root
+        assert len(reader.root) == len(list(reader.root))
+
+        chapters = list(reader.chapters())
+        assert [c.href for c in chapters] == reader.source.names()
+        chapter = chapters[0]
+        assert chapter.tag == "chapter"
+        assert chapter.children == []
+        assert chapter.title
+        assert reader.find(*chapter.path()).href == chapter.href
+
+        with pytest.raises(KeyError):
+            reader.find("no such title")
+        with pytest.raises(ValueError):
+            collection.load()
+
+
+def test_titles_come_from_the_toc(output, monkeypatch):
+    with CorpusReader(output) as reader:
+
+        def fail(name, *args):
+            raise AssertionError(f"{name} was opened")
+
+        for method in ("attributes", "parse", "read"):
+            monkeypatch.setattr(reader.source, method, fail)
+        # Finding the second chapter of a book compares the title of the first.
+        chapter = list(reader.chapters())[1]
+        assert chapter.title
+        assert reader.find(*chapter.path()) is chapter
+
+
+def test_titles_of_older_tocs(output, tmp_path):
+    # Tocs written before the includes held titles read them from the chapters.
+    dest = tmp_path / "old"
+    shutil.copytree(output, dest)
+    toc = etree.parse(str(dest / "toc.xml"))
+    titles = {}
+    for include in toc.iter("{http://www.w3.org/2001/XInclude}include"):
+        titles[include.get("href")] = include.attrib.pop("title")
+    toc.write(str(dest / "toc.xml"))
+    with CorpusReader(dest) as reader:
+        assert {c.href: c.title for c in reader.chapters()} == titles
+
+
+def test_load_is_cached(output):
+    with CorpusReader(output, cache_size=2) as reader:
+        first, second, third = list(reader.chapters())[:3]
+        tree = first.load()
+        assert tree.tag == "chapter"
+        assert tree.get("title") == first.title
+        tree.clear()
+        assert len(first.load()) > 0
+        assert (reader.cache.hits, reader.cache.misses) == (1, 1)
+
+        second.load()
+        third.load()
+        assert len(reader.cache) == 2
+        first.load()
+        assert reader.cache.misses == 4
@@ -0,0 +1,126 @@
+import pytest
+from lxml import etree
+
+import palipedia.transform.sutta as sutta
+from palipedia.transform.references import (
+    ReferenceIndex,
+    chapter_keys,
+    citation_key,
+    elements,
+    reference_key,
+)
+
+__author__ = "Erwin Jansen"
+__copyright__ = "Erwin Jansen"
+__license__ = "Apache-2.0"
+
+CHAPTER = """<?xml version='1.0' encoding='UTF-8'?>
+<chapter title="Sutta &amp; &quot;x&quot;">
+  <!-- <p nr="9"/> -->
+  <section title="Kathā" nr="1">
+    <p nr="2-4">Evaṃ <b>me</b><pb n="1"/> sutaṃ</p>
+  </section>
+</chapter>
+""".encode("utf-8")
+
+
+def test_elements():
+    found = list(elements(CHAPTER))
+    assert [(tag, attrs) for tag, attrs, _, _ in found] == [
+        ("chapter", {"title": 'Sutta & "x"'}),
+        ("section", {"title": "Kathā", "nr": "1"}),
+        ("p", {"nr": "2-4"}),
+        ("b", {}),
+        ("pb", {"n": "1"}),
+    ]
+    _, _, start, end = found[2]
+    assert CHAPTER[start:end].decode("utf-8") == (
+        '<p nr="2-4">Evaṃ <b>me</b><pb n="1"/> sutaṃ</p>'
+    )
+    _, _, start, end = found[0]
+    assert CHAPTER[end:] == b"\n"
+
+
+NESTED = b"""<chapter title="Sutta">
+<section nr="1"><subsection nr="1"><p nr="1">a</p></subsection>
+<subsection nr="2"><p nr="2">b</p></subsection></section>
+<section nr="2"><subsection nr="1"><p nr="3">c</p></subsection></section>
+<subsection nr="1"><p nr="4">d</p></subsection>
+</chapter>"""
+
+
+def test_nested_keys():
+    found = {
+        key: NESTED[start:end]
+        for keys, _, start, end in chapter_keys("c.xml", NESTED)
+        for key in keys
+    }
+    assert found["c#section1.subsection1"].startswith(b'<subsection nr="1"><p nr="1">')
+    assert found["c#section1.subsection2"].startswith(b'<subsection nr="2"><p nr="2">')
+    assert found["c#section2.subsection1"].startswith(b'<subsection nr="1"><p nr="3">')
+    # A subsection that follows the sections is not in one.
+    assert found["c#subsection1"].startswith(b'<subsection nr="1"><p nr="4">')
+    assert found["c#section2"].startswith(b'<section nr="2">')
+    assert found["c#3"] == b'<p nr="3">c</p>'
+    assert reference_key("c", "1", "subsection", "section2") == "c#section2.subsection1"
+
+
+def test_citation_keys():
+    name = "Suttapiṭaka/Dīghanikāyo/Sīlakkhandhavagga/2.xml"
+    title = 'title="2. Sāmaññaphalasutta"'.encode("utf-8")
+    data = NESTED.replace(b'title="Sutta"', title)
+    found = {
+        key: data[start:end]
+        for keys, _, start, end in chapter_keys(name, data)
+        for key in keys
+    }
+    assert found["Dighanikayo/2"] == data
+    assert found["Dighanikayo/2#3"] == b'<p nr="3">c</p>'
+    assert found["Dighanikayo/2#section2.subsection1"].startswith(b"<subsection")
+    assert citation_key(name, "3-4. Vagga") == "Dighanikayo/3-4"
+    assert citation_key(name, "Vagga") is None
+    assert citation_key("2.xml", "2. Sutta") is None
+
+
+def _content(node):
+    return [(n.tag, dict(n.attrib), (n.text or "").strip()) for n in node.iter()]
+
+
+@pytest.mark.parametrize("archive", [None, "chapters.arc"])
+def test_references(corpus, tmp_path, archive):
+    dest = tmp_path / "out"
+    sutta.TipitikaTransformer(
+        corpus, dest, incremental=False, archive=archive, references=True
+    ).transform()
+    with ReferenceIndex(dest) as index:
+        assert len(index) > len(index.chapters)
+        name = index.chapters[0]
+        chapter = index.lookup(name)
+        assert (chapter.chapter, chapter.position, chapter.start) == (name, 0, 39)
+        # Titles are transliterated like the file names.
+        assert index.lookup(name.replace("Pitaka", "Piṭaka")[: -len(".xml")]) == chapter
+
+        tree = etree.fromstring(index.read(chapter))
+        nodes = list(tree.iter("*"))
+        for node in nodes:
+            if node.get("nr") and node.tag in ("p", "verse"):
+                ref = index.lookup(name, node.get("nr"))
+                if nodes[ref.position] is node:
+                    assert _content(index.element(ref)) == _content(node)
+        section = next(n for n in nodes if n.tag == "section" and n.get("nr"))
+        ref = index.lookup(name, section.get("nr"), tag="section")
+        assert nodes[ref.position] is section
+        assert reference_key(name, section.get("nr"), "section") in index
+
+        # The nikaya and number of the chapter cite it too.
+        nikaya = name.split("/")[-3]
+        title = etree.fromstring(index.read(chapter)).get("title")
+        number = title.split(".")[0]
+        assert index.lookup(f"{nikaya}/{number}") == chapter
+        node = next(n for n in nodes if n.tag == "p" and n.get("nr"))
+        assert index.lookup(f"{nikaya}/{number}", node.get("nr")) == index.lookup(
+            name, node.get("nr")
+        )
+
+        with pytest.raises(KeyError):
+            index.lookup(name, "100000")
@@ -0,0 +1,78 @@
+import pytest
+
+from palipedia.transform.search import SearchIndex, build_index
+
+__author__ = "Erwin Jansen"
+__copyright__ = "Erwin Jansen"
+__license__ = "Apache-2.0"
+
+CHAPTER = """<?xml version='1.0' encoding='UTF-8'?>
+<chapter title="Brahmajālasuttaṃ">
+  <p nr="1">Evaṃ me sutaṃ. Ekaṃ samayaṃ bhagavā</p>
+  <verse nr="2-4">Sammā sambuddho, evaṃ me.</verse>
+</chapter>
+"""
+
+TOC = """<?xml version='1.0' encoding='UTF-8'?>
+<root xmlns:xi="http://www.w3.org/2001/XInclude">
+  <book title="Dīghanikāya">
+    <xi:include href="a/1.xml"/>
+    <xi:include href="a/2.xml"/>
+  </book>
+</root>
+"""
+
+
+@pytest.fixture
+def index(tmp_path):
+    dest = tmp_path / "out"
+    (dest / "a").mkdir(parents=True)
+    (dest / "toc.xml").write_text(TOC, encoding="utf-8")
+    (dest / "a" / "1.xml").write_text(CHAPTER, encoding="utf-8")
+    (dest / "a" / "2.xml").write_text(
+        CHAPTER.replace("Sammā", "Samma"), encoding="utf-8"
+    )
+    assert build_index(dest, tmp_path / "index") == 4
+    return SearchIndex(tmp_path / "index")
+
+
+def test_term(index):
+    assert len(index) == 4
+    hits = index.term("EVAṂ")
+    assert [(h.chapter, h.nr, h.unit, h.position) for h in hits] == [
+        ("a/1.xml", (1, 1), 0, 0),
+        ("a/1.xml", (2, 4), 1, 2),
+        ("a/2.xml", (1, 1), 2, 0),
+        ("a/2.xml", (2, 4), 3, 2),
+    ]
+    assert [h.chapter for h in index.term("sammā")] == ["a/1.xml"]
+    assert index.term("nothing") == []
+
+
+def test_folded(index):
+    assert index.term("evam") == []
+    assert len(index.term("evam", fold=True)) == 4
+    assert [h.unit for h in index.term("samma", fold=True)] == [1, 3]
+
+
+def test_phrase(index):
+    assert [h.unit for h in index.phrase("evaṃ me")] == [0, 1, 2, 3]
+    assert [(h.unit, h.position) for h in index.phrase("me, sutaṃ!")] == [
+        (0, 1),
+        (2, 1),
+    ]
+    # Phrases do not cross paragraphs and verses.
+    assert index.phrase("bhagavā sammā") == []
+    assert index.phrase("me evaṃ") == []
+    assert [h.unit for h in index.phrase("samma sambuddho", fold=True)] == [1, 3]
+
+
+def test_prefix(index):
+    assert index.terms("sam") == ["samayaṃ", "sambuddho", "samma", "sammā"]
+    assert index.terms("samm", fold=True) == ["samma"]
+    assert [h.unit for h in index.prefix("samm")] == [1, 3]
+    assert [(h.unit, h.position) for h in index.prefix("s")][:3] == [
+        (0, 2),
+        (0, 4),
+        (1, 0),
+    ]
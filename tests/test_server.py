@@ -0,0 +1,162 @@
+import threading
+from http.client import HTTPConnection
+from urllib.parse import quote
+
+import pytest
+
+import palipedia.transform.sutta as sutta
+from palipedia.transform.flat import ChapterSource
+from palipedia.transform.server import ChapterService, ResponseCache, make_server
+
+__author__ = "Erwin Jansen"
+__copyright__ = "Erwin Jansen"
+__license__ = "Apache-2.0"
+
+
+@pytest.fixture(scope="module", params=[None, "chapters.arc"])
+def output(request, corpus, tmp_path_factory):
+    dest = tmp_path_factory.mktemp("server")
+    sutta.TipitikaTransformer(
+        corpus, dest, incremental=False, archive=request.param
+    ).transform()
+    return dest
+
+
+def test_chapters(output):
+    service = ChapterService(output)
+    with ChapterSource(output) as source:
+        name = source.names()[0]
+        chapter = source.read(name)
+
+    response = service.get("/toc.xml")
+    assert response.status == 200
+    assert response.body == (output / "toc.xml").read_bytes()
+
+    response = service.get("/" + quote(name))
+    assert response.status == 200
+    assert response.body == chapter
+    assert service.cache.misses == 2
+
+    assert service.get("/" + quote(name)).body == chapter
+    assert service.cache.hits == 1
+
+    assert service.get("/no-such-chapter.xml").status == 404
+    service.close()
+
+
+def test_slice(output):
+    service = ChapterService(output)
+    with ChapterSource(output) as source:
+        name = next(n for n in source.names() if b' nr="1"' in source.read(n))
+
+    response = service.get(f"/{quote(name)}?nr=1")
+    assert response.status == 200
+    assert response.body.startswith(b"<")
+    assert b' nr="1"' in response.body.split(b">", 1)[0]
+    assert service.get(f"/{quote(name)}?nr=999999").status == 404
+    service.close()
+
+
+def test_slice_nested(tmp_path):
+    (tmp_path / "toc.xml").write_text(
+        '<toc xmlns:xi="http://www.w3.org/2001/XInclude"><xi:include href="c.xml"/>'
+        "</toc>"
+    )
+    (tmp_path / "c.xml").write_text(
+        '<chapter><section nr="1"><subsection nr="1">a</subsection></section>'
+        '<section nr="2"><subsection nr="1">b</subsection></section></chapter>'
+    )
+    service = ChapterService(tmp_path)
+    query = "/c.xml?nr=1&tag=subsection&within=section2"
+    assert service.get(query).body == b'<subsection nr="1">b</subsection>'
+    query = "/c.xml?nr=1&tag=subsection&within=section1"
+    assert service.get(query).body == b'<subsection nr="1">a</subsection>'
+    assert service.get("/c.xml?nr=1&tag=subsection").status == 404
+    service.close()
+
+
+def test_conditional_get(output):
+    service = ChapterService(output)
+    etag = service.get("/toc.xml").etag
+    assert etag.startswith('"')
+
+    response = service.get("/toc.xml", etag)
+    assert response.status == 304
+    assert response.body == b""
+    assert service.get("/toc.xml", f'"other", W/{etag}').status == 304
+    assert service.get("/toc.xml", f'"other",{etag}').status == 304
+    assert service.get("/toc.xml", "*").status == 304
+    assert service.get("/toc.xml", '"other"').status == 200
+    service.close()
+
+
+def test_cache_is_bounded_and_single_flight():
+    cache = ResponseCache(2)
+    for key in "abc":
+        cache.get(key, lambda: key.encode())
+    assert len(cache) == 2
+    assert cache.misses == 3
+
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def build():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return b"slow"
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(cache.get("x", build)))
+    first.start()
+    started.wait()
+    others = [
+        threading.Thread(target=lambda: results.append(cache.get("x", build)))
+        for _ in range(4)
+    ]
+    for t in others:
+        t.start()
+    release.set()
+    for t in [first] + others:
+        t.join()
+    assert len(calls) == 1
+    assert len(set(results)) == 1 and results[0][0] == b"slow"
+
+
+def test_http(output):
+    server = make_server(output, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        connection = HTTPConnection(*server.server_address)
+        connection.request("GET", "/toc.xml")
+        response = connection.getresponse()
+        body = response.read()
+        assert response.status == 200
+        assert response.getheader("Content-Type").startswith("application/xml")
+        assert body == (output / "toc.xml").read_bytes()
+
+        etag = response.getheader("ETag")
+        connection.request("GET", "/toc.xml", headers={"If-None-Match": etag})
+        response = connection.getresponse()
+        assert response.status == 304
+        assert response.getheader("Content-Length") is None
+        assert response.getheader("Content-Type") is None
+        assert response.getheader("ETag") == etag
+        assert response.read() == b""
+
+        connection.request("GET", "/toc.xml", headers={"If-None-Match": "*"})
+        response = connection.getresponse()
+        assert response.status == 304
+        assert response.read() == b""
+
+        connection.request("HEAD", "/missing.xml")
+        response = connection.getresponse()
+        response.read()
+        assert response.status == 404
+        connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+        server.service.close()
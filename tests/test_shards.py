@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+import palipedia.transform.sutta as sutta
+from palipedia.transform import shards
+
+__author__ = "Erwin Jansen"
+__copyright__ = "Erwin Jansen"
+__license__ = "Apache-2.0"
+
+
+@pytest.fixture(scope="module")
+def tipitika(corpus, tmp_path_factory):
+    dest = tmp_path_factory.mktemp("tipitika")
+    sutta.TipitikaTransformer(corpus, dest).transform()
+    return dest
+
+
+@pytest.mark.parametrize("fmt", ["binary", "jsonl"])
+def test_export_shards(tipitika, tmp_path, fmt):
+    sizes = shards.export_shards(tipitika, tmp_path, 3, fmt)
+    assert max(sizes) - min(sizes) <= 1
+
+    index = json.loads((tmp_path / shards.INDEX).read_text())
+    assert index["format"] == fmt
+    examples = []
+    for i, shard in enumerate(index["shards"]):
+        data = [json.loads(d) for d in shards.read_shard(tmp_path / shard["name"], fmt)]
+        assert len(data) == shard["examples"] == sizes[i]
+        assert all(e["id"] % 3 == i for e in data)
+        examples.extend(data)
+    assert sorted(e["id"] for e in examples) == list(range(sum(sizes)))
+    example = examples[0]
+    assert example["text"]
+    assert len(example["ids"]) == len(example["titles"]) == len(shards.LEVELS)
+
+
+def test_export_shards_errors(tipitika, tmp_path):
+    with pytest.raises(ValueError):
+        shards.export_shards(tipitika, tmp_path, 0)
+    with pytest.raises(ValueError):
+        shards.export_shards(tipitika, tmp_path, 2, "csv")
+
+
+@pytest.fixture(scope="module")
+def sharded(tipitika, tmp_path_factory):
+    dest = tmp_path_factory.mktemp("shards")
+    shards.export_shards(tipitika, dest, 4)
+    return dest
+
+
+def ids(loader):
+    return [e["id"] for e in loader]
+
+
+def test_loader_order(sharded):
+    loader = shards.ShardLoader(sharded, seed=3, buffer_size=50)
+    order = ids(loader)
+    assert sorted(order) == list(range(len(loader)))
+    assert order != sorted(order)
+    assert ids(shards.ShardLoader(sharded, seed=3, buffer_size=50)) == order
+    assert ids(shards.ShardLoader(sharded, seed=4, buffer_size=50)) != order
+    assert ids(shards.ShardLoader(sharded, seed=3, epoch=1, buffer_size=50)) != order
+
+
+def test_loader_resume(sharded):
+    order = ids(shards.ShardLoader(sharded, seed=3, buffer_size=50, prefetch=3))
+    loader = shards.ShardLoader(sharded, seed=3, buffer_size=50, prefetch=3)
+    examples = iter(loader)
+    first = [next(examples)["id"] for _ in range(100)]
+    resumed = shards.ShardLoader(sharded, buffer_size=50, prefetch=3, **loader.state())
+    assert first + ids(resumed) == order
+
+
+def test_loader_workers(sharded):
+    seen = []
+    for worker in range(2):
+        own = shards.shards_for(worker, 2, 4)
+        seen.extend(ids(shards.ShardLoader(sharded, shards=own)))
+    assert sorted(seen) == list(range(len(shards.ShardLoader(sharded))))
+
+
+def test_bench_loader(benchmark, sharded):
+    benchmark.group = "shards"
+    benchmark(lambda: ids(shards.ShardLoader(sharded, buffer_size=1000)))
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+from lxml import etree
+
+import palipedia.transform.sutta as sutta
+from palipedia.transform.stats import NullStats, RunStats
+
+__author__ = "Erwin Jansen"
+__copyright__ = "Erwin Jansen"
+__license__ = "Apache-2.0"
+
+
+def test_stages_and_chapters():
+    stats = RunStats(slowest=1)
+    with stats.chapter("a.xml"):
+        with stats.stage("parse") as stage:
+            stage.elements(etree.fromstring("<a><b/><c/></a>"))
+    with stats.chapter("b.xml"):
+        with stats.stage("parse"):
+            pass
+    stats.count("chapters_written", 2)
+
+    report = stats.report()
+    assert report["stages"]["parse"]["calls"] == 2
+    assert report["stages"]["parse"]["elements"] == 3
+    assert report["counters"] == {"chapters_written": 2}
+    assert [c["name"] for c in report["chapters"]] == ["a.xml", "b.xml"]
+    assert report["chapters"][0]["elements"] == 3
+    assert len(report["slowest"]) == 1
+
+
+def test_take_and_merge():
+    worker = RunStats()
+    with worker.chapter("a.xml"):
+        with worker.stage("xslt"):
+            pass
+    worker.count("chapters_written")
+
+    stats = RunStats()
+    stats.merge(worker.take())
+    stats.merge(NullStats().take())
+    report = stats.report()
+    assert report["stages"]["xslt"]["calls"] == 1
+    assert report["counters"] == {"chapters_written": 1}
+    assert worker.report()["chapters"] == []
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{}, {"workers": 2}, {"workers": 2, "pool": "thread"}, {"streaming": True}],
+    ids=["serial", "processes", "threads", "streaming"],
+)
+def test_transform_report(corpus, tmp_path, options):
+    stats = RunStats()
+    dest = tmp_path / "out"
+    sutta.TipitikaTransformer(
+        corpus, dest, incremental=False, stats=stats, **options
+    ).transform()
+    stats.write(tmp_path / "report.json")
+    report = json.loads((tmp_path / "report.json").read_text())
+
+    chapters = [f for f in dest.rglob("*.xml") if f.name != "toc.xml"]
+    written = sum(f.stat().st_size for f in dest.rglob("*.xml"))
+    assert report["counters"]["chapters_written"] == len(chapters)
+    assert report["counters"]["bytes_written"] == written
+    assert report["counters"]["bytes_read"] > 0
+    assert len(report["chapters"]) == len(chapters)
+    assert report["stages"]["write"]["calls"] >= 1
+    if not options.get("streaming"):
+        for stage in ["parse", "xslt", "cleanup"]:
+            assert report["stages"][stage]["elements"] > 0
+
+
+def test_skipped_chapters(corpus, tmp_path):
+    sutta.TipitikaTransformer(corpus, tmp_path).transform()
+    stats = RunStats()
+    sutta.TipitikaTransformer(corpus, tmp_path, stats=stats).transform()
+    counters = stats.report()["counters"]
+    assert "chapters_written" not in counters
+    assert counters["chapters_skipped"] > 0
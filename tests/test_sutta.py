@@ -0,0 +1,267 @@
+import copy
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+from conftest import read_tree
+from lxml import etree
+
+import palipedia.transform.sutta as sutta
+import palipedia.transform.xml as xml
+from palipedia.synthetic import CorpusGenerator
+from palipedia.transform.build import BuildManifest
+
+__author__ = "Erwin Jansen"
+__copyright__ = "Erwin Jansen"
+__license__ = "Apache-2.0"
+
+
+def test_transform_writes_chapters(serial):
+    assert "toc.xml" in serial
+    assert len(serial) > 1
+    toc = serial["toc.xml"].decode("utf-8")
+    for name in serial:
+        if name != "toc.xml":
+            assert f'href="{name}"' in toc
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"workers": 2},
+        {"workers": 2, "pool": "thread"},
+        {"streaming": True},
+        {"cache_size": 0},
+        {"writers": 2},
+        {"writers": 2, "workers": 2, "pool": "thread"},
+    ],
+    ids=["processes", "threads", "streaming", "nocache", "writers", "threadwriters"],
+)
+def test_modes_are_identical(corpus, tmp_path, serial, options):
+    sutta.TipitikaTransformer(
+        corpus, tmp_path, incremental=False, **options
+    ).transform()
+    assert read_tree(tmp_path) == serial
+
+
+def test_incremental_rebuild(corpus, tmp_path, serial):
+    transformer = sutta.TipitikaTransformer(corpus, tmp_path)
+    transformer.transform()
+    assert read_tree(tmp_path) == serial
+    assert (tmp_path / BuildManifest.FILENAME).exists()
+
+    # Nothing changed, so no chapter is written again.
+    mtimes = {f: f.stat().st_mtime_ns for f in tmp_path.rglob("*.xml")}
+    sutta.TipitikaTransformer(corpus, tmp_path).transform()
+    assert read_tree(tmp_path) == serial
+    for f, mtime in mtimes.items():
+        if f.name != "toc.xml":
+            assert f.stat().st_mtime_ns == mtime
+
+
+def test_pipeline_change_rebuilds(corpus, tmp_path, monkeypatch):
+    sutta.TipitikaTransformer(corpus, tmp_path).transform()
+    mtimes = {f: f.stat().st_mtime_ns for f in tmp_path.rglob("*.xml")}
+    monkeypatch.setattr(sutta, "PIPELINE_VERSION", sutta.PIPELINE_VERSION + 1)
+    sutta.TipitikaTransformer(corpus, tmp_path).transform()
+    for f, mtime in mtimes.items():
+        assert f.stat().st_mtime_ns != mtime
+
+
+GOLDEN = Path(__file__).parent / "data" / "golden"
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {},
+        {"workers": 2},
+        {"workers": 2, "pool": "thread"},
+        {"streaming": True},
+        {"cache_size": 0},
+        {"writers": 2},
+    ],
+    ids=["serial", "processes", "threads", "streaming", "nocache", "writers"],
+)
+def test_golden_output(tmp_path, options):
+    # The output of the transformer before it was parallelized, cached and streamed.
+    toc = CorpusGenerator(
+        tmp_path / "corpus",
+        pitakas=1,
+        nikayas=2,
+        books=1,
+        chapters=2,
+        sections=2,
+        paragraphs=2,
+    ).generate()
+    sutta.TipitikaTransformer(
+        toc, tmp_path / "out", incremental=False, **options
+    ).transform()
+    assert read_tree(tmp_path / "out") == read_tree(GOLDEN)
+
+
+def _mtimes(dest):
+    return {f: f.stat().st_mtime_ns for f in dest.rglob("*.xml") if f.name != "toc.xml"}
+
+
+def test_changed_source_rebuilds_its_chapters(corpus, tmp_path):
+    shutil.copytree(corpus.parent, tmp_path / "src")
+    toc = tmp_path / "src" / corpus.name
+    dest = tmp_path / "out"
+    sutta.TipitikaTransformer(toc, dest).transform()
+    before = read_tree(dest)
+    mtimes = _mtimes(dest)
+
+    source = sorted((tmp_path / "src" / "cscd").glob("*.xml"))[0]
+    source.write_text(source.read_text("utf-8").replace("ekaṃ", "dve"), "utf-8")
+    sutta.TipitikaTransformer(toc, dest).transform()
+    after = read_tree(dest)
+    changed = {
+        str(f.relative_to(dest)) for f, m in _mtimes(dest).items() if m != mtimes[f]
+    }
+    assert changed
+    assert len(changed) < len(mtimes)
+    assert changed == {n for n in after if n != "toc.xml" and after[n] != before[n]}
+
+
+def test_missing_output_is_rebuilt(corpus, tmp_path, serial):
+    sutta.TipitikaTransformer(corpus, tmp_path).transform()
+    mtimes = _mtimes(tmp_path)
+    removed = sorted(mtimes)[0]
+    removed.unlink()
+    sutta.TipitikaTransformer(corpus, tmp_path).transform()
+    assert read_tree(tmp_path) == serial
+    for f, mtime in mtimes.items():
+        if f != removed:
+            assert f.stat().st_mtime_ns == mtime
+
+
+def test_unreadable_manifest_rebuilds(corpus, tmp_path, serial):
+    sutta.TipitikaTransformer(corpus, tmp_path).transform()
+    mtimes = _mtimes(tmp_path)
+    (tmp_path / BuildManifest.FILENAME).write_text("{not json")
+    sutta.TipitikaTransformer(corpus, tmp_path).transform()
+    assert read_tree(tmp_path) == serial
+    for f, mtime in mtimes.items():
+        assert f.stat().st_mtime_ns != mtime
+
+
+def test_working_directory_is_not_changed(corpus, tmp_path, serial, monkeypatch):
+    # Source paths are resolved against the toc, not against the working directory.
+    monkeypatch.chdir(corpus.parent.parent)
+    toc = corpus.relative_to(corpus.parent.parent)
+    sutta.TipitikaTransformer(toc, tmp_path, incremental=False).transform()
+    assert os.getcwd() == str(corpus.parent.parent)
+    assert read_tree(tmp_path) == serial
+
+
+def test_src_before_action(corpus, tmp_path, serial):
+    # A toc entry with both a src and an action is indexed, like the baseline did.
+    source = tmp_path / "source"
+    shutil.copytree(corpus.parent, source)
+    toc = source / corpus.name
+    action = next(source.glob("cscd/*.xml")).relative_to(source)
+    text = toc.read_text("utf-8")
+    toc.write_text(text.replace(" src=", f' action="{action}" src=', 1), "utf-8")
+    sutta.TipitikaTransformer(toc, tmp_path / "out", incremental=False).transform()
+    assert read_tree(tmp_path / "out") == serial
+
+
+def test_concurrent_transformers(corpus, tmp_path, serial):
+    dests = [tmp_path / str(i) for i in range(3)]
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        list(
+            pool.map(
+                lambda dest: sutta.TipitikaTransformer(
+                    corpus, dest, incremental=False
+                ).transform(),
+                dests,
+            )
+        )
+    for dest in dests:
+        assert read_tree(dest) == serial
+
+
+def test_unknown_pool(corpus, tmp_path):
+    with pytest.raises(ValueError):
+        sutta.TipitikaTransformer(corpus, tmp_path, pool="fibers")
+
+
+@pytest.fixture(scope="module")
+def scripts(corpus, tmp_path_factory):
+    """The corpus in two scripts with different titles, each transformed on its own."""
+    root = tmp_path_factory.mktemp("scripts")
+    shutil.copytree(corpus.parent, root / "romn")
+    # Another script, in which the titles transliterate to different file names.
+    for src in sorted(corpus.parent.rglob("*.xml")):
+        dest = root / "deva" / src.relative_to(corpus.parent)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        dest.write_text(src.read_text("utf-8").replace("ā", "aa"), "utf-8")
+    separate = {}
+    for script in ("romn", "deva"):
+        dest = tmp_path_factory.mktemp(script)
+        toc = root / script / corpus.name
+        sutta.TipitikaTransformer(toc, dest, incremental=False).transform()
+        separate[script] = read_tree(dest)
+    return root / "romn" / corpus.name, separate
+
+
+def _chapters(tree):
+    return [data for name, data in tree.items() if name != "toc.xml"]
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{}, {"workers": 2}, {"workers": 2, "pool": "thread"}],
+    ids=["serial", "processes", "threads"],
+)
+def test_scripts(scripts, tmp_path, options):
+    toc, separate = scripts
+    sutta.TipitikaTransformer(
+        toc, tmp_path, incremental=False, scripts=["deva"], **options
+    ).transform()
+    romn = read_tree(tmp_path / "romn")
+    deva = read_tree(tmp_path / "deva")
+    assert romn == separate["romn"]
+    # The chapters of every script have the same names.
+    assert list(deva) == list(romn)
+    assert _chapters(deva) == _chapters(separate["deva"])
+    assert deva["toc.xml"] != romn["toc.xml"]
+    assert "aa" in deva["toc.xml"].decode("utf-8")
+
+
+def test_scripts_must_match(scripts, tmp_path):
+    toc, _ = scripts
+    other = tmp_path / "src" / "deva" / toc.name
+    other.parent.mkdir(parents=True)
+    other.write_text("<tree><tree/></tree>", "utf-8")
+    shutil.copytree(toc.parent, tmp_path / "src" / "romn")
+    transformer = sutta.TipitikaTransformer(
+        tmp_path / "src" / "romn" / toc.name, tmp_path / "out", scripts=["deva"]
+    )
+    with pytest.raises(ValueError):
+        transformer.transform()
+
+
+def _legacy_cleanup(transformer, root):
+    """The cleanup as a sequence of passes over the whole tree, before it was fused."""
+    xml.remove(root, ["chapter", "book", "nikaya"])
+    for child in ["chapter", "section", "subsection"]:
+        xml.siblings_to_child(root, child)
+    transformer._merge_verses(root)
+    transformer._lift_numbers(root)
+    xml.trim_text(root)
+    transformer._extract_nr_from_title(root)
+    return root
+
+
+def test_cleanup_matches_passes(corpus, tmp_path):
+    transformer = sutta.TipitikaTransformer(corpus, tmp_path)
+    chapters = sorted((corpus.parent / "cscd").glob("*.xml"))
+    assert chapters
+    for fname in chapters:
+        root = transformer.xlst(xml.parse(fname)).getroot()
+        expected = _legacy_cleanup(transformer, copy.deepcopy(root))
+        assert etree.tostring(transformer._cleanup(root)) == etree.tostring(expected)
@@ -0,0 +1,107 @@
+import unicodedata
+from collections import Counter
+
+import pytest
+
+import palipedia.transform.sutta as sutta
+import palipedia.transform.tokenizer as tokenizer
+from palipedia.transform.tokenizer import WORD_START, Counts, Tokenizer
+
+__author__ = "Erwin Jansen"
+__copyright__ = "Erwin Jansen"
+__license__ = "Apache-2.0"
+
+WORDS = Counter(
+    {
+        "evaṃ": 9,
+        "sutaṃ": 7,
+        "saṅgho": 5,
+        "ñāṇaṃ": 5,
+        "paṭipadā": 4,
+        "ḍaṃsa": 3,
+        "paññā": 3,
+        "kāḷaṃ": 2,
+        "bhikkhū": 2,
+    }
+)
+
+
+def naive_merges(word_counts, vocab_size, min_count=2):
+    """Learns the merges by recounting all pairs after every merge."""
+    seqs = {}
+    for word, count in word_counts.items():
+        chars = tokenizer.characters(word)
+        seqs[word] = ([WORD_START + chars[0]] + chars[1:], count)
+    alphabet = {c for word in word_counts for c in tokenizer.characters(word)}
+    vocab = alphabet | {WORD_START + c for c in alphabet}
+    merges = []
+    while len(vocab) + 1 < vocab_size:
+        pairs = Counter()
+        for seq, count in seqs.values():
+            for pair in zip(seq, seq[1:]):
+                pairs[pair] += count
+        if not pairs:
+            break
+        best = min(pairs, key=lambda p: (-pairs[p], p))
+        if pairs[best] < min_count:
+            break
+        merges.append(best)
+        vocab.add("".join(best))
+        for word, (seq, count) in seqs.items():
+            seqs[word] = (tokenizer._merge(seq, *best, "".join(best)), count)
+    return merges
+
+
+def test_words_keep_diacritics():
+    decomposed = unicodedata.normalize("NFD", "Evaṃ me SUTAṂ, ñāṇa-dassanaṃ.")
+    expected = ["evaṃ", "me", "sutaṃ", "ñāṇa", "dassanaṃ"]
+    assert tokenizer.words(decomposed) == expected
+    assert tokenizer.characters("mạ̄") == ["m", "ạ̄"]
+
+
+def test_counts_merge():
+    a, b = Counts(2), Counts(2)
+    a.update("evaṃ me")
+    b.update("me")
+    a.merge(b)
+    assert a.words == Counter({"me": 2, "evaṃ": 1})
+    assert a.ngrams["<m"] == 2
+    assert a.ngrams["aṃ"] == 1
+    assert a.ngrams["ṃ>"] == 1
+
+
+@pytest.mark.parametrize("vocab_size", [20, 60, 80, 200])
+def test_learn_merges_matches_naive(vocab_size):
+    vocab, merges = tokenizer.learn_merges(WORDS, vocab_size)
+    assert merges == naive_merges(WORDS, vocab_size)
+    assert len(vocab) == len(set(vocab))
+    assert vocab[0] == tokenizer.UNK
+
+
+def test_encode_decode(tmp_path):
+    tok = Tokenizer.train(WORDS, 80)
+    text = "Evaṃ bhikkhū, sutaṃ saṅgho!"
+    ids = tok.encode(text)
+    assert tok.decode(ids) == "evaṃ bhikkhū sutaṃ saṅgho"
+    assert tok.encode_batch([text, "paññā"]) == [ids, tok.encode("paññā")]
+    assert all(tok.vocab[i] != "ṃ" for i in tok.encode("evaṃ sutaṃ"))
+    assert tok.encode("x") == [tok.ids[tokenizer.UNK]]
+
+    tok.save(tmp_path / "tok.json")
+    assert Tokenizer.load(tmp_path / "tok.json").encode(text) == ids
+
+
+def test_count_chapters(corpus, tmp_path):
+    sutta.TipitikaTransformer(corpus, tmp_path).transform()
+    counts = tokenizer.count_chapters(tmp_path)
+    assert counts.words["evaṃ"] > 0
+    parallel = tokenizer.count_chapters(tmp_path, workers=2)
+    assert parallel.words == counts.words
+    assert parallel.ngrams == counts.ngrams
+
+
+def test_bench_encode_batch(benchmark):
+    tok = Tokenizer.train(WORDS, 80)
+    texts = [" ".join(WORDS.elements())] * 100
+    benchmark.group = "tokenizer"
+    benchmark(tok.encode_batch, texts)
@@ -0,0 +1,57 @@
+import pytest
+from lxml import etree
+
+import palipedia.transform.stream as stream
+import palipedia.transform.xml as xml
+from palipedia.transform.writer import AsyncWriter
+
+__author__ = "Erwin Jansen"
+__copyright__ = "Erwin Jansen"
+__license__ = "Apache-2.0"
+
+
+def test_serialize_matches_write_xml(tmp_path):
+    tree = etree.fromstring('<chapter title="Ā"><p nr="1">evaṃ</p><p/></chapter>')
+    xml.write_xml(str(tmp_path / "a.xml"), tree)
+    assert (tmp_path / "a.xml").read_bytes() == xml.serialize(tree)
+    assert list(tmp_path.iterdir()) == [tmp_path / "a.xml"]
+
+
+def test_writes_in_order(tmp_path):
+    with AsyncWriter(threads=3, queue_size=1) as writer:
+        for i in range(20):
+            writer.write(tmp_path / "sub" / f"{i % 4}.xml", str(i).encode())
+    assert sorted(f.name for f in (tmp_path / "sub").iterdir()) == [
+        "0.xml",
+        "1.xml",
+        "2.xml",
+        "3.xml",
+    ]
+    for i in range(4):
+        assert (tmp_path / "sub" / f"{i}.xml").read_bytes() == str(16 + i).encode()
+
+
+def test_error_is_raised(tmp_path):
+    (tmp_path / "file").write_text("")
+    writer = AsyncWriter(threads=1)
+    writer.write(tmp_path / "file" / "a.xml", b"a")
+    with pytest.raises(OSError):
+        writer.close()
+    with pytest.raises(OSError):
+        writer.write(tmp_path / "b.xml", b"b")
+
+
+def test_write_after_close(tmp_path):
+    writer = AsyncWriter(threads=1)
+    writer.close()
+    with pytest.raises(RuntimeError):
+        writer.write(tmp_path / "a.xml", b"a")
+
+
+def test_aborted_chapter_leaves_no_file(tmp_path):
+    dest = tmp_path / "a.xml"
+    with pytest.raises(ValueError):
+        with stream.ChapterWriter(str(dest), "a") as writer:
+            writer.write(etree.Element("p"))
+            raise ValueError()
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,70 @@
+import copy
+
+import pytest
+from lxml import etree
+
+import palipedia.transform.xml as xml
+
+__author__ = "Erwin Jansen"
+__copyright__ = "Erwin Jansen"
+__license__ = "Apache-2.0"
+
+# A chapter as produced by cleanup.xsl, before any cleanup.
+CHAPTER = (
+    "<doc>"
+    + '<nikaya title="Dīghanikāyo"/><book/><chapter title="1. Brahmajālasuttaṃ"/>'
+    + "".join(
+        f'<section title="{s}. Kathā"/>'
+        + "".join(
+            f'<subsection title="Sub {u}"/>'
+            + f'<p><number nr="{s}{u}"/> Evaṃ me sutaṃ <b>ekaṃ</b> samayaṃ </p>'
+            + "<verse>a,</verse><verse>b.</verse><x/><x/>"
+            for u in range(5)
+        )
+        for s in range(10)
+    )
+    + "</doc>"
+)
+
+RULES = [
+    ("remove", ["chapter", "book", "nikaya"]),
+    ("siblings_to_child", "section"),
+    ("siblings_to_child", "subsection"),
+    ("combine_siblings", "verse"),
+    ("remove_empty", ["x"]),
+    ("lift_up", "b"),
+    ("rename", "p", "para"),
+    ("neighbor_to_child", ["number"]),
+    ("remove_query", "//x"),
+    ("trim_text",),
+]
+
+
+def apply_helpers(tree):
+    """Applies RULES by calling the xml helpers directly."""
+    for name, *args in RULES:
+        getattr(xml, name)(tree, *args)
+    return tree
+
+
+@pytest.fixture
+def chapter():
+    return etree.fromstring(CHAPTER)
+
+
+def test_compiled_xpath():
+    assert xml.compiled_xpath("//p") is xml.compiled_xpath("//p")
+    # Queries passed in by callers cannot grow the cache without bound.
+    assert xml.compiled_xpath.cache_info().maxsize == 256
+
+
+def test_bench_helpers(benchmark, chapter):
+    benchmark.group = "rules"
+    benchmark(lambda: apply_helpers(copy.deepcopy(chapter)))
+
+
+def test_bench_string_xpath(benchmark, chapter, monkeypatch):
+    """The helpers as they used to be, compiling every query on every call."""
+    benchmark.group = "rules"
+    monkeypatch.setattr(xml, "compiled_xpath", etree.XPath)
+    benchmark(lambda: apply_helpers(copy.deepcopy(chapter)))